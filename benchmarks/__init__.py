@@ -0,0 +1,3 @@
+"""
+Benchmark harness for the simulation hot paths, see benchmarks/__main__.py
+"""
@@ -0,0 +1,48 @@
+"""
+python -m benchmarks [--profile quick|full] [--case NAME ...] [--save results.json] [--baseline baseline.json]
+
+Exits with status 1 if any point regressed against the baseline.
+"""
+import argparse
+import sys
+import pandas as pd
+from benchmarks import harness
+from benchmarks.cases import CASES
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Benchmark the simulation hot paths.")
+    parser.add_argument('--profile', default='quick', choices=['quick', 'full'], help="parameter grid to run")
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help="only these cases (repeatable)")
+    parser.add_argument('--repeats', type=int, default=3, help="timed runs per point")
+    parser.add_argument('--no-isolate', action='store_true', help="run every point in this process")
+    parser.add_argument('--save', help="write the results to this JSON file, e.g. to use as a baseline")
+    parser.add_argument('--baseline', help="baseline JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="relative growth that counts as a regression")
+    args = parser.parse_args(argv)
+
+    def progress(result):
+        rss = result['rss_increase_mb']
+        print(f"{result['key']:<70} {result['time_min_s']:9.4f} s  "
+              f"rss +{'?' if rss is None else f'{rss:.1f}'} MB  alloc {result['alloc_peak_mb']:.1f} MB", file=sys.stderr)
+
+    cases = [CASES[name] for name in (args.case or CASES)]
+    results = harness.run(cases, args.profile, args.repeats, isolate=not args.no_isolate, progress=progress)
+    if args.save:
+        harness.save(results, args.save, args.profile)
+
+    if args.baseline:
+        comparison = harness.compare(results, harness.load(args.baseline), args.tolerance)
+        if comparison.empty:
+            print("no points in common with the baseline", file=sys.stderr)
+            return 0
+        columns = ['key'] + [column for column in comparison if column.endswith('_ratio')] + ['regressed']
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(comparison[columns].to_string(index=False, float_format='{:.2f}'.format))
+        regressions = comparison[comparison['regressed']]
+        if len(regressions):
+            print(f"{len(regressions)} of {len(comparison)} points regressed", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Benchmark cases: the generation, aggregation and test hot paths behind the Streamlit pages.
+
+'quick' grids finish in a minute or two and are meant to be run before and after every change;
+'full' grids go up to 10M users and a year of traffic.
+"""
+from datetime import datetime, timedelta
+import helperfunctions.data_gen_funcs as gen_funcs
+import helperfunctions.statistical_tests as st_funcs
+from helperfunctions.assignment import Experiment
+from helperfunctions.users import Users
+from helperfunctions.activities import Activities
+from benchmarks.harness import Case
+
+START_DATE = datetime(2024, 1, 1)
+SEED = 0
+
+def end_date(days):
+    return START_DATE + timedelta(days=days - 1)
+
+def dau_fits(num_users, dau, **params):
+    return dau <= num_users
+
+def setup_create_user_dataset(num_users):
+    return num_users
+
+def run_create_user_dataset(num_users):
+    return gen_funcs.create_user_dataset(num_users, seed=SEED)
+
+def setup_generate_main_dataframe(num_users, days, dau):
+    return gen_funcs.create_user_dataset(num_users, seed=SEED), days, dau
+
+def run_generate_main_dataframe(inputs):
+    users, days, dau = inputs
+    return gen_funcs.generate_main_dataframe(START_DATE, end_date(days), users, min_per_day=dau, seed=SEED)
+
+def setup_start_test(num_users, days):
+    return num_users, days
+
+def run_start_test(inputs):
+    num_users, days = inputs
+    return gen_funcs.start_test(days, 0.1, num_users=num_users, seed=SEED)
+
+def setup_experiment(num_users, days, dau):
+    users = gen_funcs.create_user_dataset(num_users, seed=SEED)
+    data = gen_funcs.generate_experiment_dataframe(START_DATE, end_date(days), users, Experiment('benchmark', salt=SEED),
+                                                   {'control': 2, 'treatment': 2.2}, min_per_day=dau, seed=SEED)
+    return data[data['variant'] == 'control'], data[data['variant'] == 'treatment']
+
+def run_msprt_ci(inputs):
+    control, treatment = inputs
+    return st_funcs.msprt_ci(control, treatment)
+
+def run_welchtest(inputs):
+    control, treatment = inputs
+    return st_funcs.welchtest(control, treatment)
+
+def setup_users(num_users):
+    return num_users
+
+def run_users(num_users):
+    return Users(num_users, seed=SEED)
+
+def setup_activities(num_users, days):
+    return Users(num_users, seed=SEED), days
+
+def run_activities(inputs):
+    users, days = inputs
+    return Activities(users, START_DATE.strftime('%Y-%m-%d'), end_date(days).strftime('%Y-%m-%d'), seed=SEED)
+
+CASES = {case.name: case for case in [
+    Case('create_user_dataset', setup_create_user_dataset, run_create_user_dataset, {
+        'quick': {'num_users': [10**4, 10**6]},
+        'full': {'num_users': [10**4, 10**5, 10**6, 10**7]},
+    }),
+    Case('generate_main_dataframe', setup_generate_main_dataframe, run_generate_main_dataframe, {
+        'quick': {'num_users': [10**5], 'days': [7, 365], 'dau': [100, 10**4]},
+        'full': {'num_users': [10**4, 10**5, 10**6, 10**7], 'days': [7, 90, 365], 'dau': [100, 10**4, 10**6]},
+    }, valid=dau_fits),
+    Case('start_test', setup_start_test, run_start_test, {
+        'quick': {'num_users': [10**5], 'days': [7, 30]},
+        'full': {'num_users': [10**4, 10**5, 10**6, 10**7], 'days': [7, 30, 90]},
+    }),
+    Case('msprt_ci', setup_experiment, run_msprt_ci, {
+        'quick': {'num_users': [10**5], 'days': [30], 'dau': [10**3, 10**5]},
+        'full': {'num_users': [10**4, 10**6, 10**7], 'days': [7, 90, 365], 'dau': [100, 10**4, 10**6]},
+    }, valid=dau_fits),
+    Case('welchtest', setup_experiment, run_welchtest, {
+        'quick': {'num_users': [10**5], 'days': [30], 'dau': [10**3, 10**5]},
+        'full': {'num_users': [10**4, 10**6, 10**7], 'days': [7, 90, 365], 'dau': [100, 10**4, 10**6]},
+    }, valid=dau_fits),
+    Case('Users', setup_users, run_users, {
+        'quick': {'num_users': [10**4]},
+        'full': {'num_users': [10**4, 10**5, 10**6]},
+    }),
+    Case('Activities', setup_activities, run_activities, {
+        'quick': {'num_users': [10**4], 'days': [30]},
+        'full': {'num_users': [10**4, 10**5, 10**6], 'days': [7, 90, 365]},
+    }),
+]}
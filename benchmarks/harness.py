@@ -0,0 +1,214 @@
+"""
+Measurement, baselines and regression checks for the benchmark cases in benchmarks/cases.py
+"""
+import gc
+import itertools
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+class Case:
+    """
+    A benchmarked hot path.
+
+    setup(**params) builds the inputs (not measured) and run(inputs) is the measured call. grids holds one
+    parameter grid per profile, e.g. {'quick': {'num_users': [10**4]}, 'full': {'num_users': [10**4, 10**7]}};
+    every combination of a grid that passes valid(**params) is one benchmark point.
+    """
+
+    def __init__(self, name, setup, run, grids, valid=None):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.grids = grids
+        self.valid = valid
+
+    def __repr__(self):
+        return f"Case({self.name})"
+
+    def points(self, profile):
+        grid = self.grids.get(profile, {})
+        for values in itertools.product(*grid.values()):
+            params = dict(zip(grid, values))
+            if self.valid is None or self.valid(**params):
+                yield params
+
+def point_key(case, params):
+    return case + '[' + ','.join(f'{name}={value}' for name, value in params.items()) + ']'
+
+def read_status(field):
+    """
+    Field of /proc/self/status in MB (e.g. VmRSS, VmHWM), None where /proc is not available
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS (VmHWM) of this process to its current RSS; False where that is not supported
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    peak = read_status('VmHWM')
+    if peak is None:
+        # ru_maxrss is in KB on Linux, in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    return peak
+
+def measure(case, params, repeats=3):
+    """
+    Measure one benchmark point in this process.
+
+    Runs the case repeats times for wall time and peak RSS, then once more under tracemalloc for the peak of
+    traced allocations (tracemalloc slows the run down, so it is never timed).
+
+    Returns:
+    - result (dict): case, params, key, wall time (min / median / all, s), peak RSS and its increase over
+      the RSS after setup (MB), peak traced allocations (MB) and the number of allocated blocks left alive
+    """
+    inputs = case.setup(**params)
+    gc.collect()
+    exact_peak = reset_peak_rss()
+    rss_before = read_status('VmRSS')
+
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        output = case.run(inputs)
+        times.append(time.perf_counter() - started)
+        del output
+    peak = peak_rss()
+
+    gc.collect()
+    tracemalloc.start()
+    output = case.run(inputs)
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    tracemalloc.stop()
+    del output
+
+    return {
+        'case': case.name,
+        'params': params,
+        'key': point_key(case.name, params),
+        'time_min_s': min(times),
+        'time_median_s': statistics.median(times),
+        'times_s': times,
+        'peak_rss_mb': peak,
+        'rss_increase_mb': peak - rss_before if exact_peak and rss_before is not None else None,
+        'alloc_peak_mb': alloc_peak / 2**20,
+        'alloc_blocks': blocks,
+    }
+
+def measure_by_name(case_name, params, repeats):
+    from benchmarks.cases import CASES
+    return measure(CASES[case_name], params, repeats)
+
+def run(cases, profile='quick', repeats=3, isolate=True, progress=None):
+    """
+    Measure every point of every case.
+
+    With isolate=True, each point runs in a fresh spawned process, so peak RSS is not inflated by earlier
+    points and nothing (caches, allocator pools) carries over between them.
+
+    Parameters:
+    - cases (list of Case): cases to run.
+    - profile (str): grid profile, e.g. 'quick' or 'full'.
+    - repeats (int): timed runs per point.
+    - isolate (bool): one process per point.
+    - progress (callable): called with each result as soon as it is measured.
+
+    Returns:
+    - results (list of dict): see measure
+    """
+    points = [(case, params) for case in cases for params in case.points(profile)]
+    results = []
+    if isolate:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context, max_tasks_per_child=1) as pool:
+            for case, params in points:
+                results.append(pool.submit(measure_by_name, case.name, params, repeats).result())
+                if progress is not None:
+                    progress(results[-1])
+    else:
+        for case, params in points:
+            results.append(measure(case, params, repeats))
+            if progress is not None:
+                progress(results[-1])
+    return results
+
+def environment():
+    """
+    What a baseline was measured on; timings are only comparable on the same machine and library versions
+    """
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+def save(results, path, profile):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'profile': profile, 'results': results}, f, indent=2)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(results, baseline, tolerance=0.25, min_time_s=0.01, min_memory_mb=5.0):
+    """
+    Compare results with a saved baseline, point by point.
+
+    A point regresses if its min wall time, peak RSS increase or peak traced allocations grew by more than
+    tolerance (relative) and by more than min_time_s / min_memory_mb (absolute, to ignore noise on tiny points).
+
+    Returns:
+    - comparison (DataFrame): one row per point present in both, with baseline, current, ratio and
+      regression flag per measure
+    """
+    measures = {'time_min_s': min_time_s, 'rss_increase_mb': min_memory_mb, 'alloc_peak_mb': min_memory_mb}
+    previous = {result['key']: result for result in baseline['results']}
+    rows = []
+    for result in results:
+        old = previous.get(result['key'])
+        if old is None:
+            continue
+        row = {'key': result['key']}
+        for measure_name, floor in measures.items():
+            new_value, old_value = result.get(measure_name), old.get(measure_name)
+            if new_value is None or old_value is None:
+                continue
+            ratio = new_value / old_value if old_value else np.inf
+            row[f'{measure_name}_baseline'] = old_value
+            row[measure_name] = new_value
+            row[f'{measure_name}_ratio'] = ratio
+            row[f'{measure_name}_regressed'] = ratio > 1 + tolerance and new_value - old_value > floor
+        row['regressed'] = any(value for name, value in row.items() if name.endswith('_regressed'))
+        rows.append(row)
+    return pd.DataFrame(rows)
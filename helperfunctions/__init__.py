@@ -1,3 +1,9 @@
 __all__ = [
-    "data_gen_funcs", "statistical_tests", "users.py", "user.py"
+    "data_gen_funcs", "statistical_tests", "users.py", "user.py",
+    "userpool", "simulation",
+    "cuped", "event_store",
+    "ingest", "assignment",
+    "sketches", "planner",
+    "resampling", "metrics", "cube",
+    "rng", "pipeline", "profiling", "monitor"
 ]
\ No newline at end of file
@@ -2,37 +2,143 @@ from helperfunctions.user import User
 from helperfunctions.users import Users
 from datetime import datetime, timedelta
 import numpy as np
+from helperfunctions.rng import streams
+
+# one row per (day, user) visit: sparse COO layout of the day x user activity matrix
+ACTIVITY_DTYPE = np.dtype([('day', np.int16), ('user', np.int32), ('count', np.int16)])
+
+def simulate_activity_matrix(visit_probabilities, action_lambdas, num_days, rng=None, day_keys=None):
+    """
+    Simulate daily visits and action counts for a pool of users, one day at a time.
+
+    Each (day, user) cell is one Bernoulli draw against the user's visit probability; users that
+    visit draw their action count from Poisson(action_lambda). Every day draws from its own child
+    stream of rng (see rng.streams), so memory stays bounded by the pool size and any range of days
+    can be simulated on its own (e.g. in another process) with the same result.
+
+    Parameters:
+    - visit_probabilities (array): per-user probability of visiting on a given day.
+    - action_lambdas (array): per-user Poisson parameter for the number of actions.
+    - num_days (int): number of days to simulate.
+    - rng (int, SeedSequence or np.random.Generator): seed of the day streams, random if None.
+    - day_keys (array): stream key of each day, 0..num_days-1 if None (e.g. date ordinals for chunked runs).
+
+    Returns:
+    - activities (ndarray): ACTIVITY_DTYPE records (day, user, count) sorted by day.
+    """
+    visit_probabilities = np.asarray(visit_probabilities, dtype=np.float32)
+    action_lambdas = np.asarray(action_lambdas)
+    day_keys = np.arange(num_days) if day_keys is None else day_keys
+
+    days = []
+    for day, day_rng in enumerate(streams(rng, 'activity', index=day_keys)):
+        users = np.flatnonzero(day_rng.random(len(visit_probabilities), dtype=np.float32) < visit_probabilities)
+        block = np.empty(len(users), dtype=ACTIVITY_DTYPE)
+        block['day'] = day
+        block['user'] = users
+        block['count'] = day_rng.poisson(action_lambdas[users])
+        days.append(block)
+    return np.concatenate(days) if days else np.empty(0, dtype=ACTIVITY_DTYPE)
+
+# Monday ... Sunday multipliers of the visit probability (mean 1): weekday traffic is higher than weekend traffic
+DAY_OF_WEEK_FACTORS = np.array([1.05, 1.1, 1.1, 1.05, 1.0, 0.8, 0.9])
+
+def effect_curve(lift, num_days, novelty=0.0, half_life=7.0):
+    """
+    Relative treatment effect on each day of a test: lift * (1 + novelty * 0.5 ** (day / half_life)).
+
+    novelty > 0 is a novelty effect that starts (1 + novelty) times as large and fades to lift;
+    novelty in [-1, 0) is a primacy effect that starts smaller and builds up to lift.
+    """
+    return lift * (1 + novelty * 0.5 ** (np.arange(num_days) / half_life))
+
+def simulate_realistic_activity(visit_probabilities, action_lambdas, num_days, first_weekday=0,
+                                day_of_week=DAY_OF_WEEK_FACTORS, effects=None, effect_codes=None, effect_scales=None,
+                                rng=None, day_keys=None):
+    """
+    Simulate daily visits and action counts with weekly seasonality and time-varying, heterogeneous effects.
+
+    Like simulate_activity_matrix, each day's visits are drawn as one array over users from the day's own
+    stream, but the visit probability of each cell is scaled by the day-of-week factor, and the action lambda
+    of each visit is action_lambda * (1 + effects[effect_code, day] * effect_scale) for its user.
+
+    Parameters:
+    - visit_probabilities (array): per-user probability of visiting on an average day.
+    - action_lambdas (array): per-user Poisson parameter for the number of actions.
+    - num_days (int): number of days to simulate.
+    - first_weekday (int): weekday of day 0 (0 = Monday).
+    - day_of_week (array): 7 visit probability multipliers, Monday first.
+    - effects (array): (rows x num_days) relative effect on the action lambda, e.g. one row per variant.
+    - effect_codes (array): per-user row of effects, -1 for no effect.
+    - effect_scales (array): per-user multiplier of the effect (heterogeneous effects), 1 if None.
+    - rng (int, SeedSequence or np.random.Generator): seed of the day streams, random if None.
+    - day_keys (array): stream key of each day, 0..num_days-1 if None.
+
+    Returns:
+    - activities (ndarray): ACTIVITY_DTYPE records (day, user, count) sorted by day then user.
+    """
+    visit_probabilities = np.asarray(visit_probabilities, dtype=float)
+    action_lambdas = np.asarray(action_lambdas, dtype=float)
+    num_users = len(visit_probabilities)
+    weekdays = (first_weekday + np.arange(num_days)) % 7
+
+    # visits compare 16-bit random integers against per-weekday thresholds computed once (probabilities are
+    # resolved to 1/65536), which halves the random bits drawn per cell and skips a float pass per day
+    thresholds = np.round(np.minimum(np.asarray(day_of_week)[:, None] * visit_probabilities, 1) * 2**16)
+    thresholds = np.minimum(thresholds, 2**16 - 1).astype(np.uint16)
+
+    # a row of zeros at the end, so code -1 means no effect
+    effects = np.zeros((1, num_days)) if effects is None else np.atleast_2d(effects)
+    effects = np.vstack([effects, np.zeros(num_days)])
+    effect_codes = np.full(num_users, -1) if effect_codes is None else np.asarray(effect_codes)
+    effect_scales = np.ones(num_users) if effect_scales is None else np.asarray(effect_scales, dtype=float)
+    day_keys = np.arange(num_days) if day_keys is None else day_keys
+
+    days = []
+    for day, day_rng in enumerate(streams(rng, 'activity', index=day_keys)):
+        draws = day_rng.integers(0, 2**16, size=num_users, dtype=np.uint16)
+        users = np.flatnonzero(draws < thresholds[weekdays[day]])
+        lambdas = action_lambdas[users] * (1 + effects[effect_codes[users], day] * effect_scales[users])
+        block = np.empty(len(users), dtype=ACTIVITY_DTYPE)
+        block['day'] = day
+        block['user'] = users
+        block['count'] = day_rng.poisson(lambdas)
+        days.append(block)
+    return np.concatenate(days) if days else np.empty(0, dtype=ACTIVITY_DTYPE)
 
 class Activities:
-    def __init__(self, users, start_date, end_date):
+    def __init__(self, users, start_date, end_date, seed=None):
         self.users = users
+        self.user_ids = np.asarray(users.get_user_ids())
         self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
         self.end_date = datetime.strptime(end_date, '%Y-%m-%d')
-        self.activities = self.simulate_activities()
+        self.num_days = (self.end_date - self.start_date).days + 1
+        self.activities = self.simulate_activities(seed)
 
-    def simulate_activities(self):
+    def simulate_activities(self, seed=None):
         """ 
-        Uses self.visit_probability for each user to decide independently on a given day if they will visit
-        Uses self.action_lambda as the parameter for the poisson for those that do visit, how many times they commit the action
+        Uses the visit probability of each user to decide independently on a given day if they will visit
+        Uses the action lambda as the parameter for the poisson for those that do visit, how many times they commit the action
+
+        The result is a sparse (day, user, count) array, see simulate_activity_matrix
         """
-        activities = {}
-        current_date = self.start_date
-        while current_date <= self.end_date:
-            daily_activities = {}
-            for user_id, user in self.users.items():
-                if np.random.random() < user.visit_probability:  # Check if user visits
-                    actions_count = np.random.poisson(user.action_lambda)
-                    daily_activities[user_id] = actions_count
-            activities[current_date.strftime('%Y-%m-%d')] = daily_activities
-            current_date += timedelta(days=1)
-        return activities
+        return simulate_activity_matrix(self.users.get_visit_probabilities(), self.users.get_action_lambdas(),
+                                        self.num_days, seed)
+
+    def day_index(self, date):
+        return (datetime.strptime(date, '%Y-%m-%d') - self.start_date).days
+
+    def date_of(self, day):
+        return (self.start_date + timedelta(days=int(day))).strftime('%Y-%m-%d')
 
     def get_activities_on_date(self, date):
-        return self.activities.get(date, {})
+        day = self.day_index(date)
+        lo, hi = np.searchsorted(self.activities['day'], [day, day + 1])
+        daily_activities = self.activities[lo:hi]
+        return dict(zip(self.user_ids[daily_activities['user']].tolist(), daily_activities['count'].tolist()))
     
     def activities_as_nested_list(self):
-        nested_list = []
-        for date, daily_activities in self.activities.items():
-            for user_id, actions_count in daily_activities.items():
-                nested_list.append([date, user_id, actions_count])
-        return nested_list
+        dates = [self.date_of(day) for day in range(self.num_days)]
+        user_ids = self.user_ids[self.activities['user']].tolist()
+        return [[dates[day], user_id, actions_count]
+                for day, user_id, actions_count in zip(self.activities['day'].tolist(), user_ids, self.activities['count'].tolist())]
@@ -0,0 +1,142 @@
+import hashlib
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+BUCKETS = 10000
+
+def salt_hash(salt):
+    return np.uint64(int.from_bytes(hashlib.blake2b(str(salt).encode(), digest_size=8).digest(), 'little'))
+
+def hash_ids(ids, salt):
+    """
+    64-bit hash of each id salted with salt, vectorized.
+
+    Integer ids go through splitmix64 directly; any other ids (e.g. UUID strings) are hashed with
+    pandas' hash_array first. The same (id, salt) always gives the same hash.
+    """
+    ids = np.asarray(ids)
+    if ids.dtype.kind in 'iu':
+        z = ids.astype(np.uint64)
+    else:
+        z = pd.util.hash_array(ids.astype(object))
+    z = z ^ salt_hash(salt)
+
+    # splitmix64 finalizer
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def buckets(ids, salt):
+    """
+    Bucket in [0, BUCKETS) of each id for the given salt
+    """
+    return (hash_ids(ids, salt) % np.uint64(BUCKETS)).astype(np.int32)
+
+class Experiment:
+    """
+    Deterministic variant assignment by salted hashing of user ids.
+
+    A user is exposed if their traffic bucket is below traffic * BUCKETS (and, in a layer, if their layer
+    bucket falls in the experiment's range); exposed users are split between variants by weight using an
+    independent variant bucket. Assignments never change for a given salt, so a user always sees the same variant.
+    """
+
+    def __init__(self, name, variants=('control', 'treatment'), weights=None, traffic=1.0, salt=None, cache_size=2**16):
+        self.name = name
+        self.variants = list(variants)
+        weights = np.ones(len(self.variants)) if weights is None else np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+        self.traffic = traffic
+        self.salt = name if salt is None else salt
+        self.layer = None
+        self.layer_range = (0, BUCKETS)
+
+        # variant v gets variant buckets [edges[v], edges[v + 1])
+        self.edges = np.round(np.cumsum(self.weights) * BUCKETS).astype(np.int32)
+        self.variant_labels = np.array(self.variants + [None], dtype=object)
+
+        # single-id fast path
+        self.assign = lru_cache(maxsize=cache_size)(self.assign_one)
+
+    def __getstate__(self):
+        # the lru_cache wrapper cannot be pickled (e.g. to send an experiment to a worker process); rebuild it on load
+        state = self.__dict__.copy()
+        state['assign'] = state['assign'].cache_info().maxsize
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.assign = lru_cache(maxsize=state['assign'])(self.assign_one)
+
+    def __repr__(self):
+        return (f"Experiment({self.name}, variants={self.variants}, weights={np.round(self.weights, 4).tolist()}, "
+                f"traffic={self.traffic})")
+
+    def assign_codes(self, ids):
+        """
+        Variant index of each id (position in self.variants), -1 if the id is not in the experiment
+        """
+        ids = np.asarray(ids)
+        exposed = buckets(ids, (self.salt, 'traffic')) < self.traffic * BUCKETS
+        if self.layer is not None:
+            layer_bucket = buckets(ids, self.layer.salt)
+            exposed &= (layer_bucket >= self.layer_range[0]) & (layer_bucket < self.layer_range[1])
+        codes = np.searchsorted(self.edges, buckets(ids, (self.salt, 'variant')), side='right').astype(np.int8)
+        codes[~exposed] = -1
+        return codes
+
+    def assign_bulk(self, ids):
+        """
+        Variant label of each id, None if the id is not in the experiment
+        """
+        return self.variant_labels[self.assign_codes(ids)]
+
+    def assign_one(self, user_id):
+        return self.assign_bulk([user_id])[0]
+
+class Layer:
+    """
+    A set of mutually exclusive experiments.
+
+    Each experiment added to a layer owns a disjoint range of the layer's buckets, so a user is in at most one
+    experiment of the layer. Experiments in different layers (different salts) overlap independently.
+    """
+
+    def __init__(self, name, salt=None):
+        self.name = name
+        self.salt = name if salt is None else salt
+        self.experiments = []
+        self.allocated = 0
+
+    def __repr__(self):
+        return f"Layer({self.name}, {len(self.experiments)} experiments, {self.allocated / BUCKETS:.0%} allocated)"
+
+    def add(self, experiment, share):
+        """
+        Give experiment the next share (0-1] of the layer's users
+        """
+        size = int(round(share * BUCKETS))
+        if self.allocated + size > BUCKETS:
+            raise ValueError(f"layer {self.name} only has {(BUCKETS - self.allocated) / BUCKETS:.0%} of users left")
+        experiment.layer = self
+        experiment.layer_range = (self.allocated, self.allocated + size)
+        experiment.assign.cache_clear()
+        self.allocated += size
+        self.experiments.append(experiment)
+        return experiment
+
+    def assign_bulk(self, ids):
+        """
+        Per id, the name of the experiment it is in (None if none) and its variant label
+        """
+        ids = np.asarray(ids)
+        experiment_names = np.full(len(ids), None, dtype=object)
+        variants = np.full(len(ids), None, dtype=object)
+        for experiment in self.experiments:
+            codes = experiment.assign_codes(ids)
+            exposed = codes >= 0
+            experiment_names[exposed] = experiment.name
+            variants[exposed] = experiment.variant_labels[codes[exposed]]
+        return experiment_names, variants
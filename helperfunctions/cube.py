@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# memory budget of a cube's dense checkpoints (metric totals and event counts together) with the default stride
+CHECKPOINT_BYTES = 2**30
+
+def total_dtype(values):
+    """
+    dtype of per-user totals of values: int32 for integer metrics whose grand total fits, else int64 / float64
+    """
+    if not np.issubdtype(values.dtype, np.integer) and not np.issubdtype(values.dtype, np.bool_):
+        return np.float64
+    return np.int32 if np.abs(values.astype(np.int64)).sum() < np.iinfo(np.int32).max else np.int64
+
+def default_stride(num_days, num_users, itemsize):
+    """
+    Smallest multiple of 7 days whose checkpoints ((days / stride) x users x itemsize bytes) fit in CHECKPOINT_BYTES
+    """
+    checkpoints = max(CHECKPOINT_BYTES // max(num_users * itemsize, 1) - 1, 1)
+    return 7 * max(-(-num_days // (7 * checkpoints)), 1)
+
+class UserDayCube:
+    """
+    Sparse (day x user) cube of per-user daily metric sums and event counts, built once from the events.
+
+    Cumulative totals are checkpointed densely every `stride` days, so the totals of any prefix of days are a
+    checkpoint plus at most stride - 1 sparse day rows, and any window [a, b) is the difference of two prefixes:
+    O(users) per query instead of filtering and regrouping the events. Memory is about
+    (days / stride) x users for the checkpoints plus the non-zero (day, user) cells. Checkpoints are int32
+    where the totals fit, and by default the stride is a multiple of 7 days chosen so the checkpoints stay
+    within CHECKPOINT_BYTES (weekly at up to about a million users a year).
+    """
+
+    def __init__(self, data_df, metric='action_count', start_date=None, stride=None):
+        start_date = data_df['date'].min() if start_date is None else pd.Timestamp(start_date)
+        days = (data_df['date'] - start_date).dt.days.to_numpy()
+        keep = days >= 0
+        codes, self.userids = pd.factorize(data_df['userid'].to_numpy()[keep], sort=True)
+        days = days[keep]
+        values = data_df[metric].to_numpy()[keep]
+
+        self.metric = metric
+        self.start_date = start_date
+        self.num_days = int(days.max()) + 1 if len(days) else 0
+        num_users = len(self.userids)
+        shape = (self.num_days, num_users)
+        # one sort of the (day, user) cells gives both matrices in canonical CSR order, duplicates summed
+        # (max(num_users, 1) only keeps the encoding defined for an empty frame)
+        cells, inverse = np.unique(days.astype(np.int64) * max(num_users, 1) + codes, return_inverse=True)
+        indices = (cells % max(num_users, 1)).astype(np.int32)
+        indptr = np.searchsorted(cells // max(num_users, 1), np.arange(self.num_days + 1))
+        sums = np.bincount(inverse, weights=values, minlength=len(cells)).astype(total_dtype(values))
+        counts = np.bincount(inverse, minlength=len(cells)).astype(np.int32)
+        self.stride = default_stride(self.num_days, num_users, sums.itemsize + counts.itemsize) if stride is None else stride
+        self.values = sparse.csr_matrix((sums, indices, indptr), shape=shape)
+        self.counts = sparse.csr_matrix((counts, indices, indptr), shape=shape)
+
+        # checkpoint j holds the totals of days [0, j * stride)
+        self.value_checkpoints = self.checkpoints(self.values)
+        self.count_checkpoints = self.checkpoints(self.counts)
+
+    def __repr__(self):
+        return (f"UserDayCube(metric={self.metric}, days={self.num_days}, users={len(self.userids)}, "
+                f"cells={self.values.nnz})")
+
+    def checkpoints(self, cube):
+        # block by block, so the only dense array is the checkpoints themselves
+        num_blocks = -(-self.num_days // self.stride)
+        prefix = np.zeros((num_blocks + 1, cube.shape[1]), dtype=cube.dtype)
+        for j in range(num_blocks):
+            block = cube[j * self.stride:(j + 1) * self.stride].sum(axis=0)
+            np.add(prefix[j], np.asarray(block).ravel(), out=prefix[j + 1], casting='unsafe')
+        return prefix
+
+    def prefix(self, day):
+        """
+        Per-user (metric totals, event counts) over days [0, day), as dense arrays aligned with self.userids
+        """
+        day = min(max(day, 0), self.num_days)
+        j = day // self.stride
+        values = self.value_checkpoints[j].copy()
+        counts = self.count_checkpoints[j].copy()
+        if day > j * self.stride:
+            values += np.asarray(self.values[j * self.stride:day].sum(axis=0)).ravel()
+            counts += np.asarray(self.counts[j * self.stride:day].sum(axis=0)).ravel()
+        return values, counts
+
+    def window(self, start_day, end_day):
+        """
+        Per-user (metric totals, event counts) over days [start_day, end_day)
+        """
+        values_end, counts_end = self.prefix(end_day)
+        values_start, counts_start = self.prefix(start_day)
+        return values_end - values_start, counts_end - counts_start
+
+    def user_totals(self, start_day, end_day):
+        """
+        Metric total of every user with an event in days [start_day, end_day), indexed by userid
+        """
+        values, counts = self.window(start_day, end_day)
+        present = counts > 0
+        return pd.Series(values[present], index=pd.Index(self.userids[present], name='userid'), name=self.metric)
+
+    def window_moments(self, weeks):
+        """
+        Users, mean and sample variance (ddof=1) of the per-user metric total over the first k weeks, for every
+        k in weeks (see planner.window_moments)
+        """
+        weeks = np.atleast_1d(weeks)
+        moments = {}
+        for k in weeks:
+            values, counts = self.prefix(7 * int(k))
+            present = values[counts > 0]
+            moments[k] = (len(present), present.mean(), np.var(present, ddof=1))
+        return pd.DataFrame.from_dict(moments, orient='index', columns=['users', 'mean', 'variance']).reindex(weeks)
@@ -0,0 +1,97 @@
+import numpy as np
+from helperfunctions.cube import UserDayCube
+
+class CovariateTable:
+    """
+    Per-user pre-experiment covariates for CUPED (Deng et al., 2013), indexed by userid.
+
+    Built once from the pre-period events and reused by every experiment run on the same users.
+    Users without pre-period activity get a covariate of 0.
+    """
+
+    def __init__(self, pre_data, metric='action_count', start_date=None, end_date=None):
+        if start_date is not None:
+            pre_data = pre_data[pre_data['date'] >= start_date]
+        if end_date is not None:
+            pre_data = pre_data[pre_data['date'] < end_date]
+        self.metric = metric
+        self.covariates = pre_data.groupby('userid', observed=True)[metric].sum().sort_index()
+
+    def __repr__(self):
+        return f"CovariateTable({len(self.covariates)} users, metric={self.metric})"
+
+    def __len__(self):
+        return len(self.covariates)
+
+    def lookup(self, userids):
+        """
+        Covariate of each of userids as an array
+        """
+        position = self.covariates.index.get_indexer(userids)
+        return np.where(position >= 0, self.covariates.to_numpy()[position], 0)
+
+def cuped_theta(y, x):
+    """
+    Regression coefficient of the metric y on the covariate x
+    """
+    var_x = np.var(x)
+    return np.cov(y, x, ddof=0)[0, 1] / var_x if var_x > 0 else 0.0
+
+def cuped_adjust(y_c, x_c, y_t, x_t):
+    """
+    CUPED-adjusted metric of each group: y - theta * (x - mean(x)).
+
+    theta and mean(x) are pooled over both groups so the adjustment does not bias the difference in means.
+
+    Input:
+    - y_c, y_t: per-user metric of control / treatment
+    - x_c, x_t: per-user covariate of control / treatment
+
+    Output:
+    - adjusted control metric, adjusted treatment metric, theta
+    """
+    y = np.concatenate([y_c, y_t])
+    x = np.concatenate([x_c, x_t])
+    theta = cuped_theta(y, x)
+    x_bar = x.mean()
+    return np.asarray(y_c) - theta * (np.asarray(x_c) - x_bar), np.asarray(y_t) - theta * (np.asarray(x_t) - x_bar), theta
+
+def cumulative_user_totals(data, metric='action_count', start_date=None, num_days=None):
+    """
+    Per-user cumulative metric totals, once per day, read from a cube.UserDayCube of the events
+
+    Input:
+    - start_date: day 1 (the first date of data if None); give both groups the same one so their days line up
+    - num_days: number of days to yield (through the last day of data if None)
+
+    Yields:
+    - (day, userids, totals) with day 1 = start_date, for every user seen so far
+    """
+    cube = UserDayCube(data, metric, start_date)
+    for day in range(1, (cube.num_days if num_days is None else num_days) + 1):
+        totals, counts = cube.prefix(day)
+        present = counts > 0
+        yield day, cube.userids[present], totals[present]
+
+def variance_reduction(cube, weeks):
+    """
+    rho^2, the share of the variance of the per-user total over `weeks` weeks that CUPED removes, estimated
+    on the pre-period alone: its last `weeks` weeks play the experiment and the days before them the covariate
+
+    With CUPED, a test needs the sample size of a metric with variance (1 - rho^2) * variance.
+
+    Input:
+    - cube: cube.UserDayCube of the pre-period
+    - weeks: weeks the test is planned on (as in the planner's window moments)
+
+    Output:
+    - rho^2 in [0, 1], 0 if there is no pre-period left before the window
+    """
+    split = max(cube.num_days - 7 * int(weeks), 0)
+    y, counts = cube.window(split, cube.num_days)
+    x, _ = cube.window(0, split)
+    present = counts > 0
+    x, y = x[present].astype(float), y[present].astype(float)
+    if len(y) < 2 or np.var(x) == 0 or np.var(y) == 0:
+        return 0.0
+    return float(np.corrcoef(x, y)[0, 1] ** 2)
@@ -1,63 +1,295 @@
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
-import uuid
 from datetime import datetime, timedelta
+from helperfunctions.userpool import UUIDColumn, USERTYPES
+from helperfunctions.assignment import Experiment
+from helperfunctions.cube import UserDayCube
+from helperfunctions.activities import simulate_realistic_activity, effect_curve
+from helperfunctions.rng import generator, streams, resolve_seed
+from helperfunctions.profiling import profiled
 
-def create_user_dataset(num_users):
+@profiled
+def create_user_dataset(num_users, seed=None):
     """
-    Create a pandas DataFrame with randomly generated user IDs.
+    Create a pandas DataFrame of compact integer user IDs.
+
+    UUIDs are not materialized: user_df.attrs holds the key of a UUIDColumn that formats the UUID
+    of any ID on demand (see decode_userids), so only the rows actually displayed pay for it.
 
     Parameters:
     - num_users (int): Number of users.
+    - seed (int or sequence of ints): seed for reproducible UUIDs, random if None.
 
     Returns:
-    - user_df (DataFrame): DataFrame with 'userid' column.
+    - user_df (DataFrame): DataFrame with int32 'userid' column.
     """
-    user_ids = [str(uuid.uuid4()) for _ in range(num_users)]
-    user_df = pd.DataFrame({'userid': user_ids})
+    user_df = pd.DataFrame({'userid': np.arange(num_users, dtype=np.int32)})
+    # plain strings / ints so the attrs survive pickling, st.cache_data and to_parquet
+    user_df.attrs['uuid_key'] = generator(seed, 'uuid_key').bytes(16).hex()
+    user_df.attrs['num_users'] = num_users
     return user_df
 
-def generate_daily_data(date, user_data,param=2, min_per_day=100):
+@profiled
+def decode_userids(userids, user_data):
+    """
+    Turn integer user IDs into their UUID strings, for display.
+
+    Parameters:
+    - userids (array-like): integer user IDs.
+    - user_data (DataFrame): frame from create_user_dataset, or any frame generated from it.
+
+    Returns:
+    - uuids (ndarray): UUID strings.
+    """
+    uuids = UUIDColumn(user_data.attrs['num_users'], bytes.fromhex(user_data.attrs['uuid_key']))
+    return uuids[np.asarray(userids)]
+
+@profiled
+def generate_daily_data(date, user_data,param=2, min_per_day=100, rng=None):
     """
     Generate daily data DataFrame with random values and corresponding user IDs.
 
     Parameters:
     - date (datetime): Date for the data.
     - user_data (DataFrame): DataFrame with 'userid' column.
+    - rng (np.random.Generator): random generator, a fresh one if None.
 
     Returns:
     - daily_data_df (DataFrame): DataFrame with 'userid', 'data', and 'date' columns.
     """
-    daily_data = np.random.poisson(param, size=np.random.randint(min_per_day, min_per_day*2))
-    daily_df = pd.DataFrame({
-        'userid': np.random.choice(user_data['userid'], size=len(daily_data)),
-        'action_count': daily_data,
-        'date': date
-    })
-    return daily_df
+    return generate_main_dataframe(date, date, user_data, param, min_per_day, rng=rng)
 
-def generate_main_dataframe(start_date, end_date, user_data,param=2,min_per_day=100):
+@profiled
+def generate_main_dataframe(start_date, end_date, user_data,param=2,min_per_day=100, seed=None, rng=None):
     """
     Generate main DataFrame with daily data for a date range.
 
+    Each date draws its rows from its own child stream of seed (keyed by the date, see rng.streams), so
+    generating a range in chunks, in any order or in parallel (see generate_parallel) gives exactly the
+    same events as generating it at once. Each day's rows are drawn in one vectorized call per column
+    and the frame is built once.
+
     Parameters:
     - start_date (datetime): Start date of the date range.
     - end_date (datetime): End date of the date range.
     - user_data (DataFrame): DataFrame with 'userid' column.
+    - seed (int or sequence of ints): seed for reproducible events, random if None.
+    - rng (np.random.Generator): random generator to draw every day from instead of the seeded day streams.
 
     Returns:
-    - data_df (DataFrame): Main DataFrame with 'userid', 'data', and 'date' columns.
+    - data_df (DataFrame): Main DataFrame with 'userid', 'action_count' and 'date' columns.
     """
     date_range = pd.date_range(start=start_date, end=end_date)
-    data = []
-    for date in date_range:
-        daily_df = generate_daily_data(date, user_data,param,min_per_day)
-        data.append(daily_df)
-    data_df = pd.concat(data, ignore_index=True)
+    day_rngs = streams(seed if rng is None else rng, 'events', index=date_ordinals(date_range))
+
+    daily_rows = np.array([day_rng.integers(min_per_day, min_per_day*2) for day_rng in day_rngs], dtype=np.int64)
+    user_index = concatenate([day_rng.integers(0, len(user_data), size=rows) for day_rng, rows in zip(day_rngs, daily_rows)])
+    action_count = concatenate([day_rng.poisson(param, size=rows) for day_rng, rows in zip(day_rngs, daily_rows)]).astype(np.int32)
+
+    data_df = pd.DataFrame({
+        'userid': user_data['userid'].to_numpy()[user_index],
+        'action_count': action_count,
+        'date': np.repeat(date_range.values, daily_rows)
+    })
+    data_df.attrs = dict(user_data.attrs)
     return data_df
 
 
-def start_test(days, rl, param=2, num_users=100000):
+def date_ordinals(date_range):
+    """
+    Stream key of each date: its proleptic Gregorian ordinal
+    """
+    return [date.toordinal() for date in date_range]
+
+def concatenate(arrays):
+    return np.concatenate(arrays) if len(arrays) else np.empty(0, dtype=np.int64)
+
+@profiled
+def generate_experiment_dataframe(start_date, end_date, user_data, experiment, params, min_per_day=200, seed=None, rng=None):
+    """
+    Generate events of an experiment: one stream of traffic, split by the experiment's assignment.
+
+    Rows are drawn like generate_main_dataframe, then each row's user is looked up in the experiment.
+    Users outside the experiment are dropped and every other row draws its action count with the parameter of
+    the user's variant, so a user is always in one variant for the whole test.
+
+    Parameters:
+    - start_date (datetime): Start date of the date range.
+    - end_date (datetime): End date of the date range.
+    - user_data (DataFrame): DataFrame with 'userid' column.
+    - experiment (assignment.Experiment): assigns users to variants.
+    - params (dict): Poisson parameter of each variant, e.g. {'control': 2, 'treatment': 2.2}.
+    - min_per_day (int): minimum number of rows per day over all variants (and unexposed users).
+    - seed (int or sequence of ints): seed for reproducible events, random if None (one stream per date).
+    - rng (np.random.Generator): random generator to draw every day from instead of the seeded day streams.
+
+    Returns:
+    - data_df (DataFrame): DataFrame with 'userid', 'action_count', 'date' and 'variant' columns.
+    """
+    date_range = pd.date_range(start=start_date, end=end_date)
+    day_rngs = streams(seed if rng is None else rng, 'events', index=date_ordinals(date_range))
+
+    # assign each user once, then look rows up by user index
+    user_codes = experiment.assign_codes(user_data['userid'].to_numpy())
+    variant_params = np.array([params[variant] for variant in experiment.variants])
+
+    daily_rows = np.array([day_rng.integers(min_per_day, min_per_day*2) for day_rng in day_rngs], dtype=np.int64)
+    user_index = [day_rng.integers(0, len(user_data), size=rows) for day_rng, rows in zip(day_rngs, daily_rows)]
+    # users outside the experiment are dropped
+    user_index = [index[user_codes[index] >= 0] for index in user_index]
+    action_count = [day_rng.poisson(variant_params[user_codes[index]]) for day_rng, index in zip(day_rngs, user_index)]
+    dates = np.repeat(date_range.values, [len(index) for index in user_index])
+    user_index = concatenate(user_index)
+    codes = user_codes[user_index]
+
+    data_df = pd.DataFrame({
+        'userid': user_data['userid'].to_numpy()[user_index],
+        'action_count': concatenate(action_count).astype(np.int32),
+        'date': dates,
+        'variant': pd.Categorical.from_codes(codes, categories=experiment.variants)
+    })
+    data_df.attrs = dict(user_data.attrs)
+    return data_df
+
+@profiled
+def generate_realistic_dataframe(start_date, end_date, pool, experiment=None, lifts=None, novelty=0.0, half_life=7.0,
+                                 segment_effects=None, visit_scale=1.0, test_start_date=None, seed=None, rng=None):
+    """
+    Generate events from the user pool's own propensities, with weekly seasonality and realistic treatment effects.
+
+    Each user visits on a day with their visit probability (times visit_scale and the day-of-week factor) and
+    then draws Poisson(action_lambda) actions. In an experiment, the treatment effect on the action lambda can
+    fade in or out (novelty / primacy) and differ by usertype. See activities.simulate_realistic_activity.
+
+    Parameters:
+    - start_date (datetime): Start date of the date range.
+    - end_date (datetime): End date of the date range.
+    - pool (userpool.UserPool): users and their propensities.
+    - experiment (assignment.Experiment): if given, only exposed users are simulated, with a 'variant' column.
+    - lifts (dict): relative lift of each variant's action lambda, e.g. {'treatment': 0.1}; 0 if missing.
+    - novelty (float): extra relative size of the effect on day 0, see activities.effect_curve.
+    - half_life (float): days for the novelty / primacy part of the effect to halve.
+    - segment_effects (dict): multiplier of the lift per usertype, e.g. {'Subscriber': 2, 'Registrant': 0.5}.
+    - visit_scale (float): multiplier of every visit probability, to scale DAU.
+    - test_start_date (datetime): day 0 of the effect curve, start_date if None (set it when generating in chunks).
+    - seed (int or sequence of ints): seed for reproducible events, random if None (one stream per date).
+    - rng (np.random.Generator): random generator to draw every day from instead of the seeded day streams.
+
+    Returns:
+    - data_df (DataFrame): DataFrame with 'userid', 'action_count' and 'date' (and 'variant') columns.
+    """
+    date_range = pd.date_range(start=start_date, end=end_date)
+    num_days = len(date_range)
+    offset = 0 if test_start_date is None else (date_range[0] - pd.Timestamp(test_start_date)).days
+
+    users = pool.get_user_ids()
+    effects = effect_codes = effect_scales = None
+    if experiment is not None:
+        codes = experiment.assign_codes(users)
+        users = users[codes >= 0]
+        effect_codes = codes[codes >= 0]
+        lifts = {} if lifts is None else lifts
+        effects = np.array([effect_curve(lifts.get(variant, 0.0), offset + num_days, novelty, half_life)[offset:]
+                            for variant in experiment.variants])
+        if segment_effects is not None:
+            effect_scales = np.array([segment_effects.get(usertype, 1.0) for usertype in USERTYPES])[pool.usertype_codes[users]]
+
+    activities = simulate_realistic_activity(np.minimum(pool.get_visit_probabilities()[users] * visit_scale, 1),
+                                             pool.get_action_lambdas()[users], num_days, date_range[0].weekday(),
+                                             effects=effects, effect_codes=effect_codes, effect_scales=effect_scales,
+                                             rng=seed if rng is None else rng, day_keys=date_ordinals(date_range))
+
+    data_df = pd.DataFrame({
+        'userid': users[activities['user']],
+        'action_count': activities['count'].astype(np.int32),
+        'date': date_range.values[activities['day']]
+    })
+    if experiment is not None:
+        data_df['variant'] = pd.Categorical.from_codes(effect_codes[activities['user']], categories=experiment.variants)
+    data_df.attrs['uuid_key'] = pool.uuids.key.hex()
+    data_df.attrs['num_users'] = pool.size
+    return data_df
+
+def realistic_visit_scale(pool, min_per_day):
+    """
+    visit_scale that gives realistic traffic the same average DAU as the simple generators (1.5 x min_per_day)
+    """
+    return min(1.0, 1.5 * min_per_day / pool.get_visit_probabilities().sum())
+
+@profiled
+def generate_parallel(function, start_date, end_date, *args, days_per_chunk=28, max_workers=None, seed=None, **kwargs):
+    """
+    Run a generator (generate_main_dataframe, generate_experiment_dataframe, generate_realistic_dataframe) on
+    chunks of days in a process pool and concatenate the chunks.
+
+    Every date draws from its own stream of seed, so the result is identical to
+    function(start_date, end_date, *args, seed=seed, **kwargs) for the same seed. For novelty effects in
+    generate_realistic_dataframe, pass test_start_date so every chunk knows how far into the test it is.
+
+    Parameters:
+    - function (callable): the generator, called as function(chunk_start, chunk_end, *args, seed=seed, **kwargs).
+    - start_date, end_date (datetime): date range, both included.
+    - days_per_chunk (int): days generated per task.
+    - max_workers (int): size of the process pool; 1 runs in this process.
+    - seed (int or sequence of ints): seed shared by every chunk, random if None.
+
+    Returns:
+    - data_df (DataFrame): the events of the whole range, as function would return them.
+    """
+    seed = resolve_seed(seed)
+    chunk_starts = pd.date_range(start=start_date, end=end_date, freq=f'{days_per_chunk}D')
+    chunk_ends = [min(chunk_start + timedelta(days=days_per_chunk - 1), pd.Timestamp(end_date)) for chunk_start in chunk_starts]
+    tasks = [(function, chunk_start, chunk_end, args, dict(kwargs, seed=seed))
+             for chunk_start, chunk_end in zip(chunk_starts, chunk_ends)]
+
+    if max_workers == 1:
+        chunks = [run_task(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            chunks = list(pool.map(run_task, *zip(*tasks)))
+    data_df = pd.concat(chunks, ignore_index=True)
+    data_df.attrs = dict(chunks[0].attrs)
+    return data_df
+
+def run_task(function, start_date, end_date, args, kwargs):
+    return function(start_date, end_date, *args, **kwargs)
+
+@profiled
+def cumulative_snapshots(data_df, start_date, days):
+    """
+    Build daily cumulative per-user snapshots of action_count.
+
+    Snapshot d holds, for every user seen on or before start_date + d days, the sum of their
+    action_count up to that date. Events are loaded once into a UserDayCube and every snapshot is
+    a prefix of it, instead of re-filtering and re-grouping the full frame for every snapshot.
+
+    Parameters:
+    - data_df (DataFrame): events with 'userid', 'action_count' and 'date' columns.
+    - start_date (datetime): first day of the test.
+    - days (int): number of snapshots.
+
+    Returns:
+    - snapshots (DataFrame): DataFrame with 'userid', 'action_count' and 'snapshot' columns,
+      sorted by snapshot then userid.
+    """
+    cube = UserDayCube(data_df, 'action_count', start_date)
+    dtype = data_df['action_count'].dtype
+
+    # snapshot d covers every event up to and including day index d
+    snapshots = []
+    for day in range(1, days + 1):
+        totals = cube.user_totals(0, day + 1)
+        snapshots.append(pd.DataFrame({
+            'userid': totals.index,
+            'action_count': totals.to_numpy().astype(dtype),
+            'snapshot': day
+        }))
+
+    return pd.concat(snapshots, ignore_index=True)
+
+@profiled
+def start_test(days, rl, param=2, num_users=100000, seed=None):
     """
     Starts the A/B Test starting in 2024-01-01 for a set number of days
 
@@ -66,41 +298,24 @@ def start_test(days, rl, param=2, num_users=100000):
     - rl: relative lift
     - param: default param for control
     - num_users: # of subs that may eventually enter the test
+    - seed: seed of the users, assignment and events, random if None
     """
+    seed = resolve_seed(seed)
     # start time is 2024-01-01
     start_date = datetime(2024, 1, 1)
     end_date = start_date + timedelta(days=days)
 
     # generate users
-    user_data = create_user_dataset(num_users)
-
-    # generate events for control and test groups
-    df_c = generate_main_dataframe(start_date, end_date, user_data, param)
-    df_t = generate_main_dataframe(start_date, end_date, user_data, param * (1 + rl))
-
-    # Initialize lists to store daily snapshots
-    snapshot_c = []
-    snapshot_t = []
-
-    for day in range(1, days + 1):
-        # Slice the dataframes to get data up to the current day
-        df_c_slice = df_c[df_c['date'] <= start_date + timedelta(days=day)]
-        df_t_slice = df_t[df_t['date'] <= start_date + timedelta(days=day)]
-
-        # Aggregate by user for control and test groups
-        userdata_c = df_c_slice.groupby('userid')['action_count'].sum().reset_index()
-        userdata_t = df_t_slice.groupby('userid')['action_count'].sum().reset_index()
-
-        # Add snapshot column
-        userdata_c['snapshot'] = day
-        userdata_t['snapshot'] = day
+    user_data = create_user_dataset(num_users, seed=seed)
 
-        # Append to snapshot lists
-        snapshot_c.append(userdata_c)
-        snapshot_t.append(userdata_t)
+    # generate events for control and test groups, with each user in one group only
+    experiment = Experiment('start_test', salt=generator(seed, 'salt').integers(2**32))
+    data_df = generate_experiment_dataframe(start_date, end_date, user_data, experiment,
+                                            {'control': param, 'treatment': param * (1 + rl)}, seed=seed)
+    df_c = data_df[data_df['variant'] == 'control']
+    df_t = data_df[data_df['variant'] == 'treatment']
 
-    # Concatenate the snapshots to create final dataframes
-    userdata_c = pd.concat(snapshot_c, ignore_index=True)
-    userdata_t = pd.concat(snapshot_t, ignore_index=True)
+    userdata_c = cumulative_snapshots(df_c, start_date, days)
+    userdata_t = cumulative_snapshots(df_t, start_date, days)
 
     return userdata_c, userdata_t
@@ -0,0 +1,113 @@
+import os
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.date32()), ('variant', pa.string())]), flavor='hive')
+
+class EventStore:
+    """
+    Event tables on local disk as Parquet, partitioned by date and variant (date=YYYY-MM-DD/variant=name/).
+
+    Files are read through memory mapping, and reads only open the partitions that match the date / variant
+    filters and only decode the requested columns. So a date slice of a year of events only touches those days,
+    and histories larger than RAM can be scanned batch by batch with iter_batches.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    def __repr__(self):
+        return f"EventStore({self.path})"
+
+    def write(self, data_df, variant='all'):
+        """
+        Write an event frame with a 'date' column. Existing (date, variant) partitions that are written to are replaced.
+
+        Parameters:
+        - data_df (DataFrame): events, e.g. from data_gen_funcs.generate_main_dataframe.
+        - variant (str): variant name to store the events under.
+        """
+        columns = {name: pa.array(column) for name, column in data_df.items()}
+        columns['date'] = columns['date'].cast(pa.timestamp('us')).cast(pa.date32())
+        columns['variant'] = pa.array(np.full(len(data_df), variant))
+        table = pa.table(columns)
+
+        # keep what is needed to decode integer userids back into UUIDs
+        if 'uuid_key' in data_df.attrs:
+            table = table.replace_schema_metadata({'uuid_key': data_df.attrs['uuid_key'],
+                                                   'num_users': str(data_df.attrs['num_users'])})
+
+        ds.write_dataset(table, self.path, format='parquet', partitioning=PARTITIONING, filesystem=self.filesystem,
+                         basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+                         existing_data_behavior='delete_matching')
+
+    def dates(self):
+        """
+        Dates with stored events (any variant), sorted, without reading any file
+        """
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(pd.Timestamp(name.split('=', 1)[1]) for name in os.listdir(self.path) if name.startswith('date='))
+
+    def dataset(self):
+        return ds.dataset(self.path, format='parquet', partitioning=PARTITIONING, filesystem=self.filesystem)
+
+    def filter_expression(self, start_date=None, end_date=None, variant=None):
+        """
+        Partition filter for dates in [start_date, end_date) and the given variant(s)
+        """
+        conditions = []
+        if start_date is not None:
+            conditions.append(ds.field('date') >= pa.scalar(to_date(start_date), pa.date32()))
+        if end_date is not None:
+            conditions.append(ds.field('date') < pa.scalar(to_date(end_date), pa.date32()))
+        if variant is not None:
+            variants = [variant] if isinstance(variant, str) else list(variant)
+            conditions.append(ds.field('variant').isin(variants))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def read(self, start_date=None, end_date=None, variant=None, columns=None):
+        """
+        Read events with dates in [start_date, end_date) as a DataFrame.
+
+        Parameters:
+        - start_date, end_date (datetime or str): date range, open ended if None.
+        - variant (str or list of str): variants to read, all if None.
+        - columns (list of str): columns to read, all if None.
+
+        Returns:
+        - data_df (DataFrame): events, with 'date' as datetime64 and the UUID key in attrs (see decode_userids).
+        """
+        dataset = self.dataset()
+        table = dataset.to_table(columns=columns, filter=self.filter_expression(start_date, end_date, variant))
+        return self.to_frame(table, dataset.schema.metadata)
+
+    def iter_batches(self, start_date=None, end_date=None, variant=None, columns=None, batch_size=1_000_000):
+        """
+        Same as read, but yields DataFrames of at most batch_size rows so memory stays bounded
+        """
+        dataset = self.dataset()
+        batches = dataset.to_batches(columns=columns, filter=self.filter_expression(start_date, end_date, variant),
+                                     batch_size=batch_size)
+        for batch in batches:
+            yield self.to_frame(pa.Table.from_batches([batch]), dataset.schema.metadata)
+
+    def to_frame(self, table, metadata):
+        data_df = table.to_pandas(date_as_object=False)
+        if 'variant' in data_df:
+            data_df['variant'] = data_df['variant'].astype(str)
+        if metadata and b'uuid_key' in metadata:
+            data_df.attrs['uuid_key'] = metadata[b'uuid_key'].decode()
+            data_df.attrs['num_users'] = int(metadata[b'num_users'])
+        return data_df
+
+def to_date(value):
+    return pd.Timestamp(value).date()
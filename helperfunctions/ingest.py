@@ -0,0 +1,131 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+from helperfunctions.assignment import Experiment
+
+def read_chunks(paths, chunksize=1_000_000, columns=None):
+    """
+    Read event files chunk by chunk.
+
+    Parameters:
+    - paths (str or list of str): CSV (.csv), JSON lines (.jsonl / .json) or Parquet (.parquet) files.
+    - chunksize (int): maximum number of rows per chunk.
+    - columns (list of str): columns to keep, all if None.
+
+    Yields:
+    - chunk (DataFrame): at most chunksize events, with 'date' parsed as datetime64 if present.
+    """
+    for path in [paths] if isinstance(paths, (str, os.PathLike)) else paths:
+        extension = os.path.splitext(str(path))[1].lower()
+        if extension == '.csv':
+            chunks = pd.read_csv(path, chunksize=chunksize, usecols=columns)
+        elif extension in ('.jsonl', '.json'):
+            chunks = pd.read_json(path, lines=True, chunksize=chunksize)
+        elif extension == '.parquet':
+            chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns))
+        else:
+            raise ValueError(f"unsupported event file type: {path}")
+
+        for chunk in chunks:
+            if columns is not None:
+                chunk = chunk[columns]
+            if 'date' in chunk:
+                chunk['date'] = pd.to_datetime(chunk['date'])
+            yield chunk
+
+def hash_variants(userids, salt='ingest', variants=('control', 'treatment')):
+    """
+    Deterministic equal split of userids into variants, see assignment.Experiment
+    """
+    return Experiment(salt, variants).assign_bulk(userids)
+
+class UserAggregates:
+    """
+    Per-user running totals of metrics for each variant, folded chunk by chunk.
+
+    Each chunk is reduced to per-user totals and buffered; the buffer is merged into the totals in one groupby
+    once it holds as many rows as the totals (and at least combine_rows), so a chunk costs O(chunk) amortized
+    rather than a rebuild of every user's totals, and integer metrics stay integers. Memory is bounded by
+    about twice the number of (variant, user) pairs, not by the number of events.
+    """
+
+    def __init__(self, metrics=('action_count',), assign=hash_variants, combine_rows=1_000_000):
+        self.metrics = list(metrics)
+        self.assign = assign
+        self.combine_rows = combine_rows
+        self.combined = pd.DataFrame(columns=self.metrics + ['events'],
+                                     index=pd.MultiIndex.from_arrays([[], []], names=['variant', 'userid']))
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def __repr__(self):
+        return f"UserAggregates({len(self.totals)} users, {self.rows} events)"
+
+    @property
+    def totals(self):
+        """
+        Totals (DataFrame indexed by (variant, userid), one column per metric plus 'events')
+        """
+        self.combine()
+        return self.combined
+
+    def update(self, chunk):
+        """
+        Fold a chunk of events into the totals. Chunks without a 'variant' column are assigned with self.assign.
+        """
+        if 'variant' not in chunk:
+            chunk = chunk.assign(variant=self.assign(chunk['userid'].to_numpy()))
+        grouped = chunk.groupby(['variant', 'userid'], observed=True)
+        chunk_totals = grouped[self.metrics].sum()
+        chunk_totals['events'] = grouped.size()
+        self.pending.append(chunk_totals)
+        self.pending_rows += len(chunk_totals)
+        self.rows += len(chunk)
+        if self.pending_rows >= max(len(self.combined), self.combine_rows):
+            self.combine()
+        return self
+
+    def combine(self):
+        """
+        Merge the buffered chunk totals into the totals
+        """
+        if not self.pending:
+            return
+        frames = self.pending if self.combined.empty else [self.combined] + self.pending
+        self.combined = pd.concat(frames).groupby(level=['variant', 'userid'], observed=True).sum()
+        self.pending = []
+        self.pending_rows = 0
+
+    def variants(self):
+        return list(self.totals.index.unique('variant'))
+
+    def per_user(self, variant, metric='action_count'):
+        """
+        Per-user totals of one metric, ready for msprt / fixedttest
+        """
+        return self.totals.loc[variant, metric]
+
+    def to_frame(self, variant):
+        """
+        One row per user with 'userid' and the metric totals, ready for welchtest
+        """
+        return self.totals.loc[variant].reset_index()
+
+def ingest(paths, metrics=('action_count',), chunksize=1_000_000, assign=hash_variants):
+    """
+    Stream event files into per-user aggregates.
+
+    Parameters:
+    - paths (str or list of str): event files with 'userid' and metric columns (and optionally 'variant').
+    - metrics (list of str): metric columns to aggregate.
+    - chunksize (int): maximum number of events held in memory at once.
+    - assign (callable): maps an array of userids to variant labels for files without a 'variant' column.
+
+    Returns:
+    - aggregates (UserAggregates)
+    """
+    aggregates = UserAggregates(metrics, assign)
+    for chunk in read_chunks(paths, chunksize):
+        aggregates.update(chunk)
+    return aggregates
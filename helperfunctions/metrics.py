@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+import helperfunctions.statistical_tests as st_funcs
+from helperfunctions.planner import day_index
+
+# per-event base columns every metric is built from; visits counts rows (one row per user visit)
+BASE_COLUMNS = ['action_count', 'visits', 'converted_visits']
+
+class Metric:
+    """
+    A metric as the ratio of two per-user totals of base columns.
+
+    Without a denominator the metric is the per-user total itself (the mean over users of numerator totals).
+    With one, it is sum(numerator) / sum(denominator) over users, analysed with the delta method.
+    """
+
+    def __init__(self, name, numerator, denominator=None):
+        self.name = name
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def __repr__(self):
+        return f"Metric({self.name} = {self.numerator}" + (f" / {self.denominator})" if self.denominator else ")")
+
+    @property
+    def is_ratio(self):
+        return self.denominator is not None
+
+METRICS = {
+    'action_count': Metric('action_count', 'action_count'),
+    'visits': Metric('visits', 'visits'),
+    'actions_per_visit': Metric('actions_per_visit', 'action_count', 'visits'),
+    'visit_conversion': Metric('visit_conversion', 'converted_visits', 'visits'),
+}
+
+def base_values(data):
+    """
+    (events x BASE_COLUMNS) array of the base columns of each event
+    """
+    action_count = data['action_count'].to_numpy(dtype=float)
+    return np.column_stack([action_count, np.ones(len(data)), action_count > 0])
+
+def group_sums(groups, values, num_groups):
+    """
+    Column sums of values (rows x k) within each group
+    """
+    return np.stack([np.bincount(groups, weights=column, minlength=num_groups) for column in values.T], axis=-1)
+
+class SufficientStats:
+    """
+    Cumulative per-user sufficient statistics of the base columns, per variant and day.
+
+    For every variant and day d, holds the number of users seen up to d, the sums of their per-user totals of
+    each base column and the cross-product matrix sum over users of totals x totals^T (sums of squares on the
+    diagonal). Built in one pass over the events: each day only the users active that day are touched.
+    Any Metric, ratio or not, is then analysed from these arrays alone, at any day, without the events.
+    """
+
+    def __init__(self, data, start_date=None, variant='variant'):
+        groups = data[variant] if variant in data else pd.Series('all', index=data.index)
+        group_codes, self.variants = pd.factorize(groups, sort=True)
+        self.variants = list(self.variants)
+        cells, cell_index = pd.factorize(pd.MultiIndex.from_arrays([group_codes, data['userid'].to_numpy()]))
+        cell_group = cell_index.get_level_values(0).to_numpy()
+
+        days = day_index(data, start_date)
+        keep = days >= 0
+        days, cells, values = days[keep], cells[keep], base_values(data)[keep]
+        order = np.argsort(days, kind='stable')
+        self.num_days = int(days.max()) + 1
+        bounds = np.searchsorted(days[order], np.arange(self.num_days + 1))
+        cells, values = cells[order], values[order]
+
+        num_groups, k = len(self.variants), len(BASE_COLUMNS)
+        totals = np.zeros((len(cell_group), k))
+        seen = np.zeros(len(cell_group), dtype=bool)
+        n = np.zeros(num_groups)
+        sums = np.zeros((num_groups, k))
+        cross = np.zeros((num_groups, k * k))
+        self.n = np.zeros((num_groups, self.num_days))
+        self.sums = np.zeros((num_groups, self.num_days, k))
+        self.cross = np.zeros((num_groups, self.num_days, k, k))
+
+        for day, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            touched, inverse = np.unique(cells[lo:hi], return_inverse=True)
+            increment = group_sums(inverse, values[lo:hi], len(touched))
+            old = totals[touched]
+            new = old + increment
+            group = cell_group[touched]
+            n += np.bincount(group, weights=~seen[touched], minlength=num_groups)
+            sums += group_sums(group, increment, num_groups)
+            cross += group_sums(group, (np.einsum('ui,uj->uij', new, new) - np.einsum('ui,uj->uij', old, old)).reshape(-1, k * k),
+                                num_groups)
+            totals[touched] = new
+            seen[touched] = True
+            self.n[:, day] = n
+            self.sums[:, day] = sums
+            self.cross[:, day] = cross.reshape(num_groups, k, k)
+
+    def __repr__(self):
+        return f"SufficientStats(variants={self.variants}, days={self.num_days}, users={self.n[:, -1].astype(int).tolist()})"
+
+    def moments(self, metric, variant, day=None):
+        """
+        Users, metric estimate and per-user (population) variance of a metric for one variant.
+
+        For ratio metrics the variance is the delta-method variance, so the estimate's variance is variance / users
+        in both cases.
+
+        Parameters:
+        - metric (Metric or str): a Metric or a key of METRICS.
+        - variant (str): variant label.
+        - day (int): day index (0 = first day); every day as arrays if None.
+
+        Returns:
+        - (users, estimate, variance)
+        """
+        metric = METRICS[metric] if isinstance(metric, str) else metric
+        g = self.variants.index(variant)
+        days = slice(None) if day is None else day
+        n, sums, cross = self.n[g, days], self.sums[g, days], self.cross[g, days]
+        x = BASE_COLUMNS.index(metric.numerator)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = sums[..., x] / n
+            var_x = cross[..., x, x] / n - mean_x ** 2
+            if not metric.is_ratio:
+                return n, mean_x, var_x
+            y = BASE_COLUMNS.index(metric.denominator)
+            mean_y = sums[..., y] / n
+            var_y = cross[..., y, y] / n - mean_y ** 2
+            cov_xy = cross[..., x, y] / n - mean_x * mean_y
+            return n, mean_x / mean_y, st_funcs.delta_method_variance(mean_x, mean_y, var_x, var_y, cov_xy)
+
+def welch(stats, metric, alpha=0.05, control='control', treatment='treatment', day=-1):
+    """
+    Welch's t-test and t-interval (same as fixedttest) of a metric on one day's cumulative statistics
+
+    Returns:
+    - dict with mean_c, mean_t, delta, relative_lift, p_value, ci_lower and ci_upper
+    """
+    n_c, mean_c, var_c = stats.moments(metric, control, day)
+    n_t, mean_t, var_t = stats.moments(metric, treatment, day)
+    delta = mean_t - mean_c
+    # sample variances
+    var_c, var_t = var_c * n_c / (n_c - 1), var_t * n_t / (n_t - 1)
+    _, p_value = st_funcs.welch_from_stats(delta, var_c, n_c, var_t, n_t)
+    ci_lower, ci_upper = st_funcs.ttest_interval(delta, var_c, n_c, var_t, n_t, alpha)
+    return {'mean_c': mean_c, 'mean_t': mean_t, 'delta': delta, 'relative_lift': delta / mean_c,
+            'p_value': p_value, 'ci_lower': ci_lower, 'ci_upper': ci_upper}
+
+def msprt_ci(stats, metric, alpha=0.05, control='control', treatment='treatment'):
+    """
+    mSPRT on the cumulative per-user metric, peeking once per day, with every peek computed at once
+
+    Returns:
+    - (significant, day, lower CI bound, upper CI bound, mean difference), as statistical_tests.msprt_ci
+    """
+    n_c, mean_c, var_c = stats.moments(metric, control)
+    n_t, mean_t, var_t = stats.moments(metric, treatment)
+    delta = mean_t - mean_c
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ci_l, ci_u = st_funcs.msprt_interval(delta, var_c, n_c, var_t, n_t, alpha)
+    significant = np.flatnonzero((ci_l > 0) | (ci_u < 0))
+    day = significant[0] if len(significant) else stats.num_days - 1
+    return int(len(significant) > 0), int(day) + 1, ci_l[day], ci_u[day], delta[day]
+
+def group_sequential_ci(stats, metric, alpha=0.05, looks=5, spending='obrien-fleming', control='control',
+                        treatment='treatment'):
+    """
+    Group-sequential test with alpha spending on the cumulative per-user metric, looking at equally spaced days
+
+    Returns:
+    - (significant, day, lower CI bound, upper CI bound, mean difference), as statistical_tests.group_sequential_ci
+    """
+    days = st_funcs.look_days(stats.num_days, looks) - 1
+    boundaries = st_funcs.group_sequential_boundaries(len(days), alpha, spending)
+    n_c, mean_c, var_c = stats.moments(metric, control)
+    n_t, mean_t, var_t = stats.moments(metric, treatment)
+    delta = mean_t[days] - mean_c[days]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ci_l, ci_u = st_funcs.group_sequential_interval(delta, var_c[days], n_c[days], var_t[days], n_t[days], boundaries)
+    significant = np.flatnonzero((ci_l > 0) | (ci_u < 0))
+    look = significant[0] if len(significant) else len(days) - 1
+    return int(len(significant) > 0), int(days[look]) + 1, ci_l[look], ci_u[look], delta[look]
+
+def window_moments(stats, metric, weeks, variant='all'):
+    """
+    Users, estimate and sample variance (ddof=1) of a metric over the first k weeks, for every k in weeks,
+    in the layout of planner.window_moments
+    """
+    weeks = np.atleast_1d(weeks)
+    days = np.minimum(7 * weeks, stats.num_days) - 1
+    n, mean, var = stats.moments(metric, variant)
+    n, mean, var = n[days], mean[days], var[days]
+    return pd.DataFrame({'users': n.astype(np.int64), 'mean': mean, 'variance': var * n / (n - 1)}, index=weeks)
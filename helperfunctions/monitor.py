@@ -0,0 +1,326 @@
+"""
+Live monitoring of many running experiments from a streaming event feed.
+
+An event source is an async iterator of event batches (DataFrames with 'experiment', 'variant' and
+'action_count' columns). ExperimentMonitor.run() reads the source in one task and analyses in another:
+the ingest task only appends batches to an unbounded queue, so it never waits for analysis. The analysis
+task folds each batch into per-variant running statistics (one SequentialTest per experiment, so memory
+does not grow with the number of events) and every `refresh` seconds peeks at each experiment that received
+new events. mSPRT stays valid under continuous monitoring, so every peek can stop an experiment.
+
+    monitor = ExperimentMonitor(refresh=1.0, on_decision=print)
+    asyncio.run(monitor.run(simulated_source(users, {'exp_1': 0.1, 'exp_2': 0.0}, datetime(2024, 1, 1), days=28)))
+    monitor.summary()
+
+CLI:
+    python -m helperfunctions.monitor --experiments 24 --days 28 --seconds-per-day 0.5
+    python -m helperfunctions.monitor --tail events.jsonl
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import helperfunctions.data_gen_funcs as gen_funcs
+import helperfunctions.statistical_tests as st_funcs
+from helperfunctions.assignment import Experiment
+from helperfunctions.rng import child_seed, generator, resolve_seed
+
+class MonitoredExperiment:
+    """
+    Running state of one experiment: an mSPRT on the events of its control and treatment
+    """
+
+    def __init__(self, name, alpha=0.05, control='control', treatment='treatment'):
+        self.name = name
+        self.control = control
+        self.treatment = treatment
+        self.test = st_funcs.SequentialTest(alpha)
+        self.status = 'running'
+        self.events = 0
+        self.ignored = 0
+        self.dirty = False
+        self.decision = None
+
+    def __repr__(self):
+        return f"MonitoredExperiment({self.name}, status={self.status}, events={self.events})"
+
+    def update(self, variant, n, mean, m2):
+        """
+        Fold a pre-aggregated batch of one variant into the running statistics
+        """
+        if self.status != 'running' or variant not in (self.control, self.treatment):
+            self.ignored += int(n)
+            return
+        batch = (n, mean, m2)
+        self.test.update_stats(control=batch if variant == self.control else None,
+                               treatment=batch if variant == self.treatment else None)
+        self.events += int(n)
+        self.dirty = True
+
+    def peek(self, min_samples=100, max_samples=None):
+        """
+        Peek at the test if there are new events and enough of them
+
+        Returns:
+        - decision (dict): experiment, decision ('stop' or 'continue'), significant, events per variant,
+          mean difference, confidence interval and peek time; None if there was nothing to peek at
+        """
+        if not self.dirty or min(self.test.control.n, self.test.treatment.n) < min_samples:
+            return None
+        self.dirty = False
+        significant, ci_l, ci_u, e = self.test.peek()
+        exhausted = max_samples is not None and min(self.test.control.n, self.test.treatment.n) >= max_samples
+        # an undefined interval (e.g. no variance yet) says nothing, so it never stops the experiment
+        defined = bool(np.isfinite(ci_l) and np.isfinite(ci_u))
+        self.decision = {
+            'experiment': self.name,
+            'decision': 'stop' if defined and (significant or exhausted) else 'continue',
+            'significant': bool(significant),
+            'n_c': self.test.control.n,
+            'n_t': self.test.treatment.n,
+            'mean_difference': e,
+            'ci_lower': ci_l,
+            'ci_upper': ci_u,
+            'peeks': self.test.peeks,
+            'time': time.time(),
+        }
+        if self.decision['decision'] == 'stop':
+            self.status = 'stopped'
+        return self.decision
+
+def aggregate(batch):
+    """
+    (experiment, variant) -> (n, mean, m2) of action_count in a batch of events
+    """
+    grouped = batch.groupby(['experiment', 'variant'], observed=True, sort=False)['action_count']
+    n = grouped.count()
+    return pd.DataFrame({'n': n, 'mean': grouped.mean(), 'm2': grouped.var(ddof=0) * n})
+
+class ExperimentMonitor:
+    """
+    Monitors any number of experiments from one event source, see the module docstring.
+
+    Parameters:
+    - alpha (float): significance level of every experiment's mSPRT.
+    - refresh (float): seconds between peeks; each peek only touches experiments with new events.
+    - min_samples (int): events needed in both variants before the first peek.
+    - max_samples (int): events per variant after which an experiment stops without an effect, None for no limit.
+    - on_decision (callable): called with every decision dict as soon as it is made.
+
+    self.decisions only receives the decisions that change an experiment's state (its first decision and
+    its stop), so it stays bounded by twice the number of experiments even if nobody reads it.
+    """
+
+    def __init__(self, alpha=0.05, refresh=1.0, min_samples=100, max_samples=None, on_decision=None,
+                 control='control', treatment='treatment'):
+        self.alpha = alpha
+        self.refresh = refresh
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.on_decision = on_decision
+        self.control = control
+        self.treatment = treatment
+        self.experiments = {}
+        self.decisions = asyncio.Queue()
+        self.batches = 0
+
+    def __repr__(self):
+        running = sum(experiment.status == 'running' for experiment in self.experiments.values())
+        return f"ExperimentMonitor({len(self.experiments)} experiments, {running} running, {self.batches} batches)"
+
+    def experiment(self, name):
+        """
+        State of an experiment, registered on first use
+        """
+        if name not in self.experiments:
+            self.experiments[name] = MonitoredExperiment(name, self.alpha, self.control, self.treatment)
+        return self.experiments[name]
+
+    def ingest(self, batch):
+        """
+        Fold one batch of events into the running statistics (no peeking)
+        """
+        self.batches += 1
+        totals = aggregate(batch)
+        for (name, variant), (n, mean, m2) in zip(totals.index, totals.to_numpy()):
+            self.experiment(name).update(variant, n, mean, m2)
+
+    def peek(self):
+        """
+        Peek at every experiment with new events and publish the decisions
+        """
+        for experiment in self.experiments.values():
+            previous = experiment.decision
+            decision = experiment.peek(self.min_samples, self.max_samples)
+            if decision is None:
+                continue
+            if previous is None or previous['decision'] != decision['decision']:
+                self.decisions.put_nowait(decision)
+            if self.on_decision is not None:
+                self.on_decision(decision)
+
+    async def read(self, source, queue):
+        try:
+            async for batch in source:
+                queue.put_nowait(batch)
+        finally:
+            # also when the source raises or is cancelled, so the analysis task never waits forever
+            queue.put_nowait(None)
+
+    async def analyze(self, queue):
+        loop = asyncio.get_running_loop()
+        finished = False
+        while not finished:
+            deadline = loop.time() + self.refresh
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    batch = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if batch is None:
+                    finished = True
+                    break
+                self.ingest(batch)
+            self.peek()
+
+    async def run(self, source):
+        """
+        Monitor until the source is exhausted and every batch is analysed; returns the summary.
+        A None is put on self.decisions at the end, so consumers of the queue know when to stop.
+        If the source raises, the batches read before the error are analysed and the error is re-raised.
+        """
+        queue = asyncio.Queue()
+        reader = asyncio.create_task(self.read(source, queue))
+        try:
+            await self.analyze(queue)
+            # the source's exception, if any
+            await reader
+        finally:
+            reader.cancel()
+            self.decisions.put_nowait(None)
+        return self.summary()
+
+    def summary(self):
+        """
+        One row per experiment with its status, events and latest decision
+        """
+        rows = []
+        for name, experiment in self.experiments.items():
+            row = {'experiment': name, 'status': experiment.status, 'events': experiment.events,
+                   'ignored': experiment.ignored}
+            if experiment.decision is not None:
+                row.update({key: value for key, value in experiment.decision.items() if key != 'experiment'})
+            rows.append(row)
+        return pd.DataFrame(rows).set_index('experiment') if rows else pd.DataFrame()
+
+async def simulated_source(user_data, lifts, start_date, days, param=2, min_per_day=200, seconds_per_day=1.0,
+                           batches_per_day=10, seed=None):
+    """
+    Event feed simulated with the data generator: every experiment's events of a day are generated at once
+    (in a worker thread, so the event loop keeps running) and released in batches spread over seconds_per_day.
+
+    Parameters:
+    - user_data (DataFrame): users from data_gen_funcs.create_user_dataset, shared by every experiment.
+    - lifts (dict): relative lift of the treatment of each experiment, e.g. {'checkout': 0.05, 'banner': 0.0}.
+    - start_date (datetime): first day of the feed.
+    - days (int): number of days.
+    - param (float): Poisson parameter of control.
+    - min_per_day (int): minimum rows per day of each experiment, see generate_experiment_dataframe.
+    - seconds_per_day (float): wall time one simulated day takes.
+    - batches_per_day (int): batches each day is released in.
+    - seed (int): seed of the events, random if None.
+
+    Yields:
+    - batch (DataFrame): events with 'experiment', 'variant', 'userid', 'action_count' and 'date' columns.
+    """
+    seed = resolve_seed(seed)
+    experiments = {name: Experiment(name, salt=(seed, name)) for name in lifts}
+
+    def generate_day(date):
+        frames = []
+        for name, experiment in experiments.items():
+            params = {'control': param, 'treatment': param * (1 + lifts[name])}
+            frame = gen_funcs.generate_experiment_dataframe(date, date, user_data, experiment, params,
+                                                            min_per_day=min_per_day, seed=child_seed(seed, name))
+            frame.insert(0, 'experiment', name)
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+
+    rng = generator(seed, 'feed_order')
+    for day in range(days):
+        events = await asyncio.to_thread(generate_day, start_date + timedelta(days=day))
+        # interleave the experiments' events, as a live feed would
+        events = events.iloc[rng.permutation(len(events))]
+        for batch in np.array_split(np.arange(len(events)), batches_per_day):
+            await asyncio.sleep(seconds_per_day / batches_per_day)
+            yield events.iloc[batch]
+
+async def tail_source(path, poll_interval=0.5, idle_timeout=None, from_start=True):
+    """
+    Event feed from a JSON lines file that another process appends to, one event per line with
+    'experiment', 'variant' and 'action_count' fields.
+
+    Parameters:
+    - path (str): file to follow.
+    - poll_interval (float): seconds between checks for new lines.
+    - idle_timeout (float): stop after this many seconds without new lines, follow forever if None.
+    - from_start (bool): also read the lines already in the file.
+
+    Yields:
+    - batch (DataFrame): the complete lines appended since the previous batch.
+    """
+    idle = 0.0
+    pending = ''
+    with open(path) as f:
+        if not from_start:
+            f.seek(0, 2)
+        while idle_timeout is None or idle < idle_timeout:
+            # file reads block, so they run in a worker thread to keep the event loop responsive
+            chunk = await asyncio.to_thread(f.read)
+            lines = (pending + chunk).split('\n')
+            # the last piece is an incomplete line (or '') until its newline is written
+            pending = lines.pop()
+            records = [json.loads(line) for line in lines if line.strip()]
+            if records:
+                idle = 0.0
+                yield pd.DataFrame.from_records(records)
+            else:
+                idle += poll_interval
+                await asyncio.sleep(poll_interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monitor running experiments from a live event feed.")
+    parser.add_argument('--tail', help="follow this JSON lines event file instead of simulating a feed")
+    parser.add_argument('--idle-timeout', type=float, default=10.0, help="--tail: stop after this many idle seconds")
+    parser.add_argument('--experiments', type=int, default=24, help="simulated experiments (lifts 0% to 10%)")
+    parser.add_argument('--users', type=int, default=75000, help="simulated users")
+    parser.add_argument('--days', type=int, default=28, help="simulated days")
+    parser.add_argument('--seconds-per-day', type=float, default=0.5, help="wall time of one simulated day")
+    parser.add_argument('--refresh', type=float, default=1.0, help="seconds between peeks")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.tail:
+        source = tail_source(args.tail, idle_timeout=args.idle_timeout)
+    else:
+        lifts = {f'experiment_{i}': lift for i, lift in enumerate(np.linspace(0, 0.1, args.experiments))}
+        users = gen_funcs.create_user_dataset(args.users, seed=args.seed)
+        source = simulated_source(users, lifts, datetime(2024, 1, 1), args.days,
+                                  seconds_per_day=args.seconds_per_day, seed=args.seed)
+
+    def report(decision):
+        if decision['decision'] == 'stop':
+            print(f"{datetime.fromtimestamp(decision['time']):%H:%M:%S} stop {decision['experiment']}: "
+                  f"difference {decision['mean_difference']:.3f} "
+                  f"[{decision['ci_lower']:.3f}, {decision['ci_upper']:.3f}] after {decision['peeks']} peeks", flush=True)
+
+    monitor = ExperimentMonitor(refresh=args.refresh, on_decision=report)
+    summary = asyncio.run(monitor.run(source))
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(summary)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Headless generate -> plan -> analyze pipeline, the same steps as pages/1_Run_A_Test.py without Streamlit.
+
+Library:
+    results = run_experiments([{'usercount': 75000, 'true_effect': 10, 'test_type': 'sequential'}], max_workers=4)
+    write_results(results, 'results.parquet')
+
+CLI:
+    python -m helperfunctions.pipeline specs.json --output results.parquet --workers 4 --grid seed=1,2,3
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import pandas as pd
+import helperfunctions.data_gen_funcs as gen_funcs
+import helperfunctions.statistical_tests as st_funcs
+import helperfunctions.assignment as assignment
+import helperfunctions.cuped as cuped
+import helperfunctions.metrics as metrics
+import helperfunctions.planner as planner
+import helperfunctions.userpool as userpool
+from helperfunctions.cube import UserDayCube
+
+# same dates and control parameter as the Run A Test page
+PRE_START = datetime(2023, 1, 1)
+PRE_END = datetime(2023, 12, 31)
+TEST_START = datetime(2024, 1, 1)
+PARAM = 2
+TEST_MIN_PER_DAY = 200
+
+DEFAULT_SPEC = {
+    'usercount': 75000,       # registrants
+    'min_dau': 100,           # minimum DAU of the pre-period
+    'mde': 5,                 # minimum detectable effect (%)
+    'true_effect': 10,        # simulated relative lift (%)
+    'test_type': 'fixed',     # 'fixed' (Welch's t-test), 'sequential' (mSPRT) or 'group_sequential' (alpha spending)
+    'seed': 42,
+    'weeks': 1,               # weeks of pre-period used for the sample mean / variance
+    'metric': 'action_count', # a key of metrics.METRICS
+    'cuped': False,           # action_count only
+    'realistic': False,       # realistic traffic (see data_gen_funcs.generate_realistic_dataframe)
+    'novelty': 0.0,           # realistic traffic only, see activities.effect_curve
+    'alpha': 0.05,
+    'looks': 5,               # group_sequential only: equally spaced looks
+    'spending': 'obrien-fleming', # group_sequential only: a key of statistical_tests.SPENDING_FUNCTIONS
+}
+TEST_TYPES = ('fixed', 'sequential', 'group_sequential')
+
+def make_spec(spec=None, **overrides):
+    """
+    Complete spec with DEFAULT_SPEC and check it
+    """
+    spec = dict(DEFAULT_SPEC, **(spec or {}), **overrides)
+    unknown = set(spec) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"unknown spec fields: {sorted(unknown)}")
+    if spec['test_type'] not in TEST_TYPES:
+        raise ValueError(f"test_type must be one of {TEST_TYPES}, got {spec['test_type']}")
+    if spec['metric'] not in metrics.METRICS:
+        raise ValueError(f"unknown metric: {spec['metric']}")
+    if spec['spending'] not in st_funcs.SPENDING_FUNCTIONS:
+        raise ValueError(f"unknown spending function: {spec['spending']}")
+    return spec
+
+def generate_pre_period(spec):
+    """
+    Pre-period (2023) events of a spec, the same as the page's load_events
+    """
+    if spec['realistic']:
+        pool = userpool.UserPool(spec['usercount'], seed=spec['seed'])
+        return gen_funcs.generate_realistic_dataframe(PRE_START, PRE_END, pool,
+                                                      visit_scale=gen_funcs.realistic_visit_scale(pool, spec['min_dau']),
+                                                      seed=(spec['seed'], 0))
+    users = gen_funcs.create_user_dataset(spec['usercount'], seed=spec['seed'])
+    return gen_funcs.generate_main_dataframe(PRE_START, PRE_END, users, param=PARAM, min_per_day=spec['min_dau'],
+                                             seed=(spec['seed'], 0))
+
+def generate_test_period(spec, days):
+    """
+    Experiment events of a spec over days days from TEST_START, the same as the page's load_experiment_events
+    """
+    seed = spec['seed']
+    end_date = TEST_START + timedelta(days=int(days))
+    experiment = assignment.Experiment('run_a_test', salt=seed)
+    params = {'control': PARAM, 'treatment': PARAM * (1 + spec['true_effect'] / 100)}
+    if spec['realistic']:
+        pool = userpool.UserPool(spec['usercount'], seed=seed)
+        return gen_funcs.generate_realistic_dataframe(TEST_START, end_date, pool, experiment,
+                                                      {'treatment': spec['true_effect'] / 100}, novelty=spec['novelty'],
+                                                      visit_scale=gen_funcs.realistic_visit_scale(pool, TEST_MIN_PER_DAY),
+                                                      seed=(seed, 1))
+    users = gen_funcs.create_user_dataset(spec['usercount'], seed=seed)
+    return gen_funcs.generate_experiment_dataframe(TEST_START, end_date, users, experiment, params,
+                                                   min_per_day=TEST_MIN_PER_DAY, seed=(seed, 1))
+
+def plan(spec, pre_data):
+    """
+    Sample size per variant and test duration from the pre-period
+
+    With CUPED, the sample size is planned on the variance left after the adjustment, (1 - rho^2) * variance
+    (see cuped.variance_reduction).
+
+    Returns:
+    - dict with sample_mean, sample_variance, variance_reduction (rho^2, 0 without CUPED), users_per_variant,
+      days_to_sample_size (None if never reached) and days_run (at least 7)
+    """
+    rho2 = 0.0
+    if spec['metric'] in pre_data:
+        cube = UserDayCube(pre_data, spec['metric'], PRE_START)
+        moments = cube.window_moments([spec['weeks']])
+        if spec['cuped'] and spec['metric'] == 'action_count':
+            rho2 = cuped.variance_reduction(cube, spec['weeks'])
+    else:
+        moments = metrics.window_moments(metrics.SufficientStats(pre_data, PRE_START), spec['metric'], [spec['weeks']])
+    mean, variance = moments['mean'].iloc[0], moments['variance'].iloc[0]
+    n = int(planner.sample_size((1 - rho2) * variance, mean, spec['mde'] / 100))
+
+    curve = planner.cumulative_unique_users(pre_data, PRE_START)
+    days = planner.days_to_reach(curve, 2 * n)
+    days_run = int(curve['days_from_experiment_start'].max()) if days is None else days
+    return {'sample_mean': float(mean), 'sample_variance': float(variance), 'variance_reduction': rho2, 'users_per_variant': n,
+            'days_to_sample_size': days, 'days_run': max(days_run, 7)}
+
+def analyze(spec, data, covariates=None):
+    """
+    Test the experiment events with the spec's test type
+
+    Every metric is tested on its cumulative per-user totals (metrics.SufficientStats); with covariates
+    (action_count only), on the CUPED-adjusted per-user totals.
+
+    Returns:
+    - dict with significant plus mean_c, mean_t, relative_lift, p_value (fixed) or
+      stop_day, ci_lower, ci_upper, mean_difference (sequential and group_sequential)
+    """
+    control = data[data['variant'] == 'control']
+    treatment = data[data['variant'] == 'treatment']
+    metric, alpha = spec['metric'], spec['alpha']
+    stats = metrics.SufficientStats(data, TEST_START) if covariates is None else None
+
+    if spec['test_type'] == 'sequential':
+        if covariates is not None:
+            result, day, ci_l, ci_u, e = st_funcs.user_msprt_ci(control, treatment, alpha, covariates=covariates)
+        else:
+            result, day, ci_l, ci_u, e = metrics.msprt_ci(stats, metric, alpha)
+    elif spec['test_type'] == 'group_sequential':
+        looks, spending = spec['looks'], spec['spending']
+        if covariates is not None:
+            result, day, ci_l, ci_u, e = st_funcs.user_group_sequential_ci(control, treatment, alpha, looks, spending,
+                                                                           covariates=covariates)
+        else:
+            result, day, ci_l, ci_u, e = metrics.group_sequential_ci(stats, metric, alpha, looks, spending)
+    if spec['test_type'] != 'fixed':
+        return {'significant': bool(result), 'stop_day': int(day), 'ci_lower': float(ci_l), 'ci_upper': float(ci_u),
+                'mean_difference': float(e)}
+
+    if covariates is not None:
+        mean_c, mean_t, relative_lift, p_value = st_funcs.welchtest(control, treatment, alpha, covariates=covariates)
+    else:
+        welch = metrics.welch(stats, metric, alpha)
+        mean_c, mean_t, relative_lift, p_value = welch['mean_c'], welch['mean_t'], welch['relative_lift'], welch['p_value']
+    return {'significant': bool(p_value < alpha), 'mean_c': float(mean_c), 'mean_t': float(mean_t),
+            'relative_lift': float(relative_lift), 'p_value': float(p_value)}
+
+def run_experiment(spec):
+    """
+    Run one spec through generate -> plan -> analyze
+
+    Returns:
+    - result (dict): the complete spec, the plan, the test result and runtime_s
+    """
+    started = time.perf_counter()
+    spec = make_spec(spec)
+    pre_data = generate_pre_period(spec)
+    result = dict(spec, **plan(spec, pre_data))
+
+    use_cuped = spec['cuped'] and spec['metric'] == 'action_count'
+    covariates = cuped.CovariateTable(pre_data, spec['metric']) if use_cuped else None
+    del pre_data
+    data = generate_test_period(spec, result['days_run'])
+    result.update(analyze(spec, data, covariates))
+    result['runtime_s'] = time.perf_counter() - started
+    return result
+
+def run_experiments(specs, max_workers=None, progress=None):
+    """
+    Run many specs, concurrently in a process pool.
+
+    Every spec is seeded, so results only depend on the specs, not on the number of workers.
+
+    Parameters:
+    - specs (list of dict): experiment specs, missing fields are taken from DEFAULT_SPEC.
+    - max_workers (int): size of the process pool; 1 runs in this process.
+    - progress (callable): called as progress(specs_done, len(specs)) after each spec.
+
+    Returns:
+    - results (DataFrame): one row per spec, in the order of specs.
+    """
+    specs = [make_spec(spec) for spec in specs]
+    results = [None] * len(specs)
+    done = 0
+
+    def collect(i, result):
+        nonlocal done
+        results[i] = result
+        done += 1
+        if progress is not None:
+            progress(done, len(specs))
+
+    if max_workers == 1:
+        for i, spec in enumerate(specs):
+            collect(i, run_experiment(spec))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(run_experiment, spec): i for i, spec in enumerate(specs)}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+    return pd.DataFrame(results)
+
+def write_results(results, path):
+    """
+    Write results as Parquet (.parquet) or JSON records (.json / .jsonl)
+    """
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension == '.parquet':
+        results.to_parquet(path, index=False)
+    elif extension == '.json':
+        results.to_json(path, orient='records', indent=2)
+    elif extension == '.jsonl':
+        results.to_json(path, orient='records', lines=True)
+    else:
+        raise ValueError(f"unsupported results file type: {path}")
+
+def read_specs(path):
+    """
+    Specs from a JSON file (one spec or a list of specs) or a JSON lines file (one spec per line)
+    """
+    with open(path) as f:
+        if str(path).endswith('.jsonl'):
+            return [json.loads(line) for line in f if line.strip()]
+        specs = json.load(f)
+    return specs if isinstance(specs, list) else [specs]
+
+def expand_grid(specs, grid):
+    """
+    Every spec combined with every combination of the grid values, e.g. grid={'seed': [1, 2], 'mde': [1, 5]}
+    """
+    keys = list(grid)
+    return [dict(spec, **dict(zip(keys, values))) for spec in specs for values in itertools.product(*grid.values())]
+
+def parse_value(value):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run A/B test simulations without Streamlit.")
+    parser.add_argument('specs', nargs='?', help="JSON / JSON lines file of experiment specs (defaults only if omitted)")
+    parser.add_argument('-o', '--output', default='results.json', help="results file, .json, .jsonl or .parquet")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="process pool size (1 runs serially)")
+    parser.add_argument('--grid', action='append', default=[], metavar='FIELD=V1,V2,...',
+                        help="sweep a spec field over values; repeat for a full factorial")
+    args = parser.parse_args(argv)
+
+    specs = read_specs(args.specs) if args.specs else [{}]
+    grid = {}
+    for item in args.grid:
+        field, _, values = item.partition('=')
+        grid[field] = [parse_value(value) for value in values.split(',')]
+    specs = expand_grid(specs, grid)
+
+    def progress(done, total):
+        print(f"{done}/{total} experiments done", file=sys.stderr)
+
+    results = run_experiments(specs, max_workers=args.workers, progress=progress)
+    write_results(results, args.output)
+    print(f"wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from helperfunctions.sketches import HyperLogLog
+from helperfunctions.cube import UserDayCube
+
+def day_index(data_df, start_date=None):
+    """
+    Day of each event counted from start_date (the first date in data_df if None), starting at 0
+    """
+    start_date = data_df['date'].min() if start_date is None else pd.Timestamp(start_date)
+    return (data_df['date'] - start_date).dt.days.to_numpy()
+
+def first_seen_days(data_df, start_date=None):
+    """
+    First day index (0 = start_date) each user appears on, indexed by userid
+    """
+    return pd.Series(day_index(data_df, start_date), index=data_df['userid'].to_numpy()).groupby(level=0).min()
+
+def cumulative_unique_users(data_df, start_date=None, sketch=False, precision=14):
+    """
+    Number of distinct users seen from start_date up to each day.
+
+    Exact counts come from each user's first-seen day (one pass over the events). With sketch=True the
+    curve is built from per-day HyperLogLog sketches instead, in constant memory per day.
+
+    Parameters:
+    - data_df (DataFrame): events with 'userid' and 'date' columns.
+    - start_date (datetime): day 1 of the curve, the first date in data_df if None.
+    - sketch (bool): approximate the counts with HyperLogLog.
+    - precision (int): HyperLogLog precision.
+
+    Returns:
+    - curve (DataFrame): 'days_from_experiment_start' (1 = start_date) and 'unique_users' columns.
+    """
+    days = day_index(data_df, start_date)
+    num_days = days.max() + 1
+    if sketch:
+        order = np.argsort(days, kind='stable')
+        bounds = np.searchsorted(days[order], np.arange(num_days + 1))
+        userids = data_df['userid'].to_numpy()[order]
+        running = HyperLogLog(precision)
+        unique_users = [running.add(userids[lo:hi]).count() for lo, hi in zip(bounds[:-1], bounds[1:])]
+        unique_users = np.round(unique_users).astype(np.int64)
+    else:
+        first_seen = first_seen_days(data_df, start_date)
+        unique_users = np.cumsum(np.bincount(first_seen[first_seen >= 0], minlength=num_days))
+
+    return pd.DataFrame({'days_from_experiment_start': np.arange(1, num_days + 1), 'unique_users': unique_users})
+
+def days_to_reach(curve, target):
+    """
+    First day on which the unique user curve reaches target, None if it never does
+    """
+    day = np.searchsorted(curve['unique_users'].to_numpy(), target, side='left')
+    return int(curve['days_from_experiment_start'].iloc[day]) if day < len(curve) else None
+
+def window_moments(data_df, weeks, start_date=None, metric='action_count'):
+    """
+    Sample mean and variance of the per-user metric sum over the first k weeks, for every k in weeks.
+
+    Events are loaded once into a UserDayCube, and each window is a prefix of it (O(users) per window).
+
+    Returns:
+    - moments (DataFrame): indexed by weeks with 'users', 'mean' and 'variance' (ddof=1) columns.
+    """
+    return UserDayCube(data_df, metric, start_date).window_moments(weeks)
+
+def sample_size(variance, mean, mde):
+    """
+    van Belle (2002) sample size per variant for .8 power and .05 alpha: n = 16 sigma^2 / delta^2,
+    with delta = mean * mde (relative MDE). Works elementwise on arrays.
+    """
+    return np.round(16 * np.asarray(variance) / (np.asarray(mean) * np.asarray(mde)) ** 2).astype(np.int64)
+
+def sample_size_grid(moments, mdes):
+    """
+    Sample size per variant for every (weeks, MDE) pair, in one broadcasted call.
+
+    Parameters:
+    - moments (DataFrame): output of window_moments.
+    - mdes (array): relative MDEs, e.g. [0.01, 0.02, 0.05].
+
+    Returns:
+    - grid (DataFrame): weeks x MDE table of users needed per variant.
+    """
+    mdes = np.atleast_1d(mdes)
+    n = sample_size(moments['variance'].to_numpy()[:, None], moments['mean'].to_numpy()[:, None], mdes[None, :])
+    return pd.DataFrame(n, index=moments.index, columns=pd.Index(mdes, name='mde'))
+
+def duration_grid(grid, curve):
+    """
+    Days needed to reach 2 * n unique users (both variants) for every cell of a sample size grid (NaN if never)
+    """
+    unique_users = curve['unique_users'].to_numpy()
+    day = np.searchsorted(unique_users, 2 * grid.to_numpy(), side='left')
+    days = np.where(day < len(unique_users), curve['days_from_experiment_start'].to_numpy()[np.minimum(day, len(unique_users) - 1)], np.nan)
+    return pd.DataFrame(days, index=grid.index, columns=grid.columns)
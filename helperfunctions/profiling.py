@@ -0,0 +1,266 @@
+"""
+Lightweight timing instrumentation for the pipeline stages.
+
+Functions decorated with @profiled (and blocks wrapped in `with stage(name)`) record their latency, the
+number of rows they return and the change in process RSS, but only while profiling is on: either globally
+(enable() / disable(), records go to a process-wide registry) or for the calls made by one thread inside
+`with capture() as run:` (records go to run.records, e.g. one Streamlit rerun). When nothing is on, the
+only cost per call is one check of a module-level counter.
+
+    with profiling.capture() as run:
+        data_df = gen_funcs.generate_main_dataframe(...)
+    run.summary()                       # calls, total / self time, rows and RSS change per function
+    run.export_trace('trace.json')      # open in chrome://tracing or https://ui.perfetto.dev
+"""
+import functools
+import json
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# number of active captures, plus one while enabled globally; 0 means every profiled call goes straight through
+_active = 0
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_registry = []
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _page_size
+    except OSError:
+        return None
+
+def count_rows(result):
+    """
+    Rows of a result: len of a DataFrame, Series or array, summed over a tuple of them; None otherwise
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(result)
+    if isinstance(result, tuple):
+        counts = [count_rows(item) for item in result]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+def enable():
+    """
+    Record every profiled call, in every thread, into the process-wide registry
+    """
+    global _active, _enabled
+    with _lock:
+        if not _enabled:
+            _enabled = True
+            _active += 1
+
+def disable():
+    global _active, _enabled
+    with _lock:
+        if _enabled:
+            _enabled = False
+            _active -= 1
+
+def reset():
+    """
+    Clear the process-wide registry
+    """
+    with _lock:
+        _registry.clear()
+
+def records():
+    """
+    Records of the process-wide registry, oldest first
+    """
+    with _lock:
+        return list(_registry)
+
+class Span:
+    """
+    One timed call or block; set span.rows inside a stage to report how many rows it handled
+    """
+
+    def __init__(self, name, sink):
+        self.name = name
+        self.sink = sink
+        self.rows = None
+        self.child_time = 0.0
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self.depth = len(stack)
+        stack.append(self)
+        self.rss = current_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        rss = current_rss()
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        record = {
+            'name': self.name,
+            'start_s': self.start,
+            'duration_s': duration,
+            'self_s': duration - self.child_time,
+            'rows': self.rows,
+            'rss_delta_mb': (rss - self.rss) / 2**20 if rss is not None and self.rss is not None else None,
+            'depth': self.depth,
+            'thread': threading.get_ident(),
+        }
+        if self.sink is _registry:
+            with _lock:
+                _registry.append(record)
+        else:
+            self.sink.append(record)
+        return False
+
+class NullSpan:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+def current_sink():
+    """
+    Where a call made now in this thread is recorded: the innermost capture, the registry, or None
+    """
+    captures = _local.__dict__.get('captures')
+    if captures:
+        return captures[-1].records
+    return _registry if _enabled else None
+
+def stage(name):
+    """
+    Context manager that records a block like a profiled call, e.g. `with stage('plan') as span: ...`
+    """
+    if not _active:
+        return NULL_SPAN
+    sink = current_sink()
+    return NULL_SPAN if sink is None else Span(name, sink)
+
+def profiled(func=None, *, name=None):
+    """
+    Decorator recording each call of func (latency, returned rows, RSS change) while profiling is on.
+
+    Usable bare (@profiled) or with a name (@profiled(name='generate events')); the default name is
+    module.function. The wrapper keeps the function's name, so decorated functions still pickle by reference.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name)
+    label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+        sink = current_sink()
+        if sink is None:
+            return func(*args, **kwargs)
+        with Span(label, sink) as span:
+            result = func(*args, **kwargs)
+            span.rows = count_rows(result)
+        return result
+    return wrapper
+
+class capture:
+    """
+    Context manager that records the profiled calls made by the current thread while it is open.
+
+    Captures nest (the innermost one gets the records) and do not see other threads, so concurrent
+    Streamlit sessions each get their own.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def start(self):
+        """
+        Start recording, for code that cannot sit in a single with block (stop ends it); prefer `with capture()`
+        """
+        global _active
+        _local.__dict__.setdefault('captures', []).append(self)
+        with _lock:
+            _active += 1
+        return self
+
+    def stop(self):
+        global _active
+        _local.captures.remove(self)
+        with _lock:
+            _active -= 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def summary(self):
+        return summary(self.records)
+
+    def trace(self):
+        return chrome_trace(self.records)
+
+    def export_trace(self, path):
+        export_trace(self.records, path)
+
+def summary(records):
+    """
+    Per-name totals of records, slowest (by self time) first
+
+    Returns:
+    - summary (DataFrame): calls, total_s (including nested profiled calls), self_s, mean_s, max_s, rows,
+      rss_delta_mb and share (of all self time), indexed by name
+    """
+    columns = ['calls', 'total_s', 'self_s', 'mean_s', 'max_s', 'rows', 'rss_delta_mb', 'share']
+    if not records:
+        return pd.DataFrame(columns=columns).rename_axis('name')
+    frame = pd.DataFrame(records)
+    grouped = frame.groupby('name')
+    result = pd.DataFrame({
+        'calls': grouped.size(),
+        'total_s': grouped['duration_s'].sum(),
+        'self_s': grouped['self_s'].sum(),
+        'mean_s': grouped['duration_s'].mean(),
+        'max_s': grouped['duration_s'].max(),
+        'rows': grouped['rows'].sum(min_count=1),
+        'rss_delta_mb': grouped['rss_delta_mb'].sum(min_count=1),
+    })
+    result['share'] = result['self_s'] / result['self_s'].sum()
+    return result.sort_values('self_s', ascending=False)[columns]
+
+def chrome_trace(records):
+    """
+    Records in the Chrome trace event format (complete events, microseconds from the first record)
+    """
+    origin = min((record['start_s'] for record in records), default=0.0)
+    events = [{
+        'name': record['name'],
+        'ph': 'X',
+        'ts': (record['start_s'] - origin) * 1e6,
+        'dur': record['duration_s'] * 1e6,
+        'pid': os.getpid(),
+        'tid': record['thread'],
+        'args': {'rows': record['rows'], 'rss_delta_mb': record['rss_delta_mb']},
+    } for record in records]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def export_trace(records, path):
+    with open(path, 'w') as f:
+        json.dump(chrome_trace(records), f)
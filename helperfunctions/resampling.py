@@ -0,0 +1,164 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.stats as stats
+from helperfunctions.rng import child_seed, seed_sequence
+
+# above this many distinct values, resample with weight / permutation matrices instead of value histograms
+MAX_DISTINCT_VALUES = 10000
+
+def difference(mean_c, mean_t):
+    return mean_t - mean_c
+
+def relative_lift(mean_c, mean_t):
+    return (mean_t - mean_c) / mean_c
+
+STATISTICS = {'difference': difference, 'relative': relative_lift}
+
+def chunk_sizes(num_resamples, n, max_cells):
+    chunk = max(1, max_cells // max(n, 1))
+    return [min(chunk, num_resamples - i) for i in range(0, num_resamples, chunk)]
+
+def run_chunks(function, args, sizes, seed, max_workers):
+    """
+    Run function(*args, size, seed) for every chunk, each with its own child stream of seed, and concatenate
+    """
+    seed = seed_sequence(seed)
+    seeds = [child_seed(seed, 'chunk', i) for i in range(len(sizes))]
+    if max_workers == 1:
+        results = [function(*args, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(function, *zip(*[(*args, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)])))
+    return np.concatenate(results, axis=-1)
+
+def bootstrap_means_histogram(values, counts, size, seed):
+    """
+    Bootstrap means of a sample given as distinct values and their counts: a resample only changes how many times
+    each distinct value is drawn, which is one multinomial draw per resample
+    """
+    rng = np.random.default_rng(seed)
+    n = counts.sum()
+    return rng.multinomial(n, counts / n, size=size) @ values / n
+
+def bootstrap_means_weights(x, size, seed):
+    """
+    Bootstrap means with Poisson(1) weights (a (size x n) weight matrix)
+    """
+    rng = np.random.default_rng(seed)
+    weights = rng.poisson(1.0, size=(size, len(x)))
+    return weights @ x / weights.sum(axis=1)
+
+def bootstrap_means(x, num_resamples, seed, max_cells, max_workers):
+    x = np.asarray(x, dtype=float)
+    values, counts = np.unique(x, return_counts=True)
+    if len(values) <= MAX_DISTINCT_VALUES:
+        return run_chunks(bootstrap_means_histogram, (values, counts), chunk_sizes(num_resamples, len(values), max_cells),
+                          seed, max_workers)
+    return run_chunks(bootstrap_means_weights, (x,), chunk_sizes(num_resamples, len(x), max_cells), seed, max_workers)
+
+def bootstrap(x_c, x_t, num_resamples=10000, statistic='difference', alpha=0.05, method='bca', seed=None,
+              max_cells=2**25, max_workers=1):
+    """
+    Bootstrap confidence interval and p-value for the difference in means or the relative lift.
+
+    Integer metrics such as per-user action sums have few distinct values, so each resample is drawn as a
+    multinomial over the value histogram (equivalent to resampling users, at O(distinct values) per resample).
+    Otherwise resamples are drawn as Poisson(1) weight matrices, in chunks of at most max_cells entries.
+
+    Input: 
+    - x_c, x_t: per-user control / treatment values, e.g. from statistical_tests.user_sums
+    - num_resamples: number of bootstrap resamples
+    - statistic: 'difference' (mean_t - mean_c) or 'relative' ((mean_t - mean_c) / mean_c)
+    - alpha: significance level alpha, usually 0.05
+    - method: 'percentile' or 'bca' (bias-corrected and accelerated, Efron 1987)
+    - seed: seed for reproducible resamples
+    - max_cells: memory bound of each chunk
+    - max_workers: process pool size for the chunks; 1 runs in this process
+
+    Output: 
+    - dict with the estimate, lower / upper CI bounds and the bootstrap p-value of the statistic being 0,
+      (1 + k) / (1 + num_resamples) with k the resamples on the far side of 0 (as permutation_test)
+    """
+    x_c = np.asarray(x_c, dtype=float)
+    x_t = np.asarray(x_t, dtype=float)
+    function = STATISTICS[statistic]
+    seed = seed_sequence(seed)
+    seed_c, seed_t = child_seed(seed, 'control'), child_seed(seed, 'treatment')
+
+    estimate = function(x_c.mean(), x_t.mean())
+    boot = function(bootstrap_means(x_c, num_resamples, seed_c, max_cells, max_workers),
+                    bootstrap_means(x_t, num_resamples, seed_t, max_cells, max_workers))
+
+    quantiles = np.array([alpha / 2, 1 - alpha / 2])
+    if method == 'bca':
+        # share of resamples below the estimate (ties count half), kept off 0 and 1 so the bias z0 stays finite
+        # when every resample falls on one side of the estimate
+        below = (np.sum(boot < estimate) + 0.5 * np.sum(boot == estimate)) / num_resamples
+        z0 = stats.norm.ppf(np.clip(below, 1 / (num_resamples + 1), num_resamples / (num_resamples + 1)))
+        a = acceleration(x_c, x_t, function)
+        z = stats.norm.ppf(quantiles)
+        quantiles = stats.norm.cdf(z0 + (z0 + z) / (1 - a * (z0 + z)))
+    elif method != 'percentile':
+        raise ValueError(f"unknown bootstrap interval method: {method}")
+    ci_lower, ci_upper = np.quantile(boot, quantiles)
+
+    # (1 + k) / (1 + B) as in permutation_test, so the p-value is never exactly 0
+    p_value = min(1.0, 2 * (1 + min(np.sum(boot <= 0), np.sum(boot >= 0))) / (1 + num_resamples))
+    return {'estimate': estimate, 'ci_lower': ci_lower, 'ci_upper': ci_upper, 'p_value': p_value}
+
+def acceleration(x_c, x_t, function):
+    """
+    BCa acceleration from the jackknife, using closed-form leave-one-out means (O(n))
+    """
+    n_c, n_t = len(x_c), len(x_t)
+    mean_c, mean_t = x_c.mean(), x_t.mean()
+    jackknife = np.concatenate([function((mean_c * n_c - x_c) / (n_c - 1), mean_t),
+                                function(mean_c, (mean_t * n_t - x_t) / (n_t - 1))])
+    d = jackknife.mean() - jackknife
+    denominator = 6 * (d ** 2).sum() ** 1.5
+    # constant samples have no skewness to correct for
+    return (d ** 3).sum() / denominator if denominator > 0 else 0.0
+
+def permuted_sums_histogram(values, counts, n_t, size, seed):
+    """
+    Treatment sums under random relabelling: the number of each distinct value that lands in treatment
+    is one multivariate hypergeometric draw per permutation
+    """
+    rng = np.random.default_rng(seed)
+    return rng.multivariate_hypergeometric(counts, n_t, size=size) @ values
+
+def permuted_sums_matrix(pooled, n_t, size, seed):
+    """
+    Treatment sums under random relabelling, from a (size x n) matrix of permuted rows
+    """
+    rng = np.random.default_rng(seed)
+    return rng.permuted(np.broadcast_to(pooled, (size, len(pooled))), axis=1)[:, :n_t].sum(axis=1)
+
+def permutation_test(x_c, x_t, num_resamples=10000, statistic='difference', seed=None, max_cells=2**25, max_workers=1):
+    """
+    Two-sided permutation test of the difference in means or relative lift.
+
+    Input: see bootstrap
+
+    Output: 
+    - dict with the estimate and the permutation p-value
+    """
+    x_c = np.asarray(x_c, dtype=float)
+    x_t = np.asarray(x_t, dtype=float)
+    function = STATISTICS[statistic]
+    pooled = np.concatenate([x_c, x_t])
+    n_c, n_t = len(x_c), len(x_t)
+    total = pooled.sum()
+
+    values, counts = np.unique(pooled, return_counts=True)
+    if len(values) <= MAX_DISTINCT_VALUES:
+        sums_t = run_chunks(permuted_sums_histogram, (values, counts, n_t), chunk_sizes(num_resamples, len(values), max_cells),
+                            seed, max_workers)
+    else:
+        sums_t = run_chunks(permuted_sums_matrix, (pooled, n_t), chunk_sizes(num_resamples, len(pooled), max_cells),
+                            seed, max_workers)
+
+    estimate = function(x_c.mean(), x_t.mean())
+    permuted = function((total - sums_t) / n_c, sums_t / n_t)
+    p_value = (1 + np.sum(np.abs(permuted) >= np.abs(estimate))) / (1 + num_resamples)
+    return {'estimate': estimate, 'p_value': p_value}
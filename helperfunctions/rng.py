@@ -0,0 +1,53 @@
+import hashlib
+import numpy as np
+
+def seed_sequence(seed=None):
+    """
+    SeedSequence of seed: an int, a sequence of ints, a SeedSequence (returned as is) or None (fresh entropy)
+    """
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+def resolve_seed(seed=None):
+    """
+    A concrete seed for seed: None is replaced by fresh entropy, so several calls (e.g. one per worker)
+    can share the same random run
+    """
+    return seed_sequence(seed).entropy if seed is None else seed
+
+def stream_key(key):
+    """
+    Integer key of a stream name: ints are used as is, anything else (e.g. 'events', a variant label) is hashed
+    """
+    if isinstance(key, (int, np.integer)):
+        return int(key)
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=4).digest(), 'little')
+
+def child_seed(seed, *keys):
+    """
+    Independent child SeedSequence of seed addressed by keys, e.g. child_seed(seed, 'events', day).
+
+    Unlike SeedSequence.spawn, children are addressed rather than counted, so the same (seed, keys) gives the
+    same stream no matter which other streams were created, in which order, or in which process.
+    """
+    parent = seed_sequence(seed)
+    return np.random.SeedSequence(parent.entropy, spawn_key=parent.spawn_key + tuple(stream_key(key) for key in keys),
+                                  pool_size=parent.pool_size)
+
+def generator(seed, *keys):
+    """
+    Generator of the child stream (seed, *keys); the root stream if no keys are given
+    """
+    return np.random.default_rng(child_seed(seed, *keys) if keys else seed_sequence(seed))
+
+def streams(seed, *keys, index):
+    """
+    One Generator per element of index (e.g. per day), each the child stream (seed, *keys, element).
+
+    Drawing every day, block or replicate from its own stream is what makes chunked and parallel generation
+    bit-identical to serial generation: a chunk only needs the indices it covers. If seed is already a
+    Generator, it is shared by every element instead (sequential draws, only reproducible serially).
+    """
+    if isinstance(seed, np.random.Generator):
+        return [seed] * len(index)
+    root = seed_sequence(seed)
+    return [generator(root, *keys, element) for element in index]
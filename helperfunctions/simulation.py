@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import helperfunctions.statistical_tests as st_funcs
+from helperfunctions.rng import child_seed, resolve_seed
+
+def simulate_chunk(num_replicates, seed, days=14, rl=0, param=2, num_users=100000, min_per_day=100, alpha=0.05):
+    """
+    Simulate a batch of A/B tests with the same design as data_gen_funcs.start_test and count rejections per peek.
+
+    Replicates are simulated side by side as (replicates x users) arrays of cumulative per-user action counts.
+    Each day only the users that were drawn are touched, and the per-replicate count, sum and sum of squares of
+    the per-user totals are updated in place, so every peek is O(replicates) instead of a groupby.
+
+    Parameters:
+    - num_replicates (int): number of tests to simulate.
+    - seed (np.random.SeedSequence or int): seed of this batch.
+    - days (int): number of peeks; peek d uses every event up to start + d days, like start_test.
+    - rl (float): relative lift of the treatment (0 for an A/A test).
+    - param (float): Poisson parameter of the control.
+    - num_users (int): size of the user pool, split evenly between the variants as in start_test.
+    - min_per_day (int): minimum number of rows per day and variant.
+    - alpha (float): significance level.
+
+    Returns:
+    - rejections (dict): for 'msprt' and 'fixed', a (days x replicates) boolean array of rejections at each peek.
+    """
+    rng = np.random.default_rng(seed)
+    stats_by_variant = [simulate_variant(rng, num_replicates, days, p, num_users // 2, min_per_day)
+                        for p in (param, param * (1 + rl))]
+    (n_c, mean_c, var_c), (n_t, mean_t, var_t) = stats_by_variant
+    delta = mean_t - mean_c
+
+    msprt_l, msprt_u = st_funcs.msprt_interval(delta, var_c, n_c, var_t, n_t, alpha)
+    # same rule as the analysis (welchtest / metrics.welch): Welch's p-value on sample variances, rejected below alpha
+    _, p_value = st_funcs.welch_from_stats(delta, var_c * n_c / (n_c - 1), n_c, var_t * n_t / (n_t - 1), n_t)
+
+    return {
+        'msprt': (msprt_l > 0) | (msprt_u < 0),
+        'fixed': p_value < alpha,
+    }
+
+def simulate_variant(rng, num_replicates, days, param, num_users, min_per_day):
+    """
+    Per-peek (n, mean, population variance) of the per-user action totals of one variant, each (days x replicates)
+    """
+    totals = np.zeros(num_replicates * num_users, dtype=np.int64)
+    seen = np.zeros(num_replicates * num_users, dtype=bool)
+    n = np.zeros(num_replicates)
+    s1 = np.zeros(num_replicates)
+    s2 = np.zeros(num_replicates)
+    peeks = []
+
+    for day in range(days + 1):
+        # rows of every replicate for this day, as flat (replicate, user) cells
+        rows = rng.integers(min_per_day, min_per_day*2, size=num_replicates)
+        replicate = np.repeat(np.arange(num_replicates), rows)
+        cells = replicate * num_users + rng.integers(0, num_users, size=len(replicate))
+        cells, inverse = np.unique(cells, return_inverse=True)
+        increment = np.bincount(inverse, weights=rng.poisson(param, size=len(inverse))).astype(np.int64)
+
+        old = totals[cells]
+        new = old + increment
+        replicate = cells // num_users
+        n += np.bincount(replicate, weights=~seen[cells], minlength=num_replicates)
+        s1 += np.bincount(replicate, weights=increment, minlength=num_replicates)
+        s2 += np.bincount(replicate, weights=new**2 - old**2, minlength=num_replicates)
+        totals[cells] = new
+        seen[cells] = True
+
+        # snapshot 1 covers the first two days, as in start_test
+        if day >= 1:
+            mean = s1 / n
+            peeks.append((n.copy(), mean, s2 / n - mean**2))
+
+    return [np.array(x) for x in zip(*peeks)]
+
+def simulate_rejection_rates(num_replicates, days=14, rl=0, param=2, num_users=100000, min_per_day=100, alpha=0.05,
+                             seed=None, chunk_size=50, max_workers=None, progress=None):
+    """
+    Monte Carlo rejection rates of mSPRT and the fixed horizon t-test by peek day.
+
+    With rl=0 (A/A tests) the rates are false positive rates, with rl != 0 they are the power.
+    Replicates are split into chunks of chunk_size, each with its own child stream of seed (rng.child_seed),
+    so results only depend on the seed and chunk_size, not on how many workers run the chunks.
+
+    Parameters:
+    - num_replicates (int): number of simulated tests.
+    - days, rl, param, num_users, min_per_day, alpha: see simulate_chunk.
+    - seed (int): seed of the whole simulation, random if None.
+    - chunk_size (int): replicates per chunk (bounds memory to chunk_size x num_users per worker).
+    - max_workers (int): size of the process pool; 1 runs in this process.
+    - progress (callable): called as progress(replicates_done, num_replicates) after each chunk.
+
+    Returns:
+    - rates (DataFrame): indexed by peek day with columns
+      'mSPRT' (rejected at any peek so far), 'Fixed (peeking)' (rejected at any peek so far)
+      and 'Fixed (single look)' (rejected when only looking at that day).
+    """
+    chunks = [min(chunk_size, num_replicates - i) for i in range(0, num_replicates, chunk_size)]
+    seed = resolve_seed(seed)
+    seeds = [child_seed(seed, 'chunk', i) for i in range(len(chunks))]
+    params = dict(days=days, rl=rl, param=param, num_users=num_users, min_per_day=min_per_day, alpha=alpha)
+
+    rejected = {'msprt_any': 0, 'fixed_any': 0, 'fixed': 0}
+    done = 0
+
+    def collect(size, rejections):
+        nonlocal done
+        rejected['msprt_any'] += np.logical_or.accumulate(rejections['msprt'], axis=0).sum(axis=1)
+        rejected['fixed_any'] += np.logical_or.accumulate(rejections['fixed'], axis=0).sum(axis=1)
+        rejected['fixed'] += rejections['fixed'].sum(axis=1)
+        done += size
+        if progress is not None:
+            progress(done, num_replicates)
+
+    if max_workers == 1:
+        for size, chunk_seed in zip(chunks, seeds):
+            collect(size, simulate_chunk(size, chunk_seed, **params))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(simulate_chunk, size, chunk_seed, **params): size
+                       for size, chunk_seed in zip(chunks, seeds)}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+
+    return pd.DataFrame({
+        'mSPRT': rejected['msprt_any'] / num_replicates,
+        'Fixed (peeking)': rejected['fixed_any'] / num_replicates,
+        'Fixed (single look)': rejected['fixed'] / num_replicates,
+    }, index=pd.RangeIndex(1, days + 1, name='peek day'))
@@ -1,44 +1,160 @@
 import scipy.stats as stats
 import numpy as np
+import pandas as pd
+from functools import lru_cache
+from scipy import sparse
+from scipy.optimize import brentq
+import helperfunctions.cuped as cuped
+from helperfunctions.profiling import profiled
+
+class RunningStats:
+    """
+    Running count, mean and sum of squared deviations (Welford), mergeable across batches
+    """
 
-def msprt(alpha, x_c, x_t):
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def __repr__(self):
+        return f"RunningStats(n={self.n}, mean={self.mean:.4f}, var={self.var:.4f})"
+
+    @property
+    def var(self):
+        # population variance, same as np.var
+        return self.m2 / self.n if self.n else np.nan
+
+    def add(self, x):
+        """
+        Add a single observation
+        """
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def update_stats(self, n, mean, m2):
+        """
+        Merge a batch given by its count, mean and sum of squared deviations (Chan et al.)
+        """
+        n = int(n)
+        if n == 0:
+            return
+        total = self.n + n
+        d = mean - self.mean
+        self.mean += d * n / total
+        self.m2 += m2 + d ** 2 * self.n * n / total
+        self.n = total
+
+    def merge(self, other):
+        """
+        Merge another RunningStats
+        """
+        self.update_stats(other.n, other.mean, other.m2)
+        return self
+
+    def update(self, x):
+        """
+        Merge a batch of observations
+        """
+        x = np.asarray(x, dtype=float)
+        if len(x):
+            mean = x.mean()
+            self.update_stats(len(x), mean, ((x - mean) ** 2).sum())
+
+
+def msprt_interval(delta, var_c, n_c, var_t, n_t, alpha=0.05, z_alpha=None):
     """
-    Performs two-sided sequential test (mSPRT) from Zhao et al., 2019
+    mSPRT confidence interval (Zhao et al., 2019) from summary statistics. Works elementwise on arrays.
 
     Input: 
+    - delta: treatment mean - control mean
+    - var_c, var_t: population variance of each group
+    - n_c, n_t: sample size of each group
     - alpha: significance level alpha, usually 0.05
-    - x_c: control data
-    - x_t: treatment data
+    - z_alpha: precomputed Z-score for 1 - alpha/2
 
     Output: 
     - Confidence Interval
     """
-    x_c_bar = np.mean(x_c)
-    x_t_bar = np.mean(x_t)
-    n_c = len(x_c)
-    n_t = len(x_t)
+    if z_alpha is None:
+        z_alpha = stats.norm.ppf(1-alpha/2)
+    # numpy semantics, so an empty group (n = 0) or zero variance gives a NaN interval instead of raising
+    var_c, n_c, var_t, n_t = (np.asarray(x, dtype=float) for x in (var_c, n_c, var_t, n_t))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # variance of the difference in means
+        v = (var_c / n_c) + (var_t / n_t)
 
-    # variance of the difference in means
-    v = (np.var(x_c) / n_c) + (np.var(x_t) / n_t)
+        # mixing parameter
+        t = (z_alpha**2) * ((var_t + var_c) / (n_c + n_t))
 
-    # Z-score corresponding to 1 - alpha/2
-    Z_alpha = stats.norm.ppf(1-alpha/2)
+        # margin of error of the confidence interval
+        me = np.sqrt( ((v*(v+t))/t) * (-2*np.log(alpha/2) - np.log(v/(v+t))))
 
-    # mixing parameter
-    t = (Z_alpha**2) * ((np.var(x_t) + np.var(x_c)) / (n_c + n_t))
+    return (delta - me, delta + me)
 
-    # margin of error of the confidence interval
-    me = np.sqrt( ((v*(v+t))/t) * (-2*np.log(alpha/2) - np.log(v/(v+t))))
 
-    # mean difference
-    delta = x_t_bar - x_c_bar
+class SequentialTest:
+    """
+    Streaming two-sided mSPRT (Zhao et al., 2019)
 
-    # confidence interval
-    return (delta - me, delta + me)
+    Keeps running sufficient statistics for control and treatment, so each peek costs O(1)
+    no matter how much data has been seen. Feed it with update() (batches), add() (single
+    observations) or update_stats() (pre-aggregated batches), then call peek().
+    """
 
-def fixedttest(alpha, x_c, x_t):
+    def __init__(self, alpha=0.05):
+        self.alpha = alpha
+        self.z_alpha = stats.norm.ppf(1-alpha/2)
+        self.control = RunningStats()
+        self.treatment = RunningStats()
+        self.peeks = 0
+
+    def __repr__(self):
+        return f"SequentialTest(alpha={self.alpha}, control={self.control}, treatment={self.treatment})"
+
+    def update(self, x_c=(), x_t=()):
+        self.control.update(x_c)
+        self.treatment.update(x_t)
+        return self
+
+    def add(self, x, treatment=False):
+        (self.treatment if treatment else self.control).add(x)
+        return self
+
+    def update_stats(self, control=None, treatment=None):
+        """
+        control / treatment: (n, mean, m2) tuples of a pre-aggregated batch
+        """
+        if control is not None:
+            self.control.update_stats(*control)
+        if treatment is not None:
+            self.treatment.update_stats(*treatment)
+        return self
+
+    def mean_difference(self):
+        return self.treatment.mean - self.control.mean
+
+    def confidence_interval(self):
+        return msprt_interval(self.mean_difference(), self.control.var, self.control.n,
+                              self.treatment.var, self.treatment.n, self.alpha, self.z_alpha)
+
+    def peek(self):
+        """
+        Output: 
+        - (significant, lower, upper, mean difference), significant is 1 if the interval excludes 0
+        """
+        self.peeks += 1
+        ci_l, ci_u = self.confidence_interval()
+        return check_zero_in_interval(ci_l, ci_u), ci_l, ci_u, self.mean_difference()
+
+
+@profiled
+def msprt(alpha, x_c, x_t):
     """
-    Performs two-sided Welch's t-test
+    Performs two-sided sequential test (mSPRT) from Zhao et al., 2019
 
     Input: 
     - alpha: significance level alpha, usually 0.05
@@ -48,35 +164,54 @@ def fixedttest(alpha, x_c, x_t):
     Output: 
     - Confidence Interval
     """
-    # Welch's t-test
-    t_statistic, p_value = stats.ttest_ind(x_t, x_c, equal_var=False)
+    return SequentialTest(alpha).update(x_c, x_t).confidence_interval()
 
-    # calculate DoF
-    degrees_of_freedom = len(x_c) + len(x_t) - 2
+def ttest_interval(delta, var_c, n_c, var_t, n_t, alpha=0.05):
+    """
+    Confidence interval used by fixedttest, from summary statistics. Works elementwise on arrays.
 
-    # loc
-    loc = (x_t.mean() - x_c.mean())
+    Input: 
+    - delta: treatment mean - control mean
+    - var_c, var_t: sample variance of each group
+    - n_c, n_t: sample size of each group
+    - alpha: significance level alpha, usually 0.05
+
+    Output: 
+    - Confidence Interval
+    """
+    # calculate DoF
+    degrees_of_freedom = n_c + n_t - 2
 
     # scale
-    scale = ((x_t.var() / len(x_t)) + (x_c.var() / len(x_c))) ** 0.5
+    scale = ((var_t / n_t) + (var_c / n_c)) ** 0.5
 
     # calculate ci's for the diff. in means
-    ci_lower, ci_upper = stats.t.interval(1-alpha/2, df=degrees_of_freedom, loc = loc, scale = scale)
+    return stats.t.interval(1-alpha/2, df=degrees_of_freedom, loc = delta, scale = scale)
 
-    return ci_lower, ci_upper
+def welch_from_stats(delta, var_c, n_c, var_t, n_t):
+    """
+    Welch's t statistic and two-sided p-value from summary statistics (sample variances). Works elementwise on arrays.
+    """
+    se2_c, se2_t = var_c / n_c, var_t / n_t
+    t_stat = delta / np.sqrt(se2_c + se2_t)
+    welch_df = (se2_c + se2_t) ** 2 / (se2_c ** 2 / (n_c - 1) + se2_t ** 2 / (n_t - 1))
+    return t_stat, 2 * stats.t.sf(np.abs(t_stat), welch_df)
 
-def check_zero_in_interval(lower, upper):
+def delta_method_variance(mean_x, mean_y, var_x, var_y, cov_xy):
     """
-    significance checker - if significant return 0
+    Per-user variance of the ratio metric mean(x) / mean(y) by the delta method (Deng et al., 2018).
+
+    x and y are per-user numerator and denominator totals; the variance of the ratio estimate over n users is
+    the returned value / n, so it can be passed to ttest_interval / msprt_interval in place of a per-user variance.
+    Works elementwise on arrays.
     """
-    if lower <= 0 <= upper:
-        return 0
-    else:
-        return 1
+    ratio = mean_x / mean_y
+    return (var_x - 2 * ratio * cov_xy + ratio ** 2 * var_y) / mean_y ** 2
 
-def msprt_ci(control, treatment, alpha = 0.05):
-  """
-    Performs two-sided sequential test (mSPRT) from Zhao et al., 2019
+@profiled
+def fixedttest(alpha, x_c, x_t):
+    """
+    Performs two-sided Welch's t-test
 
     Input: 
     - alpha: significance level alpha, usually 0.05
@@ -85,50 +220,306 @@ def msprt_ci(control, treatment, alpha = 0.05):
 
     Output: 
     - Confidence Interval
-  """
-  control['day'] = control['date'].dt.date.rank(method='dense').astype(int)
-  treatment['day'] = treatment['date'].dt.date.rank(method='dense').astype(int)
+    """
+    ci_lower, ci_upper = ttest_interval(x_t.mean() - x_c.mean(), x_c.var(), len(x_c), x_t.var(), len(x_t), alpha)
+
+    return ci_lower, ci_upper
+
+def check_zero_in_interval(lower, upper):
+    """
+    significance checker - 1 if the interval excludes 0, else 0 (also for an undefined, NaN interval)
+    """
+    return int(lower > 0 or upper < 0)
+
+@profiled
+def daily_stats(data):
+    """
+    Per-day (n, mean, m2) of action_count, with days numbered by dense rank of the date (1 = first day)
+    """
+    day = data['date'].dt.normalize().rank(method='dense').astype(int)
+    grouped = data['action_count'].groupby(day.to_numpy())
+    n = grouped.count()
+    return pd.DataFrame({'n': n, 'mean': grouped.mean(), 'm2': grouped.var(ddof=0) * n})
+
+@profiled
+def msprt_ci(control, treatment, alpha = 0.05, covariates=None):
+    """
+    Performs two-sided sequential test (mSPRT) from Zhao et al., 2019, peeking once per day
+
+    Input: 
+    - control: control events with 'userid', 'date' and 'action_count' columns
+    - treatment: treatment events with 'userid', 'date' and 'action_count' columns
+    - alpha: significance level alpha, usually 0.05
+    - covariates: optional cuped.CovariateTable. If given, each peek tests the CUPED-adjusted
+      cumulative per-user totals instead of the raw events
+
+    Output: 
+    - (significant, day, lower CI bound, upper CI bound, mean difference)
+    """
+    if covariates is not None:
+        return user_msprt_ci(control, treatment, alpha, covariates)
+
+    daily_c = daily_stats(control)
+    days = range(1, daily_c.index.max() + 1)
+    daily_c = daily_c.reindex(days, fill_value=0).to_numpy()
+    daily_t = daily_stats(treatment).reindex(days, fill_value=0).to_numpy()
+    test = SequentialTest(alpha)
+
+    # Iterate over each day, folding that day's batch into the running statistics
+    for day, batch_c, batch_t in zip(days, daily_c, daily_t):
+        test.update_stats(control=batch_c, treatment=batch_t)
+
+        result, ci_l, ci_u, e = test.peek()
+        if result:
+            return 1, day, ci_l, ci_u, e  # Significant result found, return 1
+
+    # No significant result found after testing all days
+    return 0, day, ci_l, ci_u, e
 
-  # Iterate over each day
-  for day in range(1, max(control['day']) + 1):
-      # Filter data up to the current day
-      x_c = control[control['day'] <= day]['action_count']
-      x_t = treatment[treatment['day'] <= day]['action_count']
+def shared_days(control, treatment):
+    """
+    (first date, number of days) of the calendar range spanned by both groups' events
+    """
+    dates = pd.concat([control['date'], treatment['date']]).dt.normalize()
+    return dates.min(), (dates.max() - dates.min()).days + 1
+
+def cumulative_totals(control, treatment, metric='action_count'):
+    """
+    Both groups' cumulative per-user totals (day, userids_c, totals_c, userids_t, totals_t), day by day over
+    their shared days
+    """
+    start, num_days = shared_days(control, treatment)
+    for (day, users_c, y_c), (_, users_t, y_t) in zip(cuped.cumulative_user_totals(control, metric, start, num_days),
+                                                      cuped.cumulative_user_totals(treatment, metric, start, num_days)):
+        yield day, users_c, y_c.astype(float), users_t, y_t.astype(float)
+
+@profiled
+def user_msprt_ci(control, treatment, alpha=0.05, covariates=None, metric='action_count'):
+    """
+    msprt_ci on the cumulative per-user totals, CUPED-adjusted if covariates (a cuped.CovariateTable) is given.
 
-      # variance of the difference in means
-      v = (np.var(x_c) / len(x_c)) + (np.var(x_t) / len(x_t))
+    Without covariates this is the unadjusted test on the same per-user unit, so the two are directly comparable.
+    """
+    metric = covariates.metric if covariates is not None else metric
+    for day, users_c, y_c, users_t, y_t in cumulative_totals(control, treatment, metric):
+        if covariates is not None:
+            y_c, y_t, _ = cuped.cuped_adjust(y_c, covariates.lookup(users_c), y_t, covariates.lookup(users_t))
+        ci_l, ci_u = msprt(alpha, y_c, y_t)
+        e = y_t.mean() - y_c.mean()
+        if check_zero_in_interval(ci_l, ci_u):
+            return 1, day, ci_l, ci_u, e
+
+    return 0, day, ci_l, ci_u, e
+
+def obrien_fleming_spending(t, alpha):
+    """
+    Lan-DeMets O'Brien-Fleming type spending function: almost no alpha is spent at early looks.
+    Two-sided, spending alpha / 2 on each side with the one-sided function (as gsDesign and rpact do)
+    """
+    return 4 * stats.norm.sf(stats.norm.isf(alpha / 4) / np.sqrt(t))
 
-      # Z-score corresponding to 1 - alpha/2
-      Z_alpha = stats.norm.ppf(1-alpha/2)
+def pocock_spending(t, alpha):
+    """
+    Lan-DeMets Pocock type spending function: alpha is spent roughly evenly over the looks
+    """
+    return alpha * np.log(1 + (np.e - 1) * t)
+
+SPENDING_FUNCTIONS = {'obrien-fleming': obrien_fleming_spending, 'pocock': pocock_spending}
 
-      # mixing parameter
-      t = (Z_alpha**2) * ((np.var(x_t) + np.var(x_c)) / (len(x_c) + len(x_t)))
+def group_sequential_boundaries(looks, alpha=0.05, spending='obrien-fleming', information=None):
+    """
+    Two-sided z boundaries of a group-sequential test with alpha spending (Lan & DeMets, 1983)
 
-      # marin of error term
-      me = np.sqrt(((v*(v+t))/t) * (-2*np.log(alpha/2) - np.log(v/(v+t))))
+    The table only depends on the design, so it is computed once per (looks, alpha, spending, information)
+    and served from a cache afterwards; evaluating a look is then one z-statistic against its boundary.
 
-      # sample mean
-      e = np.mean(x_t) - np.mean(x_c)
+    Input:
+    - looks: number of planned looks
+    - alpha: overall two-sided significance level
+    - spending: 'obrien-fleming' or 'pocock' (see SPENDING_FUNCTIONS)
+    - information: cumulative information fraction at each look (increasing, ending at 1), equally spaced if None
 
-      # ci
-      ci_l = e - me
-      ci_u = e + me
+    Output:
+    - boundaries: read-only array of |z| boundaries, one per look
+    """
+    if spending not in SPENDING_FUNCTIONS:
+        raise ValueError(f"spending must be one of {list(SPENDING_FUNCTIONS)}, got {spending}")
+    information = None if information is None else tuple(float(t) for t in information)
+    return _group_sequential_boundaries(int(looks), float(alpha), spending, information)
+
+@lru_cache(maxsize=256)
+def _group_sequential_boundaries(looks, alpha, spending, information):
+    # Armitage, McPherson and Rowe (1969) recursion on the score S_k = Z_k sqrt(t_k), whose increments are
+    # independent N(0, t_k - t_k-1) under the null: the sub-density of S_k over the paths that have not yet
+    # crossed is carried from look to look on a Simpson grid, and each boundary is solved so that the
+    # probability of first crossing at look k equals the alpha spent between looks k-1 and k
+    t = np.arange(1, looks + 1) / looks if information is None else np.asarray(information)
+    if len(t) != looks or np.any(np.diff(t) <= 0) or t[0] <= 0:
+        raise ValueError("information must be increasing, positive and have one value per look")
+    spent = np.diff(SPENDING_FUNCTIONS[spending](t, alpha), prepend=0.0)
+
+    boundaries = np.empty(looks)
+    boundaries[0] = stats.norm.isf(spent[0] / 2)
+    # paths beyond 8 sd carry no mass worth integrating, also when a boundary is infinite (nothing spent yet)
+    grid, weights = simpson_grid(min(boundaries[0], 8.0) * np.sqrt(t[0]), np.sqrt(t[0]))
+    density = stats.norm.pdf(grid, scale=np.sqrt(t[0]))
+    for k in range(1, looks):
+        sd = np.sqrt(t[k] - t[k - 1])
+        mass = weights * density
+
+        def crossing(b):
+            c = b * np.sqrt(t[k])
+            return np.sum(mass * (stats.norm.cdf((-c - grid) / sd) + stats.norm.sf((c - grid) / sd))) - spent[k]
+
+        boundaries[k] = brentq(crossing, 0.0, 40.0, xtol=1e-10) if spent[k] > 0 else np.inf
+        new_grid, new_weights = simpson_grid(min(boundaries[k], 8.0) * np.sqrt(t[k]), sd)
+        density = np.exp(-0.5 * ((new_grid[:, None] - grid[None, :]) / sd) ** 2) @ mass / (sd * np.sqrt(2 * np.pi))
+        grid, weights = new_grid, new_weights
+
+    boundaries.setflags(write=False)
+    return boundaries
+
+def simpson_grid(c, sd, points_per_sd=16):
+    """
+    Odd number of equally spaced points on [-c, c], about points_per_sd per sd, and their Simpson weights
+    """
+    m = 2 * max(int(np.ceil(c / sd * points_per_sd)), 8) + 1
+    grid = np.linspace(-c, c, m)
+    weights = np.ones(m)
+    weights[1:-1:2], weights[2:-1:2] = 4, 2
+    return grid, weights * (grid[1] - grid[0]) / 3
 
-      # Check if significant
-      if ci_u < 0 or ci_l > 0:
-          return 1, day, ci_l, ci_u, e  # Significant result found, return 1
+def group_sequential_interval(delta, var_c, n_c, var_t, n_t, boundary):
+    """
+    Repeated confidence interval of a group-sequential test at a look: delta -/+ boundary * standard error.
+    Works elementwise on arrays. The interval excludes 0 exactly when |z| crosses the boundary.
+    """
+    me = boundary * np.sqrt((var_c / n_c) + (var_t / n_t))
+    return (delta - me, delta + me)
 
-  # No significant result found after testing all days
-  return 0, day, ci_l, ci_u, e
+class GroupSequentialTest(SequentialTest):
+    """
+    Streaming two-sided group-sequential z-test with alpha-spending boundaries
 
-def welchtest(control, treatment, alpha=0.05):
+    Same interface as SequentialTest, but peek() evaluates the next planned look against its precomputed
+    boundary (see group_sequential_boundaries), so it is only valid at the looks planned up front.
+    """
+
+    def __init__(self, looks, alpha=0.05, spending='obrien-fleming', information=None):
+        super().__init__(alpha)
+        self.spending = spending
+        self.boundaries = group_sequential_boundaries(looks, alpha, spending, information)
+
+    def __repr__(self):
+        return (f"GroupSequentialTest(looks={len(self.boundaries)}, alpha={self.alpha}, spending={self.spending}, "
+                f"control={self.control}, treatment={self.treatment})")
+
+    def z(self):
+        return self.mean_difference() / np.sqrt(self.control.var / self.control.n + self.treatment.var / self.treatment.n)
+
+    def confidence_interval(self):
+        # interval of the latest look
+        return group_sequential_interval(self.mean_difference(), self.control.var, self.control.n,
+                                         self.treatment.var, self.treatment.n, self.boundaries[max(self.peeks, 1) - 1])
+
+    def peek(self):
+        """
+        Evaluate the next planned look
+
+        Output:
+        - (significant, lower, upper, mean difference), significant is 1 if |z| crosses the look's boundary
+        """
+        if self.peeks >= len(self.boundaries):
+            raise ValueError(f"all {len(self.boundaries)} planned looks have been used")
+        return super().peek()
+
+def look_days(num_days, looks):
+    """
+    Days (1 = first day) of looks equally spaced over num_days days, the last one on the last day
+    """
+    looks = min(looks, num_days)
+    return np.ceil(np.arange(1, looks + 1) * num_days / looks).astype(int)
+
+@profiled
+def group_sequential_ci(control, treatment, alpha=0.05, looks=5, spending='obrien-fleming', covariates=None):
+    """
+    Performs a two-sided group-sequential test with alpha spending, looking at equally spaced days
+
+    Input:
+    - control: control events with 'userid', 'date' and 'action_count' columns
+    - treatment: treatment events with 'userid', 'date' and 'action_count' columns
+    - alpha: significance level alpha, usually 0.05
+    - looks: number of planned looks over the test's days (at most one per day)
+    - spending: 'obrien-fleming' or 'pocock'
+    - covariates: optional cuped.CovariateTable, tests the CUPED-adjusted cumulative per-user totals
+
+    Output:
+    - (significant, day, lower CI bound, upper CI bound, mean difference), as msprt_ci
+    """
+    if covariates is not None:
+        return user_group_sequential_ci(control, treatment, alpha, looks, spending, covariates)
+
+    daily_c = daily_stats(control)
+    days = range(1, daily_c.index.max() + 1)
+    daily_c = daily_c.reindex(days, fill_value=0).to_numpy()
+    daily_t = daily_stats(treatment).reindex(days, fill_value=0).to_numpy()
+    planned = set(look_days(len(days), looks).tolist())
+    test = GroupSequentialTest(len(planned), alpha, spending)
+
+    for day, batch_c, batch_t in zip(days, daily_c, daily_t):
+        test.update_stats(control=batch_c, treatment=batch_t)
+        if day in planned:
+            result, ci_l, ci_u, e = test.peek()
+            if result:
+                return 1, day, ci_l, ci_u, e
+
+    return 0, day, ci_l, ci_u, e
+
+@profiled
+def user_group_sequential_ci(control, treatment, alpha=0.05, looks=5, spending='obrien-fleming', covariates=None,
+                             metric='action_count'):
+    """
+    group_sequential_ci on the cumulative per-user totals, CUPED-adjusted if covariates is given, see user_msprt_ci
+    """
+    metric = covariates.metric if covariates is not None else metric
+    planned = look_days(shared_days(control, treatment)[1], looks)
+    boundaries = dict(zip(planned.tolist(), group_sequential_boundaries(len(planned), alpha, spending)))
+    for day, users_c, y_c, users_t, y_t in cumulative_totals(control, treatment, metric):
+        if day not in boundaries:
+            continue
+        if covariates is not None:
+            y_c, y_t, _ = cuped.cuped_adjust(y_c, covariates.lookup(users_c), y_t, covariates.lookup(users_t))
+        e = y_t.mean() - y_c.mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ci_l, ci_u = group_sequential_interval(e, np.var(y_c), len(y_c), np.var(y_t), len(y_t), boundaries[day])
+        if check_zero_in_interval(ci_l, ci_u):
+            return 1, day, ci_l, ci_u, e
+
+    return 0, day, ci_l, ci_u, e
+
+@profiled
+def user_sums(data, metric='action_count'):
+    """
+    Per-user sum of metric, indexed by userid
+    """
+    return data.groupby('userid', observed=True)[metric].sum()
+
+@profiled
+def welchtest(control, treatment, alpha=0.05, covariates=None):
     """
     run welch t-test
+
+    If covariates (a cuped.CovariateTable) is given, the per-user sums are CUPED-adjusted first
     """
 
     ## 6. Display Welch's T-Test
-    user_data_sums_control = control.groupby('userid')['action_count'].sum()
-    user_data_sums_treat = treatment.groupby('userid')['action_count'].sum()
+    user_data_sums_control = user_sums(control)
+    user_data_sums_treat = user_sums(treatment)
+
+    if covariates is not None:
+        user_data_sums_control, user_data_sums_treat, _ = cuped.cuped_adjust(
+            user_data_sums_control, covariates.lookup(user_data_sums_control.index),
+            user_data_sums_treat, covariates.lookup(user_data_sums_treat.index))
 
     mean_c = round(user_data_sums_control.mean(),2)
     mean_t = round(user_data_sums_treat.mean(),2)
@@ -137,4 +528,94 @@ def welchtest(control, treatment, alpha=0.05):
     # Perform Welch's t-test
     t_stat, p_value = stats.ttest_ind(user_data_sums_treat,user_data_sums_control, equal_var=False)
 
-    return mean_c, mean_t, relative_lift, p_value
\ No newline at end of file
+    return mean_c, mean_t, relative_lift, p_value
+
+@profiled
+def batch_tests(values, variant, segments=None, alpha=0.05):
+    """
+    Welch t-test, t-interval and mSPRT interval for every metric x segment cell at once
+
+    Counts, sums and sums of squares of all cells come from sparse products of a (group x user) indicator
+    matrix with the per-user matrix, so cost grows with users x metrics, not with the number of cells.
+    The intervals match fixedttest and msprt, and the p-values match welchtest. Segment 'All' covers every user.
+
+    Input: 
+    - values: per-user metrics, (users x metrics) DataFrame or array
+    - variant: per-user variant, 1 (or True) for treatment and 0 for control
+    - segments: optional per-user segment labels; users with a missing label only count in 'All'
+    - alpha: significance level alpha, usually 0.05
+
+    Output: 
+    - DataFrame with one row per (segment, metric), including Benjamini-Hochberg adjusted p-values
+      over all cells for multiple testing
+    """
+    metric_names = list(values.columns) if isinstance(values, pd.DataFrame) else list(range(np.shape(values)[1]))
+    values = np.asarray(values, dtype=float)
+    treated = np.asarray(variant).astype(bool)
+
+    users = np.arange(len(values))
+    rows, cols = treated.astype(int), users
+    segment_names = []
+    if segments is not None:
+        # users without a segment (NaN / None, code -1) are only counted in 'All'
+        segment_codes, segment_names = pd.factorize(np.asarray(segments, dtype=object), sort=True)
+        segmented = segment_codes >= 0
+        rows = np.concatenate([rows, 2 * (segment_codes[segmented] + 1) + treated[segmented]])
+        cols = np.concatenate([cols, users[segmented]])
+    segment_names = ['All'] + list(segment_names)
+
+    # each user belongs to (All, variant) and (its segment, variant)
+    n_groups = 2 * len(segment_names)
+    indicator = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_groups, len(values)))
+
+    # shifting by the overall mean keeps the sum of squares numerically stable
+    shift = values.mean(axis=0)
+    shifted = values - shift
+    n = np.asarray(indicator.sum(axis=1)).reshape(-1, 1)
+    shifted_mean = (indicator @ shifted) / n
+    m2 = indicator @ shifted ** 2 - n * shifted_mean ** 2
+    mean = shifted_mean + shift
+
+    n_c, n_t = n[0::2], n[1::2]
+    mean_c, mean_t = mean[0::2], mean[1::2]
+    var_c, var_t = m2[0::2] / (n_c - 1), m2[1::2] / (n_t - 1)
+    delta = mean_t - mean_c
+
+    t_stat, p_value = welch_from_stats(delta, var_c, n_c, var_t, n_t)
+
+    ci_l, ci_u = ttest_interval(delta, var_c, n_c, var_t, n_t, alpha)
+    msprt_l, msprt_u = msprt_interval(delta, m2[0::2] / n_c, n_c, m2[1::2] / n_t, n_t, alpha)
+
+    shape = delta.shape
+    results = pd.DataFrame({
+        'segment': np.repeat(segment_names, shape[1]),
+        'metric': np.tile(metric_names, shape[0]),
+        'n_c': np.broadcast_to(n_c, shape).ravel(),
+        'n_t': np.broadcast_to(n_t, shape).ravel(),
+        'mean_c': mean_c.ravel(),
+        'mean_t': mean_t.ravel(),
+        'var_c': var_c.ravel(),
+        'var_t': var_t.ravel(),
+        'delta': delta.ravel(),
+        'relative_lift': (delta / mean_c).ravel(),
+        't_stat': t_stat.ravel(),
+        'p_value': p_value.ravel(),
+        'ci_lower': ci_l.ravel(),
+        'ci_upper': ci_u.ravel(),
+        'msprt_lower': msprt_l.ravel(),
+        'msprt_upper': msprt_u.ravel(),
+    })
+    results['p_value_adj'] = benjamini_hochberg(results['p_value'].to_numpy())
+    return results
+
+@profiled
+def benjamini_hochberg(p_values):
+    """
+    Benjamini-Hochberg adjusted p-values (NaNs are left as is)
+    """
+    adjusted = np.full(len(p_values), np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    order = valid[np.argsort(p_values[valid])]
+    ranked = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    adjusted[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return adjusted
@@ -4,13 +4,16 @@ import numpy as np
 
 class User:
     # def __init__(self, registration_date):
-    def __init__(self):
+    def __init__(self, rng=None):
+        # every draw, including the UUID, comes from rng so a seeded generator reproduces the user
+        rng = np.random.default_rng() if rng is None else rng
+
         # base user attributes
-        self.user_id = str(uuid.uuid4())
-        self.gender = np.random.choice(['Male', 'Female', 'Nonbinary'], p=[0.48, 0.48, 0.04])
-        self.age = max(int(np.random.normal(loc=29, scale=5)), 18)  # Normal distribution, minimum age 18
+        self.user_id = str(uuid.UUID(bytes=rng.bytes(16), version=4))
+        self.gender = rng.choice(['Male', 'Female', 'Nonbinary'], p=[0.48, 0.48, 0.04])
+        self.age = max(int(rng.normal(loc=29, scale=5)), 18)  # Normal distribution, minimum age 18
         self.registration_date = '2023-01-01' # fixed date for now
-        self.usertype = np.random.choice(['Subscriber','Registrant'], p=[0.2, 0.8])
+        self.usertype = rng.choice(['Subscriber','Registrant'], p=[0.2, 0.8])
         
         # propensities
         self.visit_probability = self.calculate_visit_probability()
@@ -0,0 +1,152 @@
+import hashlib
+import uuid
+import numpy as np
+from helperfunctions.rng import generator, seed_sequence
+
+GENDERS = np.array(['Male', 'Female', 'Nonbinary'])
+GENDER_P = [0.48, 0.48, 0.04]
+USERTYPES = np.array(['Subscriber', 'Registrant'])
+USERTYPE_P = [0.2, 0.8]
+
+# per-code propensity factors, same values as User.calculate_visit_probability / calculate_action_lambda
+GENDER_VISIT_FACTOR = np.array([0.5, 0.6, 0.55])
+USERTYPE_VISIT_FACTOR = np.array([0.6, 0.4])
+GENDER_ACTION_FACTOR = np.array([1, 1.5, 1.25])
+USERTYPE_ACTION_FACTOR = np.array([1.5, 1])
+
+# users per attribute stream: block k of users draws from its own child stream, so a pool of n users
+# is always the first n users of any larger pool with the same seed
+USER_BLOCK = 2**16
+
+
+class UUIDColumn:
+    """
+    UUIDs for integer user ids 0..size-1, formatted only when asked for.
+
+    Each UUID is a keyed hash of the integer id, so nothing is stored per user and
+    any single id can be formatted in O(1) without generating the rest of the column.
+    """
+
+    def __init__(self, size, key):
+        self.size = size
+        self.key = key
+        self._index = None
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"UUIDColumn({self.size} ids)"
+
+    def _format(self, user_id):
+        digest = hashlib.blake2b(int(user_id).to_bytes(8, 'little'), key=self.key, digest_size=16).digest()
+        return str(uuid.UUID(bytes=digest, version=4))
+
+    def __getitem__(self, user_ids):
+        if np.ndim(user_ids) == 0:
+            if not 0 <= user_ids < self.size:
+                raise IndexError(f"user id {user_ids} out of range")
+            return self._format(user_ids)
+        return np.array([self[i] for i in np.asarray(user_ids).ravel()], dtype=object)
+
+    def index_of(self, user_uuid):
+        """
+        Reverse lookup from a UUID string to its integer id (None if unknown).
+        The lookup table is built on first use.
+        """
+        if self._index is None:
+            self._index = {self._format(i): i for i in range(self.size)}
+        return self._index.get(user_uuid)
+
+
+class UserPool:
+    """
+    Columnar pool of users backed by NumPy arrays.
+
+    Draws the same attributes as helperfunctions.user.User, but for a block of USER_BLOCK users at
+    a time in a few batched RNG calls, each block from its own child stream of seed. Users are addressed
+    by integer id (their row position); UUIDs are formatted lazily through a UUIDColumn.
+    """
+
+    def __init__(self, number_of_users, seed=None):
+        seed = seed_sequence(seed)
+        self.size = number_of_users
+        self.ids = np.arange(number_of_users, dtype=np.int32)
+        self.uuids = UUIDColumn(number_of_users, generator(seed, 'uuid_key').bytes(16))
+
+        # base user attributes
+        self.gender_codes = np.empty(number_of_users, dtype=np.int8)
+        self.age = np.empty(number_of_users, dtype=np.int16)
+        self.usertype_codes = np.empty(number_of_users, dtype=np.int8)
+        for first in range(0, number_of_users, USER_BLOCK):
+            # full blocks are always drawn, so a block's users do not depend on the pool size
+            size = min(USER_BLOCK, number_of_users - first)
+            rng = generator(seed, 'users', first // USER_BLOCK)
+            self.gender_codes[first:first + size] = rng.choice(len(GENDERS), size=USER_BLOCK, p=GENDER_P)[:size]
+            self.age[first:first + size] = np.maximum(rng.normal(loc=29, scale=5, size=USER_BLOCK).astype(np.int16), 18)[:size]
+            self.usertype_codes[first:first + size] = rng.choice(len(USERTYPES), size=USER_BLOCK, p=USERTYPE_P)[:size]
+        self.registration_date = '2023-01-01' # fixed date for now
+
+        # propensities
+        self.visit_probability = self.calculate_visit_probabilities()
+        self.action_lambda = self.calculate_action_lambdas()
+
+    def __repr__(self):
+        return f"UserPool({self.size} users)"
+
+    def __len__(self):
+        return self.size
+
+    def calculate_visit_probabilities(self):
+        age_factor = 0.6 - (self.age - 18) * 0.01
+        gender_factor = GENDER_VISIT_FACTOR[self.gender_codes]
+        type_factor = USERTYPE_VISIT_FACTOR[self.usertype_codes]
+        return np.clip(age_factor + gender_factor + type_factor, 0.3, 0.6)
+
+    def calculate_action_lambdas(self):
+        age_factor = 1 + (30 - self.age) * 0.1
+        gender_factor = GENDER_ACTION_FACTOR[self.gender_codes]
+        type_factor = USERTYPE_ACTION_FACTOR[self.usertype_codes]
+        return age_factor + gender_factor + type_factor
+
+    @property
+    def gender(self):
+        return GENDERS[self.gender_codes]
+
+    @property
+    def usertype(self):
+        return USERTYPES[self.usertype_codes]
+
+    def get_user(self, user_id):
+        """
+        Look up a user by integer id or UUID string and return their attributes as a dict
+        """
+        if isinstance(user_id, str):
+            user_id = self.uuids.index_of(user_id)
+            if user_id is None:
+                return "User not found"
+        elif not 0 <= user_id < self.size:
+            return "User not found"
+        return {
+            'id': int(user_id),
+            'user_id': self.uuids[user_id],
+            'gender': str(GENDERS[self.gender_codes[user_id]]),
+            'age': int(self.age[user_id]),
+            'usertype': str(USERTYPES[self.usertype_codes[user_id]]),
+            'visit_probability': float(self.visit_probability[user_id]),
+            'action_lambda': float(self.action_lambda[user_id]),
+        }
+
+    def get_user_ids(self):
+        return self.ids
+
+    def users_in_list_form(self):
+        columns = zip(self.uuids[self.ids], self.gender, self.age.tolist(), self.usertype,
+                      np.round(self.visit_probability, 2), np.round(self.action_lambda, 2))
+        return [list(row) for row in columns]
+
+    def get_visit_probabilities(self):
+        return self.visit_probability
+
+    def get_action_lambdas(self):
+        return self.action_lambda
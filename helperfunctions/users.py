@@ -1,11 +1,13 @@
 from helperfunctions.user import User
+from helperfunctions.rng import generator
 
 class Users:
 
-    def __init__(self, number_of_users):
+    def __init__(self, number_of_users, seed=None):
         self.users = {}
+        rng = generator(seed, 'users')
         for _ in range(number_of_users):
-            user = User()
+            user = User(rng)
             self.users[user.user_id] = user
 
     def __repr__(self):
@@ -14,6 +16,9 @@ class Users:
     def get_user(self, user_id):
         return self.users.get(user_id, "User not found")
 
+    def get_user_ids(self):
+        return list(self.users.keys())
+
     def all_users(self):
         return self.users.values()
     
@@ -2,9 +2,22 @@ import numpy as np
 import pandas as pd
 import streamlit as st
 import uuid
+import json
+import os
+import contextlib
 from datetime import datetime, timedelta
 import helperfunctions.data_gen_funcs as gen_funcs
 import helperfunctions.statistical_tests as st_funcs
+import helperfunctions.cuped as cuped
+import helperfunctions.assignment as assignment
+import helperfunctions.planner as planner
+import helperfunctions.sketches as sketches
+import helperfunctions.resampling as resampling
+import helperfunctions.metrics as metrics
+import helperfunctions.cube as cube
+import helperfunctions.userpool as userpool
+import helperfunctions.profiling as profiling
+import helperfunctions.event_store as event_store
 from scipy import stats
 import matplotlib.pyplot as plt
 
@@ -18,248 +31,460 @@ st.set_page_config(
     page_icon="👁",
 )
 
-st.write("# Run A Test")
-st.markdown(
-    """
-Use the UI below to run an A/B Test
-"""
-)
 ##############################################################################################################
 
-# Generate Users
+# Cached Data Generation
 
 ##############################################################################################################
-st.write("## Registrants")
-st.markdown(
+# Generated data only depends on the simulation inputs, so it is cached across reruns keyed by those inputs.
+# Analysis-only widgets (metric, test type, weeks, MDE) then re-render without regenerating anything.
+# cache_resource hands back the cached object itself instead of unpickling a copy on every hit, so a hit costs
+# nothing however many rows the frame has. The cached frames are therefore shared and read-only: derive new
+# frames from them, never modify them in place. max_entries bounds how many datasets are kept (least recently
+# used evicted first).
+
+@st.cache_resource(max_entries=4)
+def load_users(usercount, seed):
+    return gen_funcs.create_user_dataset(usercount, seed=seed)
+
+@st.cache_resource(max_entries=4)
+def load_pool(usercount, seed):
+    return userpool.UserPool(usercount, seed=seed)
+
+# optional directory of a helperfunctions.event_store.EventStore shared by every session (e.g. EVENT_STORE_PATH=.events)
+EVENT_STORE_PATH = os.environ.get('EVENT_STORE_PATH', '')
+
+@st.cache_resource(max_entries=8)
+def load_events(usercount, min_per_day, param, seed, stream, start_date, end_date, realistic=False):
+    # each stream (pre-period, control, treatment) gets its own seed derived from the user pool's.
+    # With EVENT_STORE_PATH set, events are simulated once per set of inputs and read back from Parquet
+    # afterwards (only the partitions of the requested dates), also by other sessions and processes
+    store = None
+    if EVENT_STORE_PATH:
+        store = event_store.EventStore(os.path.join(EVENT_STORE_PATH, f'events_{usercount}_{min_per_day}_{param}_{seed}_{stream}_{int(realistic)}'))
+        if set(pd.date_range(start_date, end_date)) <= set(store.dates()):
+            data_df = store.read(start_date, end_date + timedelta(days=1)).drop(columns='variant')
+            data_df['date'] = data_df['date'].astype('datetime64[us]')
+            return data_df.sort_values('date', kind='stable', ignore_index=True)
+    if realistic:
+        pool = load_pool(usercount, seed)
+        data_df = gen_funcs.generate_realistic_dataframe(start_date, end_date, pool,
+                                                         visit_scale=gen_funcs.realistic_visit_scale(pool, min_per_day),
+                                                         seed=(seed, stream))
+    else:
+        users = load_users(usercount, seed)
+        data_df = gen_funcs.generate_main_dataframe(start_date, end_date, users, param=param, min_per_day=min_per_day,
+                                                    seed=(seed, stream))
+    if store is not None:
+        store.write(data_df)
+    return data_df
+
+@st.cache_resource(max_entries=8)
+def load_experiment_events(usercount, min_per_day, params, seed, start_date, end_date, realistic=False, novelty=0.0):
+    # one stream of traffic; the hash-based assignment puts each user in exactly one variant
+    experiment = assignment.Experiment('run_a_test', salt=seed)
+    if realistic:
+        # users keep their own action lambdas; the treatment scales them by the same relative lift
+        pool = load_pool(usercount, seed)
+        lifts = {variant: param / params['control'] - 1 for variant, param in params.items()}
+        return gen_funcs.generate_realistic_dataframe(start_date, end_date, pool, experiment, lifts, novelty=novelty,
+                                                      visit_scale=gen_funcs.realistic_visit_scale(pool, min_per_day), seed=(seed, 1))
+    users = load_users(usercount, seed)
+    return gen_funcs.generate_experiment_dataframe(start_date, end_date, users, experiment, params,
+                                                   min_per_day=min_per_day, seed=(seed, 1))
+
+@st.cache_resource(max_entries=8)
+def load_plan(usercount, min_per_day, seed, metric, start_date, end_date, approximate=False, realistic=False):
+    # per-week sample moments for every window length and the unique user curve, computed once per dataset;
+    # approximate=True serves both from constant-memory sketches instead of exact per-user aggregation
+    data_df = load_events(usercount, min_per_day, 2, seed, 0, start_date, end_date, realistic)
+    if metric not in data_df:
+        # derived and ratio metrics come from the per-user sufficient statistics (delta method for ratios)
+        stats = metrics.SufficientStats(data_df.drop(columns='variant', errors='ignore'), start_date)
+        return (metrics.window_moments(stats, metric, np.arange(1, 51)),
+                planner.cumulative_unique_users(data_df, start_date, sketch=approximate))
+    if approximate:
+        weekly_sketches = sketches.build_sketches(data_df, metric, start_date, period_days=7)
+        return (sketches.window_summaries(weekly_sketches, np.arange(1, 51)),
+                planner.cumulative_unique_users(data_df, start_date, sketch=True))
+    return (load_cube(usercount, min_per_day, seed, metric, start_date, end_date, realistic).window_moments(np.arange(1, 51)),
+            planner.cumulative_unique_users(data_df, start_date))
+
+@st.cache_resource(max_entries=4)
+def load_cube(usercount, min_per_day, seed, metric, start_date, end_date, realistic=False):
+    # (day x user) metric sums with weekly prefix checkpoints: any window over the pre-period is a prefix difference
+    data_df = load_events(usercount, min_per_day, 2, seed, 0, start_date, end_date, realistic)
+    return cube.UserDayCube(data_df, metric, start_date)
+
+@st.cache_resource(max_entries=8)
+def load_experiment_stats(usercount, min_per_day, params, seed, start_date, end_date, realistic=False, novelty=0.0):
+    # every metric of the experiment is analysed from these aggregates, so switching metrics is free
+    return metrics.SufficientStats(load_experiment_events(usercount, min_per_day, params, seed, start_date, end_date,
+                                                          realistic, novelty),
+                                   start_date)
+
+@st.cache_resource(max_entries=4)
+def load_covariates(usercount, min_per_day, seed, start_date, end_date, realistic=False):
+    # pre-experiment covariates are computed once per pre-period and reused by every test on it
+    return cuped.CovariateTable(load_events(usercount, min_per_day, 2, seed, 0, start_date, end_date, realistic))
+
+# Diagnostics: record where this rerun's time goes (cached loaders that hit the cache do not show up)
+profile_rerun = st.sidebar.checkbox('Profile this rerun')
+# the capture is closed however the rerun ends (an exception, or Streamlit interrupting it for a newer rerun)
+with profiling.capture() if profile_rerun else contextlib.nullcontext() as profile_run:
+    st.write("# Run A Test")
+    st.markdown(
+        """
+    Use the UI below to run an A/B Test
     """
-Number of Registrants on Website to simulate
-"""
-)
-usercount = st.slider('User Count', min_value=50000, max_value=100000,value=75000)
-users = gen_funcs.create_user_dataset(usercount)
-
-##############################################################################################################
-
-# Generate Events
+    )
+    ##############################################################################################################
 
-##############################################################################################################
+    # Generate Users
 
-st.markdown(
+    ##############################################################################################################
+    st.write("## Registrants")
+    st.markdown(
+        """
+    Number of Registrants on Website to simulate
     """
-set minimum DAU
-"""
-)
-min_users = st.slider('minimum DAU', min_value=100, max_value=usercount,value=100)
-start_date = datetime(2023, 1, 1)
-end_date = datetime(2023, 12, 31)
-data_df = gen_funcs.generate_main_dataframe(start_date, end_date, users,param=2,min_per_day=min_users)
-
+    )
+    usercount = st.slider('User Count', min_value=50000, max_value=100000,value=75000)
+    seed = int(st.number_input('Random Seed', min_value=0, value=42, step=1))
+    users = load_users(usercount, seed)
 
-##############################################################################################################
+    ##############################################################################################################
 
-# Select Metrics
+    # Generate Events
 
-##############################################################################################################
+    ##############################################################################################################
 
-st.markdown(
+    st.markdown(
+        """
+    set minimum DAU
     """
-## Select Metrics
-"""
-)
+    )
+    min_users = st.slider('minimum DAU', min_value=100, max_value=usercount,value=100)
+    realistic = st.checkbox('Realistic traffic (per-user propensities, weekly seasonality)')
+    if realistic:
+        st.write('Each registrant visits with their own visit probability (higher on weekdays) and acts at their own rate. '
+                 'DAU is scaled to about 1.5x the minimum DAU. See the Data Generation appendix.')
+    start_date = datetime(2023, 1, 1)
+    end_date = datetime(2023, 12, 31)
+    # the 2023 events are generated (and cached) by load_events when the planner and CUPED first need them
 
-option1 = pd.DataFrame({'metrics': ['action_count']})
-metric_option = st.selectbox('Select a Metric',option1['metrics'])
 
-##############################################################################################################
+    ##############################################################################################################
 
-# Sequential Test?
+    # Select Metrics
 
-##############################################################################################################
+    ##############################################################################################################
 
-st.markdown(
+    st.markdown(
+        """
+    ## Select Metrics
     """
-## Sequential Test?
+    )
 
-Sequential Tests typically have less power than a regular test (given all else equal), but is useful for when there is prior justification that
-the ability to make an earlier decision would be valuable for the feature. 
+    option1 = pd.DataFrame({'metrics': list(metrics.METRICS)})
+    metric_option = st.selectbox('Select a Metric',option1['metrics'])
+    metric = metrics.METRICS[metric_option]
+    st.write('Per user:', metric.numerator, 'summed over the test' if not metric.is_ratio else
+             f'ratio of summed {metric.numerator} to summed {metric.denominator}, analysed with the delta method ([Deng et al., 2018](https://arxiv.org/pdf/1803.06336.pdf))')
 
-Examples can be found here: https://docs.statsig.com/experiments-plus/sequential-testing
+    ##############################################################################################################
 
-The type of Sequential Test implemented here is mSPRT ([Zhao et al., 2019](https://arxiv.org/pdf/1905.10493.pdf))
-"""
-)
+    # Sequential Test?
 
-option2 = pd.DataFrame({'Test Type': ['Fixed Horizon Test','Sequential Test (mSPRT)']})
-flg_st = st.selectbox('Select a Specification',option2['Test Type'])
+    ##############################################################################################################
 
-##############################################################################################################
+    st.markdown(
+        """
+    ## Sequential Test?
 
-# Outputs sample mean and sample variance
+    Sequential Tests typically have less power than a regular test (given all else equal), but is useful for when there is prior justification that
+    the ability to make an earlier decision would be valuable for the feature. 
 
-##############################################################################################################
-st.write('## Sample Mean and Sample Variance')
-st.markdown(
+    Examples can be found here: https://docs.statsig.com/experiments-plus/sequential-testing
+
+    The type of Sequential Test implemented here is mSPRT ([Zhao et al., 2019](https://arxiv.org/pdf/1905.10493.pdf)), which lets you peek at any time.
+    If the peeks can be scheduled up front, a group-sequential test with alpha spending ([Lan and DeMets, 1983](https://doi.org/10.1093/biomet/70.3.659))
+    only spends its alpha at those looks and is more powerful than mSPRT.
     """
-At a user level of the metric(s) of our choice
-"""
-)
-weeks = pd.DataFrame({'weeks': [i for i in range(1, 51)]})
-option3 = st.selectbox('How many weeks do we look over to compute our sample mean/variance?',weeks['weeks'])
-st.write('Notice how as the time period gets larger, the metric on average goes up. We explain this in the Appendix.')
+    )
 
-# Group data by userid and calculate the sum of action_count for each user
-start_date = '2023-01-01'
-end_date = pd.to_datetime(start_date) + pd.Timedelta(days=int(option3*7))
+    option2 = pd.DataFrame({'Test Type': ['Fixed Horizon Test','Sequential Test (mSPRT)','Group Sequential Test (alpha spending)']})
+    flg_st = st.selectbox('Select a Specification',option2['Test Type'])
+    if flg_st == 'Group Sequential Test (alpha spending)':
+        col1, col2 = st.columns(2)
+        looks = col1.slider('Number of Looks (equally spaced over the test)', min_value=2, max_value=10, value=5)
+        spending = col2.selectbox('Spending Function', list(st_funcs.SPENDING_FUNCTIONS))
 
-user_data_sum = data_df[(data_df['date'] >= start_date) & (data_df['date'] < end_date)].groupby('userid')[metric_option].sum()
+    ##############################################################################################################
 
-# Calculate the sample mean and sample variance and output
-st.write("Sample Mean:", round(user_data_sum.mean(),2))
-st.write("Sample Variance:", round(np.var(user_data_sum,ddof=1),2))
+    # Outputs sample mean and sample variance
 
-##############################################################################################################
+    ##############################################################################################################
+    st.write('## Sample Mean and Sample Variance')
+    st.markdown(
+        """
+    At a user level of the metric(s) of our choice
+    """
+    )
+    weeks = pd.DataFrame({'weeks': [i for i in range(1, 51)]})
+    option3 = st.selectbox('How many weeks do we look over to compute our sample mean/variance?',weeks['weeks'])
+    st.write('Notice how as the time period gets larger, the metric on average goes up. We explain this in the Appendix.')
 
-# Choose Approximate True Effect
+    approximate = st.checkbox('Approximate with sketches (HyperLogLog / Count-Sketch, constant memory)')
 
-##############################################################################################################
-st.write('## The True Effect we will Simulate in this Simulation')
-st.markdown(
+    # Sample mean and variance of the per-user sum over the first k weeks, precomputed for every k
+    moments, unique_user_curve = load_plan(usercount, min_users, seed, metric_option, start_date, end_date, approximate, realistic)
+
+    # Calculate the sample mean and sample variance and output
+    st.write("Sample Mean:", round(moments.loc[option3, 'mean'],2))
+    st.write("Sample Variance:", round(moments.loc[option3, 'variance'],2))
+    if 'variance_se' in moments:
+        # the sketched variance is a difference of two estimates, so report how far off it may be
+        st.write("Standard error of the sketched variance:", round(moments.loc[option3, 'variance_se'],2))
+
+    st.markdown(
+        """
+    CUPED ([Deng et al., 2013](https://exp-platform.com/Documents/2013-02-CUPED-ImprovingSensitivityOfControlledExperiments.pdf))
+    adjusts each user's metric by their pre-experiment value of the same metric (here, their 2023 activity).
+    The more the pre-period predicts the experiment period, the more variance is removed: a correlation of rho between them
+    leaves (1 - rho squared) of the variance, and the sample size shrinks by the same factor.
     """
-This is an approximation because how you gather the data (e.g., how long you run the test) can change the metric of interest.
-More info of this in the Data Generation page.
+    )
+    use_cuped = st.checkbox('Use CUPED (pre-period: 2023)') if metric_option == 'action_count' else False
+    # estimated on 2023 alone: its last option3 weeks stand in for the experiment, the weeks before for the covariate
+    rho2 = cuped.variance_reduction(load_cube(usercount, min_users, seed, metric_option, start_date, end_date, realistic),
+                                    option3) if use_cuped else 0.0
+    planning_moments = moments.assign(variance=(1 - rho2) * moments['variance'])
+    if use_cuped:
+        st.write("Variance removed by CUPED (rho squared):", round(rho2, 3))
+        st.write("CUPED-adjusted Sample Variance:", round(planning_moments.loc[option3, 'variance'],2))
 
-In a real A/B test, you will not know this!
-"""
-)
-trueeffect = st.slider('x (%)',value=10) 
-st.write('The secret approximate relative lift of ',trueeffect, '%')
+    ##############################################################################################################
 
-##############################################################################################################
+    # Choose Approximate True Effect
 
-# State Null and Alt. Hypothesis
+    ##############################################################################################################
+    st.write('## The True Effect we will Simulate in this Simulation')
+    st.markdown(
+        """
+    This is an approximation because how you gather the data (e.g., how long you run the test) can change the metric of interest.
+    More info of this in the Data Generation page.
 
-##############################################################################################################
-st.write('## Our hypothesis')
-st.write('We will test this with the typical .8 power and .05 alpha')
+    In a real A/B test, you will not know this!
+    """
+    )
+    trueeffect = st.slider('x (%)',value=10) 
+    st.write('The secret approximate relative lift of ',trueeffect, '%')
+    novelty = 0.0
+    if realistic:
+        novelty = st.slider('Novelty effect (% extra lift on day 1, halving every week; negative for a primacy effect)',
+                            min_value=-100, max_value=200, value=0) / 100
 
-st.latex(r'''
-    H_0: \mu_C = \mu_T
-    ''')
-st.latex(r'''
-    H_1: \mu_C\neq \mu_T
-    ''')
+    ##############################################################################################################
 
+    # State Null and Alt. Hypothesis
 
-##############################################################################################################
+    ##############################################################################################################
+    st.write('## Our hypothesis')
+    st.write('We will test this with the typical .8 power and .05 alpha')
 
-# Sample Size Calculator
+    st.latex(r'''
+        H_0: \mu_C = \mu_T
+        ''')
+    st.latex(r'''
+        H_1: \mu_C\neq \mu_T
+        ''')
 
-##############################################################################################################
 
-st.write('## Calculate Sample Size Needed')
-st.markdown(
-    """
-van Belle ([2002](http://vanbelle.org/chapters%5Cwebchapter2.pdf))'s sample size calculator shortcut for .8 power and .05 alpha. 
-The sigma squared is the sample variance and delta is the minimum amount of change you want to detect. n is the number of users
-in each variant and assumes equal size
-"""
-)
+    ##############################################################################################################
 
+    # Sample Size Calculator
 
-st.latex(r'''
-    n=\frac{16\sigma^2}{\delta^2}
-    ''')
+    ##############################################################################################################
 
-st.write('The delta, or minimum detectable effect (MDE), is the change you want to be able to detect.')
-mde = st.slider('MDE (%)', min_value=1, max_value=10,value=5)
-n = round((16*np.var(user_data_sum,ddof=1))/(np.mean(user_data_sum)*(mde/100))**2)
-st.write('Given the above configurations, we need: ', n, ' users per variant')
+    st.write('## Calculate Sample Size Needed')
+    st.markdown(
+        """
+    van Belle ([2002](http://vanbelle.org/chapters%5Cwebchapter2.pdf))'s sample size calculator shortcut for .8 power and .05 alpha. 
+    The sigma squared is the sample variance and delta is the minimum amount of change you want to detect. n is the number of users
+    in each variant and assumes equal size
+    """
+    )
 
-##############################################################################################################
 
-# Plots the # of unique users over time to see how long the test must be run
+    st.latex(r'''
+        n=\frac{16\sigma^2}{\delta^2}
+        ''')
 
-##############################################################################################################
-# Group by date and count unique users
-# Sort the dataframe by date
-data_df = data_df.sort_values(by='date')
+    st.write('The delta, or minimum detectable effect (MDE), is the change you want to be able to detect.')
+    mde = st.slider('MDE (%)', min_value=1, max_value=10,value=5)
+    n = int(planner.sample_size(planning_moments.loc[option3, 'variance'], moments.loc[option3, 'mean'], mde/100))
+    st.write('Given the above configurations, we need: ', n, ' users per variant')
 
-# Create a new column for days_from_experiment_start
-data_df['days_from_experiment_start'] = (data_df['date'] - data_df['date'].min()).dt.days + 1
+    with st.expander('Sample size and duration for every MDE and number of weeks'):
+        sample_sizes = planner.sample_size_grid(planning_moments, np.arange(1, 11)/100)
+        durations = planner.duration_grid(sample_sizes, unique_user_curve)
+        sample_sizes.columns = durations.columns = [f'{mde_option}%' for mde_option in range(1, 11)]
+        st.write('Users per variant (rows: weeks used for the sample mean/variance, columns: MDE)' +
+                 (', with the variance reduction of CUPED estimated for the selected weeks' if use_cuped else ''))
+        st.dataframe(sample_sizes)
+        st.write('Days needed to reach that many unique users in both variants (blank if never)')
+        st.dataframe(durations)
 
-# Group by days_from_experiment_start and count unique users
-daily_unique_users = data_df.groupby('days_from_experiment_start')['userid'].nunique().cumsum().reset_index()
+    ##############################################################################################################
 
-# Plot
-daily_unique_users_capped = daily_unique_users[daily_unique_users['userid'] <= (n*2)] # bug: needs to round up, not round down
-# Rename the column
-daily_unique_users_capped = daily_unique_users_capped.rename(columns={'userid': 'unique_users'})
-st.line_chart(data = daily_unique_users_capped,x='days_from_experiment_start',y='unique_users')
-st.write('In practice, this chart may look more logarithmic, since repeat users are excluded from the unique user count')
+    # Plots the # of unique users over time to see how long the test must be run
 
-daysrun = np.max(daily_unique_users_capped['days_from_experiment_start'])
-st.write('It looks like we need about ',daysrun,' days to reach our sample size')
-st.markdown("""Note that if it takes less than 7 days to reach our sample size, we should still run the test for at least a week 
-                to capture weekly seasonality ([Larsen et al., 2023](https://arxiv.org/pdf/2212.11366.pdf))
-                """)
+    ##############################################################################################################
+    # Cumulative number of distinct users, counting each user on the first day they show up
+    daysrun = planner.days_to_reach(unique_user_curve, n*2)
+    if daysrun is None:
+        st.write('We never reach ', n*2, ' unique users in a year of traffic - try a larger MDE')
+        daysrun = int(unique_user_curve['days_from_experiment_start'].max())
 
-# minimum of 7 days
-daysrun = max(daysrun, 7)
+    # Plot
+    st.line_chart(data = unique_user_curve.iloc[:daysrun],x='days_from_experiment_start',y='unique_users')
+    st.write('Repeat users are only counted once, so the curve flattens as more of the registrant base has already been seen')
 
+    st.write('It looks like we need about ',daysrun,' days to reach our sample size')
+    st.markdown("""Note that if it takes less than 7 days to reach our sample size, we should still run the test for at least a week 
+                    to capture weekly seasonality ([Larsen et al., 2023](https://arxiv.org/pdf/2212.11366.pdf))
+                    """)
 
-##############################################################################################################
+    # minimum of 7 days
+    daysrun = max(daysrun, 7)
 
-# Run statistical test
 
-##############################################################################################################
-st.write('## Post-Experiment Analysis')
+    ##############################################################################################################
 
-param = 2
-trueeffectmod = param*(1+(trueeffect/100))
+    # Run statistical test
 
-## Run Test for specified number of days
-start_date_new = datetime(2024, 1, 1)
-end_date_new = start_date_new + timedelta(days=int(daysrun))
+    ##############################################################################################################
+    st.write('## Post-Experiment Analysis')
 
-data_df_control = gen_funcs.generate_main_dataframe(start_date_new, end_date_new, users,param=param)
-data_df_treat = gen_funcs.generate_main_dataframe(start_date_new, end_date_new, users,param=trueeffectmod)
+    param = 2
+    trueeffectmod = param*(1+(trueeffect/100))
 
+    ## Run Test for specified number of days
+    start_date_new = datetime(2024, 1, 1)
+    end_date_new = start_date_new + timedelta(days=int(daysrun))
 
-if flg_st == 'Sequential Test (mSPRT)':
-    st.markdown(
-    """
-    Now, we run mSPRT. We use the Confidence Interval Method here, which has equivalence with the p-value method. 
-    Here, we reject the null if the interval does not include 0. 
-    """
-    )
-    result, day, ci_l, ci_u, e = st_funcs.msprt_ci(data_df_control, data_df_treat)
+    experiment_params = {'control': param, 'treatment': trueeffectmod}
+    data_df_experiment = load_experiment_events(usercount, 200, experiment_params, seed, start_date_new, end_date_new,
+                                                realistic, novelty)
+    data_df_control = data_df_experiment[data_df_experiment['variant'] == 'control']
+    data_df_treat = data_df_experiment[data_df_experiment['variant'] == 'treatment']
 
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Mean Difference", round(e,2), "")
-    col2.metric("Days Run", day, "")
-    col3.metric("Lower CI Bound", round(ci_l,4), "")
-    col4.metric('Upper CI Bound', round(ci_u,4), "")
+    covariates = load_covariates(usercount, min_users, seed, datetime(2023, 1, 1), datetime(2023, 12, 31), realistic) if use_cuped else None
+    # cumulative per-user sufficient statistics of every metric, cached, so switching metrics or tests is free
+    experiment_stats = load_experiment_stats(usercount, 200, experiment_params, seed, start_date_new, end_date_new,
+                                             realistic, novelty)
 
 
-else:
-    st.markdown(
+    if flg_st == 'Sequential Test (mSPRT)':
+        st.markdown(
         """
-    Now that the experiment duration has been reached, we perform Welch's t-test. For our non-proportions data, it is most common to run
-    a Welch's t-test, which is a unequal variance robust variation of the t-test. It is not recommended to test for equal variances and then choose
-    the variation of the t-test. Instead, it is recommended to just use Welch's t-test anyways. 
-
-    There are some scenarios where one should rely on a permutation test if the sample is not large enough to mitigate the skewness of the underlying
-    distribution. In the case of two sample t-tests, because you are looking at the difference of the two variables with similar distributions, 
-    the number of samples needed for the normality assumption to be plausible tends to be fewer, 
-    especially if the traffic allocation is the same ([Kohavi, Tang and Xu, 2019](https://www.researchgate.net/publication/339914315_Trustworthy_Online_Controlled_Experiments_A_Practical_Guide_to_AB_Testing)). 
-    Perhaps in a future iteration of this streamlit application, we will explore that nuance further. 
-    """
-    )
+        Now, we run mSPRT. We use the Confidence Interval Method here, which has equivalence with the p-value method. 
+        Here, we reject the null if the interval does not include 0. 
+        """
+        )
+        # every metric is tested on cumulative per-user totals; CUPED adjusts the same totals
+        if use_cuped:
+            result, day, ci_l, ci_u, e = st_funcs.user_msprt_ci(data_df_control, data_df_treat, covariates=covariates)
+        else:
+            result, day, ci_l, ci_u, e = metrics.msprt_ci(experiment_stats, metric)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Mean Difference", round(e,2), "")
+        col2.metric("Days Run", day, "")
+        col3.metric("Lower CI Bound", round(ci_l,4), "")
+        col4.metric('Upper CI Bound', round(ci_u,4), "")
+
+    elif flg_st == 'Group Sequential Test (alpha spending)':
+        st.markdown(
+        """
+        Now, we run the group-sequential test. At each planned look we compare the z-statistic of the difference in means to that look's
+        boundary, computed once for this number of looks and spending function. The O'Brien-Fleming type spends almost no alpha early,
+        so its final boundary is close to the fixed horizon test's 1.96; the Pocock type spends alpha evenly and stops earlier for large effects.
+        Equivalently, we reject the null if the repeated confidence interval at a look does not include 0.
+        """
+        )
+        # at most one look per day, so a short test plans (and is tested with) fewer looks than the slider asks for
+        planned_days = st_funcs.look_days(daysrun + 1, looks)
+        if len(planned_days) < looks:
+            st.write('The test only runs', daysrun + 1, 'days, so we plan', len(planned_days), 'looks')
+        st.dataframe(pd.DataFrame({'Look': np.arange(1, len(planned_days) + 1),
+                                   'Day': planned_days,
+                                   'Z Boundary': st_funcs.group_sequential_boundaries(len(planned_days), 0.05, spending)}).set_index('Look').T)
+        if use_cuped:
+            result, day, ci_l, ci_u, e = st_funcs.user_group_sequential_ci(data_df_control, data_df_treat, looks=looks,
+                                                                           spending=spending, covariates=covariates)
+        else:
+            result, day, ci_l, ci_u, e = metrics.group_sequential_ci(experiment_stats, metric, looks=looks, spending=spending)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Mean Difference", round(e,2), "")
+        col2.metric("Days Run", day, "")
+        col3.metric("Lower CI Bound", round(ci_l,4), "")
+        col4.metric('Upper CI Bound', round(ci_u,4), "")
+
+
+    else:
+        st.markdown(
+            """
+        Now that the experiment duration has been reached, we perform Welch's t-test. For our non-proportions data, it is most common to run
+        a Welch's t-test, which is a unequal variance robust variation of the t-test. It is not recommended to test for equal variances and then choose
+        the variation of the t-test. Instead, it is recommended to just use Welch's t-test anyways. 
+
+        There are some scenarios where one should rely on a permutation test if the sample is not large enough to mitigate the skewness of the underlying
+        distribution. In the case of two sample t-tests, because you are looking at the difference of the two variables with similar distributions, 
+        the number of samples needed for the normality assumption to be plausible tends to be fewer, 
+        especially if the traffic allocation is the same ([Kohavi, Tang and Xu, 2019](https://www.researchgate.net/publication/339914315_Trustworthy_Online_Controlled_Experiments_A_Practical_Guide_to_AB_Testing)). 
+        Tick the box below to check the t-test against a permutation test and a BCa bootstrap interval, which make no normality assumption.
+        """
+        )
+
+        ## 6. Display Welch's T-Test
+        if use_cuped:
+            mean_c, mean_t, relative_lift, p_value = st_funcs.welchtest(data_df_control, data_df_treat, alpha=0.05, covariates=covariates)
+        else:
+            welch = metrics.welch(experiment_stats, metric)
+            mean_c, mean_t = round(welch['mean_c'],4), round(welch['mean_t'],4)
+            relative_lift, p_value = round(welch['relative_lift'],2), welch['p_value']
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Control", mean_c, "")
+        col2.metric("Treatment", mean_t, relative_lift)
+        col3.metric("p-value", round(p_value,6), "")
+        if metric_option == 'action_count' and st.checkbox('Also run a permutation test and bootstrap (10,000 resamples)'):
+            sums_c = st_funcs.user_sums(data_df_control, metric_option)
+            sums_t = st_funcs.user_sums(data_df_treat, metric_option)
+            permutation = resampling.permutation_test(sums_c, sums_t, seed=seed)
+            boot = resampling.bootstrap(sums_c, sums_t, statistic='relative', seed=seed)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Permutation p-value", round(permutation['p_value'],6), "")
+            col2.metric("Bootstrap Lower CI Bound (lift)", round(boot['ci_lower'],4), "")
+            col3.metric("Bootstrap Upper CI Bound (lift)", round(boot['ci_upper'],4), "")
+
+##############################################################################################################
 
-    ## 6. Display Welch's T-Test
-    mean_c, mean_t, relative_lift, p_value = st_funcs.welchtest(data_df_control, data_df_treat, alpha=0.05)
+# Diagnostics
 
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Control", mean_c, "")
-    col2.metric("Treatment", mean_t, relative_lift)
-    col3.metric("p-value", round(p_value,6), "")
\ No newline at end of file
+##############################################################################################################
+if profile_run is not None:
+    st.write('## Diagnostics')
+    profile_summary = profile_run.summary()
+    if profile_summary.empty:
+        st.write('Nothing was computed in this rerun - every result came from the cache')
+    else:
+        st.write('Time per function in this rerun (self time excludes the profiled functions it calls)')
+        st.dataframe(profile_summary)
+        st.bar_chart(profile_summary['self_s'])
+        st.download_button('Download trace (chrome://tracing / Perfetto)', json.dumps(profile_run.trace()),
+                           file_name='trace.json', mime='application/json')
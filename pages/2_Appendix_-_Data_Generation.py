@@ -4,6 +4,9 @@ import streamlit as st
 import uuid
 from datetime import datetime, timedelta
 import helperfunctions.data_gen_funcs as gen_funcs
+import helperfunctions.activities as activities
+import helperfunctions.userpool as userpool
+import helperfunctions.rng as rng
 from scipy import stats
 import plotly.figure_factory as ff
 import matplotlib.pyplot as plt
@@ -19,6 +22,20 @@ st.set_page_config(
     page_icon="👁",
 )
 
+# cache generated data across reruns (e.g. when the true difference slider moves); shared, read-only objects
+@st.cache_resource(max_entries=2)
+def load_users(num_users, seed):
+    return gen_funcs.create_user_dataset(num_users, seed=seed)
+
+@st.cache_resource(max_entries=2)
+def load_events(num_users, param, seed, start_date, end_date):
+    return gen_funcs.generate_main_dataframe(start_date, end_date, load_users(num_users, seed), param=param, seed=(seed, 0))
+
+@st.cache_resource(max_entries=2)
+def load_realistic_events(num_users, seed, start_date, end_date, visit_scale):
+    pool = userpool.UserPool(num_users, seed=seed)
+    return gen_funcs.generate_realistic_dataframe(start_date, end_date, pool, visit_scale=visit_scale, seed=(seed, 0))
+
 st.write("# Appendix: Data Generation")
 st.markdown(
     """
@@ -40,8 +57,11 @@ We have a list of users:
 
 param = 2
 num_users = 100000 # number of total registrants
-user_data = gen_funcs.create_user_dataset(num_users) # generates userid's for each user
-st.write(user_data.head())
+seed = 42
+user_data = load_users(num_users, seed) # generates userid's for each user
+# userids are compact integers internally; UUIDs are only formatted for the rows we display
+user_data_head = user_data.head()
+st.write(user_data_head.assign(userid=gen_funcs.decode_userids(user_data_head['userid'], user_data)))
 
 ##############################################################################################################
 
@@ -58,8 +78,9 @@ Each day, data is sampled from some statistical distribution and each row is ass
 
 start_date = datetime(2023, 1, 1)
 end_date = datetime(2023, 12, 31)
-data_df = gen_funcs.generate_main_dataframe(start_date, end_date, user_data,param=param) # creates random event data
-st.write(data_df.head(5))
+data_df = load_events(num_users, param, seed, start_date, end_date) # creates random event data
+data_df_head = data_df.head(5)
+st.write(data_df_head.assign(userid=gen_funcs.decode_userids(data_df_head['userid'], data_df)))
 
 st.markdown(
     """
@@ -91,8 +112,8 @@ param_mod = param*(1+(trueeffect/100))
 
 # https://docs.streamlit.io/library/api-reference/charts/st.pyplot
 # Add histogram data
-x1 = np.random.poisson(param, size=10000)
-x2 = np.random.poisson(param_mod, size=10000)
+x1 = rng.generator(seed, 'histogram', 'control').poisson(param, size=10000)
+x2 = rng.generator(seed, 'histogram', 'treatment').poisson(param_mod, size=10000)
 
 # Group data together
 hist_data = [x1, x2]
@@ -116,8 +137,8 @@ lambda_1 = 2
 lambda_2 = 2.1
 
 # Generate samples from two Poisson distributions
-samples_1 = np.random.poisson(param, size=(num_samples, sample_size))
-samples_2 = np.random.poisson(param_mod, size=(num_samples, sample_size))
+samples_1 = rng.generator(seed, 'sample means', 'control').poisson(param, size=(num_samples, sample_size))
+samples_2 = rng.generator(seed, 'sample means', 'treatment').poisson(param_mod, size=(num_samples, sample_size))
 
 # Calculate sample means
 sample_means_1 = np.mean(samples_1, axis=1)
@@ -132,3 +153,36 @@ ax.set_ylabel('Density')
 ax.set_title('Distribution of Sample Means')
 ax.legend()
 st.pyplot(fig)
+
+##############################################################################################################
+
+# Realistic Traffic
+
+##############################################################################################################
+st.write("### Realistic Traffic")
+st.markdown(
+    """
+The Run A Test page can also generate traffic from the registrants themselves instead of uniform random users.
+Each registrant has a visit probability and an action rate that depend on their age, gender and user type. On each day,
+every registrant visits with their own probability, multiplied by a day-of-week factor (weekdays are busier than weekends),
+and a visiting registrant's action count is Poisson with their own rate.
+
+In an experiment, the treatment multiplies the action rate of treated users by 1 + lift, where the lift can
+- fade over time (a novelty effect: users try the new feature, then return to their usual behavior), or
+- build up over time (a primacy effect: users first need to get used to the change), and
+- differ by segment (e.g. subscribers respond more strongly than registrants).
+
+Each day is drawn in one vectorized pass over all registrants, from that day's own random stream, so memory stays bounded by
+the number of registrants and any range of days (e.g. a chunk generated in another process) gives exactly the same events.
+"""
+)
+realistic_df = load_realistic_events(num_users, seed, start_date, end_date, 0.01)
+weekday_dau = realistic_df.groupby('date').size().groupby(lambda date: date.day_name()).mean()
+weekday_dau = weekday_dau.reindex(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+st.write('Average DAU by day of week (1% visit rate scale):')
+st.bar_chart(weekday_dau)
+
+novelty = st.slider('novelty effect (% extra lift on day 1)', min_value=-100, max_value=200, value=100)
+effect = activities.effect_curve(trueeffect/100, 28, novelty/100, half_life=7.0)
+st.write('Relative lift of the treatment by day of the test, for the true difference above:')
+st.line_chart(pd.DataFrame({'day': np.arange(1, 29), 'relative lift': effect}), x='day', y='relative lift')
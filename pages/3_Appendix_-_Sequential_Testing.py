@@ -5,6 +5,7 @@ import uuid
 from datetime import datetime, timedelta
 import helperfunctions.data_gen_funcs as gen_funcs
 import helperfunctions.statistical_tests as st_funcs
+import helperfunctions.simulation as sim_funcs
 from scipy import stats
 import matplotlib.pyplot as plt
 
@@ -81,7 +82,7 @@ We can check this rate by simulating a lot of A/A tests and seeing how often the
 On the other hand, the "power" can be easily checked by simulating A/B tests where there is a difference and seeing what percent of them
 are rejected.
 
-Feel free to check out my Simulation here: [Link](https://github.com/kideokkwon/experimentation-simulation-and-text-notes/blob/main/simulation/topic_03_sequential_testing.ipynb)
+You can run this simulation below, or check out my notebook version here: [Link](https://github.com/kideokkwon/experimentation-simulation-and-text-notes/blob/main/simulation/topic_03_sequential_testing.ipynb)
 
 For one with more detail and insights (but no replication code): ([Stewart, 2023](https://www.statsig.com/blog/sequential-testing-on-statsig))
 
@@ -91,13 +92,34 @@ it is more powerful to perform a regular fixed horizon test.
 """
 )
 
+##############################################################################################################
 
+# Simulate many A/A and A/B Tests to estimate the FPR and Power at each peek
 
+##############################################################################################################
 
+st.write("### Simulate the FPR and Power")
+st.markdown(
+    """
+Each replicate is a 14 day test like the one above, peeked at once a day. "Peeking" counts a test as positive if any peek
+so far was significant, "Single Look" only looks at that day.
+"""
+)
 
+num_replicates = st.slider('Number of simulated tests', min_value=100, max_value=5000, value=1000, step=100)
+sim_lift = st.slider('True effect for the power simulation (%)', min_value=1, max_value=20, value=10)
 
+if st.button('Run Simulation'):
+    progress_bar = st.progress(0.0)
 
+    def update_progress(done, total, offset=0):
+        progress_bar.progress((offset + done) / (2 * total))
 
+    fpr = sim_funcs.simulate_rejection_rates(num_replicates, days=14, rl=0, seed=0, progress=update_progress)
+    power = sim_funcs.simulate_rejection_rates(num_replicates, days=14, rl=sim_lift/100, seed=1,
+                                               progress=lambda done, total: update_progress(done, total, total))
 
-
-
+    st.write("#### False Positive Rate (A/A tests)")
+    st.line_chart(fpr)
+    st.write("#### Power (A/B tests)")
+    st.line_chart(power)
@@ -32,11 +32,11 @@ As it is with all A/B test platforms, the platform should allow for multiple met
 """
 )
 
-st.write("## Make Data More Realistic: Weekly Seasonality")
+st.write("## Make Data More Realistic")
 st.markdown(
     """
-Many engagement data follow weekly seasonality, and is one reason that A/B tests are recommended to run at least 7 days, even if
-the sample size calculator says you need less. To make this more clear, we can add weekly seasonality to our simulated user data
+Weekly seasonality, per-user propensities, novelty / primacy effects and segment-specific lifts are now available
+through the realistic traffic option (see the Data Generation appendix). Next up: holidays and longer-term trends.
 """
 )
 
@@ -0,0 +1,38 @@
+import pickle
+import uuid
+import numpy as np
+import pandas as pd
+from helperfunctions.assignment import Experiment, Layer
+
+IDS = np.arange(200000)
+
+def test_assignment_is_deterministic():
+    experiment = Experiment('checkout')
+    first = experiment.assign_bulk(IDS)
+    np.testing.assert_array_equal(first, Experiment('checkout').assign_bulk(IDS))
+    np.testing.assert_array_equal(first, pickle.loads(pickle.dumps(experiment)).assign_bulk(IDS))
+    assert [experiment.assign(i) for i in range(100)] == list(first[:100])
+    strings = np.array([str(uuid.UUID(int=i)) for i in range(1000)])
+    np.testing.assert_array_equal(experiment.assign_bulk(strings), Experiment('checkout').assign_bulk(strings))
+
+def test_split_matches_weights_and_traffic():
+    experiment = Experiment('banner', ['a', 'b', 'c'], weights=[0.5, 0.3, 0.2], traffic=0.4)
+    shares = pd.Series(experiment.assign_bulk(IDS)).value_counts(normalize=True, dropna=False)
+    np.testing.assert_allclose(shares[['a', 'b', 'c']], [0.2, 0.12, 0.08], atol=0.005)
+    assert abs(shares[None] - 0.6) < 0.005
+
+def test_salts_give_independent_allocations():
+    first = Experiment('x', salt=1).assign_codes(IDS)
+    second = Experiment('x', salt=2).assign_codes(IDS)
+    # independent 50/50 splits: every combination of variants holds about a quarter of the users
+    table = pd.crosstab(first, second, normalize=True)
+    np.testing.assert_allclose(table.to_numpy(), 0.25, atol=0.006)
+
+def test_layer_experiments_are_mutually_exclusive():
+    layer = Layer('homepage')
+    layer.add(Experiment('hero'), 0.3)
+    layer.add(Experiment('footer'), 0.5)
+    names, variants = layer.assign_bulk(IDS)
+    shares = pd.Series(names).value_counts(normalize=True, dropna=False)
+    np.testing.assert_allclose(shares[['hero', 'footer', None]], [0.3, 0.5, 0.2], atol=0.005)
+    assert (pd.isna(names) == pd.isna(variants)).all()
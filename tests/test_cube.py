@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from helperfunctions.cube import UserDayCube
+
+def events():
+    return pd.DataFrame({'userid': [3, 1, 3, 2, 1],
+                         'date': pd.to_datetime(['2023-01-01', '2023-01-02', '2023-01-09', '2023-01-20', '2023-01-20']),
+                         'action_count': [1, 2, 3, 4, 5]})
+
+def test_window_matches_groupby_at_any_stride():
+    data = events()
+    for stride in (None, 1, 3, 100):
+        cube = UserDayCube(data, stride=stride)
+        assert cube.value_checkpoints.dtype == np.int32 and cube.count_checkpoints.dtype == np.int32
+        totals = cube.user_totals(1, 19)
+        assert totals.to_dict() == {1: 2, 3: 3}
+
+def test_empty_frame():
+    cube = UserDayCube(events().iloc[:0])
+    assert cube.num_days == 0
+    assert len(cube.user_totals(0, 7)) == 0
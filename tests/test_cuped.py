@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import helperfunctions.cuped as cuped
+from helperfunctions.cube import UserDayCube
+
+def daily_events(rates, days, seed=0):
+    rng = np.random.default_rng(seed)
+    users = np.repeat(np.arange(len(rates)), days)
+    day = np.tile(np.arange(days), len(rates))
+    return pd.DataFrame({'userid': users, 'date': pd.Timestamp('2023-01-01') + pd.to_timedelta(day, 'D'),
+                         'action_count': rng.poisson(np.repeat(rates, days))})
+
+def test_variance_reduction_follows_persistent_user_rates():
+    rates = np.random.default_rng(1).gamma(2.0, 2.0, 2000)
+    assert cuped.variance_reduction(UserDayCube(daily_events(rates, 70)), 2) > 0.5
+    assert cuped.variance_reduction(UserDayCube(daily_events(np.full(2000, 4.0), 70)), 2) < 0.05
+
+def test_cumulative_user_totals_share_the_start_date():
+    data = daily_events(np.full(3, 1.0), 5)
+    late = data[data['date'] >= '2023-01-03']
+    days = list(cuped.cumulative_user_totals(late, start_date=pd.Timestamp('2023-01-01'), num_days=5))
+    assert [day for day, _, _ in days] == [1, 2, 3, 4, 5]
+    assert len(days[1][1]) == 0 and len(days[2][1]) == 3
+    np.testing.assert_array_equal(days[-1][2], late.groupby('userid')['action_count'].sum())
@@ -0,0 +1,15 @@
+from datetime import datetime
+import pandas as pd
+import helperfunctions.data_gen_funcs as gen_funcs
+import helperfunctions.userpool as userpool
+
+def test_parallel_generation_matches_serial():
+    pool = userpool.UserPool(3000, seed=1)
+    start, end = datetime(2023, 1, 1), datetime(2023, 3, 1)
+    kwargs = dict(days_per_chunk=14, seed=7, visit_scale=0.2)
+    serial = gen_funcs.generate_parallel(gen_funcs.generate_realistic_dataframe, start, end, pool, max_workers=1, **kwargs)
+    parallel = gen_funcs.generate_parallel(gen_funcs.generate_realistic_dataframe, start, end, pool, max_workers=2, **kwargs)
+    whole = gen_funcs.generate_realistic_dataframe(start, end, pool, seed=7, visit_scale=0.2)
+    assert len(serial) > 1000
+    pd.testing.assert_frame_equal(serial, parallel)
+    pd.testing.assert_frame_equal(serial, whole)
@@ -0,0 +1,51 @@
+from datetime import datetime
+import pandas as pd
+import helperfunctions.data_gen_funcs as gen_funcs
+from helperfunctions.event_store import EventStore
+
+def events():
+    users = gen_funcs.create_user_dataset(2000, seed=3)
+    return gen_funcs.generate_main_dataframe(datetime(2024, 1, 1), datetime(2024, 1, 10), users, min_per_day=50,
+                                             seed=3)
+
+def sort(data_df):
+    return data_df.sort_values(['date', 'userid']).reset_index(drop=True)
+
+def test_write_read_round_trip(tmp_path):
+    data = events()
+    store = EventStore(tmp_path / 'events')
+    store.write(data)
+    read = store.read()
+    assert read.attrs['uuid_key'] == data.attrs['uuid_key']
+    assert read.attrs['num_users'] == data.attrs['num_users']
+    assert (read['variant'] == 'all').all()
+    pd.testing.assert_frame_equal(sort(read[data.columns]), sort(data), check_dtype=False)
+    assert store.dates() == list(pd.date_range('2024-01-01', '2024-01-10'))
+
+def test_reads_only_matching_partitions(tmp_path):
+    data = events()
+    store = EventStore(tmp_path / 'events')
+    store.write(data[data['userid'] % 2 == 0], variant='control')
+    store.write(data[data['userid'] % 2 == 1], variant='treatment')
+    # 10 days x 2 variants on disk; 3 days of one variant are opened
+    expression = store.filter_expression('2024-01-03', '2024-01-06', 'treatment')
+    assert len(list(store.dataset().get_fragments())) == 20
+    assert len(list(store.dataset().get_fragments(filter=expression))) == 3
+
+    read = store.read('2024-01-03', '2024-01-06', variant='treatment', columns=['userid', 'action_count'])
+    expected = data[(data['userid'] % 2 == 1) & data['date'].between('2024-01-03', '2024-01-05')]
+    assert sorted(read.columns) == ['action_count', 'userid']
+    assert len(read) == len(expected)
+    assert read['action_count'].sum() == expected['action_count'].sum()
+
+    batches = pd.concat(store.iter_batches(variant=['control', 'treatment'], batch_size=100), ignore_index=True)
+    assert len(batches) == len(data)
+    assert batches.attrs['uuid_key'] == data.attrs['uuid_key']
+
+def test_rewrite_replaces_partitions(tmp_path):
+    data = events()
+    store = EventStore(tmp_path / 'events')
+    store.write(data)
+    store.write(data[data['date'] == '2024-01-02'].head(5))
+    assert len(store.read('2024-01-02', '2024-01-03')) == 5
+    assert len(store.read()) == len(data) - (data['date'] == '2024-01-02').sum() + 5
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+from helperfunctions.ingest import UserAggregates, ingest
+
+def events():
+    rng = np.random.default_rng(2)
+    n = 1000
+    data = pd.DataFrame({'userid': rng.integers(0, 120, n),
+                         'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 10, n), 'D'),
+                         'action_count': rng.poisson(2, n)})
+    data['variant'] = np.where(data['userid'] % 3 == 0, 'treatment', 'control')
+    return data
+
+def expected(data):
+    grouped = data.groupby(['variant', 'userid'])
+    return pd.DataFrame({'action_count': grouped['action_count'].sum(), 'events': grouped.size()})
+
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl', '.parquet'])
+def test_chunked_ingest_matches_groupby(tmp_path, extension):
+    data = events()
+    path = tmp_path / f'events{extension}'
+    if extension == '.csv':
+        data.to_csv(path, index=False)
+    elif extension == '.jsonl':
+        data.to_json(path, orient='records', lines=True, date_format='iso')
+    else:
+        data.to_parquet(path, index=False)
+    # 1000 events in chunks of 64: most users span several chunks
+    aggregates = ingest(path, chunksize=64)
+    assert aggregates.rows == len(data)
+    pd.testing.assert_frame_equal(aggregates.totals, expected(data), check_names=False)
+    assert aggregates.totals['action_count'].dtype.kind == 'i'
+
+def test_user_spanning_chunks_is_combined():
+    data = events()
+    user = data[data['userid'] == data['userid'].iloc[0]]
+    aggregates = UserAggregates(combine_rows=1)
+    for lo in range(0, len(user), 2):
+        aggregates.update(user.iloc[lo:lo + 2])
+    aggregates.update(data.iloc[:0])
+    totals = aggregates.totals
+    assert len(totals) == 1
+    assert totals['action_count'].iloc[0] == user['action_count'].sum()
+    assert totals['events'].iloc[0] == len(user)
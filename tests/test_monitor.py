@@ -0,0 +1,36 @@
+import asyncio
+import json
+import pandas as pd
+import pytest
+from helperfunctions.monitor import ExperimentMonitor, tail_source
+
+def batch(control, treatment):
+    return pd.DataFrame({'experiment': 'e', 'variant': ['control'] * len(control) + ['treatment'] * len(treatment),
+                         'action_count': control + treatment})
+
+def test_constant_feed_never_stops():
+    async def source():
+        for _ in range(3):
+            yield batch([2] * 50, [2] * 50)
+
+    monitor = ExperimentMonitor(refresh=0.01, min_samples=10, max_samples=20)
+    summary = asyncio.run(monitor.run(source()))
+    assert summary.loc['e', 'status'] == 'running'
+
+def test_source_error_is_raised_after_analysing_earlier_batches():
+    async def source():
+        yield batch([1, 2, 3] * 10, [2, 3, 4] * 10)
+        raise OSError("feed lost")
+
+    monitor = ExperimentMonitor(refresh=0.01, min_samples=10)
+    with pytest.raises(OSError, match="feed lost"):
+        asyncio.run(asyncio.wait_for(monitor.run(source()), 5))
+    assert monitor.experiments['e'].events == 60
+    assert monitor.decisions.qsize() >= 1
+
+def test_malformed_tailed_line_is_raised(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text(json.dumps({'experiment': 'e', 'variant': 'control', 'action_count': 1}) + '\n{not json\n')
+    monitor = ExperimentMonitor(refresh=0.01)
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(asyncio.wait_for(monitor.run(tail_source(path, poll_interval=0.01, idle_timeout=0.1)), 5))
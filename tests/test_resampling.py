@@ -0,0 +1,36 @@
+import numpy as np
+import helperfunctions.resampling as resampling
+
+def samples(lift, n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.poisson(2.0, n).astype(float), rng.poisson(2.0 * (1 + lift), n).astype(float)
+
+def test_p_values_are_never_zero():
+    x_c, x_t = samples(0.5)
+    boot = resampling.bootstrap(x_c, x_t, num_resamples=999, seed=1)
+    permutation = resampling.permutation_test(x_c, x_t, num_resamples=999, seed=1)
+    assert boot['p_value'] == 2 / 1000
+    assert permutation['p_value'] == 1 / 1000
+
+def test_bca_interval_is_finite_when_resamples_are_one_sided():
+    # a tiny, skewed sample: most resamples land on one side of the estimate
+    x_c, x_t = np.array([0.0, 0.0, 0.0, 1.0]), np.array([5.0, 5.0, 5.0, 6.0])
+    result = resampling.bootstrap(x_c, x_t, num_resamples=500, seed=2)
+    assert np.isfinite(result['ci_lower']) and np.isfinite(result['ci_upper'])
+    constant = resampling.bootstrap(np.ones(10), np.full(10, 2.0), num_resamples=200, seed=2)
+    assert constant['ci_lower'] == constant['ci_upper'] == 1.0
+
+def test_interval_matches_the_t_interval_and_seeds_reproduce():
+    x_c, x_t = samples(0.05, seed=3)
+    result = resampling.bootstrap(x_c, x_t, num_resamples=4000, seed=4, max_cells=20000)
+    se = np.sqrt(x_c.var(ddof=1) / len(x_c) + x_t.var(ddof=1) / len(x_t))
+    estimate = x_t.mean() - x_c.mean()
+    np.testing.assert_allclose([result['ci_lower'], result['ci_upper']], [estimate - 1.96 * se, estimate + 1.96 * se],
+                               atol=0.15 * se)
+    # chunks have their own streams, so the result does not depend on how many workers run them
+    assert result == resampling.bootstrap(x_c, x_t, num_resamples=4000, seed=4, max_cells=20000)
+    assert result == resampling.bootstrap(x_c, x_t, num_resamples=4000, seed=4, max_cells=20000, max_workers=2)
+
+def test_permutation_aa_is_not_significant():
+    x_c, x_t = samples(0.0, seed=5)
+    assert resampling.permutation_test(x_c, x_t, num_resamples=2000, seed=6)['p_value'] > 0.05
@@ -0,0 +1,9 @@
+from helperfunctions.simulation import simulate_rejection_rates
+
+def test_fixed_horizon_aa_false_positive_rate_is_alpha():
+    rates = simulate_rejection_rates(2000, days=3, num_users=100000, min_per_day=100, seed=11, chunk_size=200, max_workers=1)
+    single_look = rates['Fixed (single look)']
+    assert ((single_look > 0.03) & (single_look < 0.07)).all()
+    # peeking inflates the fixed test's false positives, mSPRT stays below alpha
+    assert rates['Fixed (peeking)'].iloc[-1] > single_look.iloc[-1]
+    assert (rates['mSPRT'] < 0.05).all()
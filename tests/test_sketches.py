@@ -0,0 +1,12 @@
+import numpy as np
+import helperfunctions.sketches as sketches
+
+def test_sketched_variance_within_its_standard_error():
+    rng = np.random.default_rng(7)
+    userids = rng.integers(0, 50000, 400000)
+    values = rng.poisson(2, len(userids))
+    summary = sketches.MetricSketch().add(userids, values).summary()
+    totals = np.bincount(userids, weights=values)[np.unique(userids)]
+    assert abs(summary['users'] - len(totals)) < 4 * summary['users'] * sketches.HyperLogLog().relative_error()
+    assert abs(summary['variance'] - totals.var(ddof=1)) < 4 * summary['variance_se']
+    assert summary['variance_se'] < 0.1 * totals.var(ddof=1)
@@ -0,0 +1,58 @@
+import numpy as np
+import helperfunctions.statistical_tests as st_funcs
+
+def test_msprt_peek_zero_variance_is_not_significant():
+    test = st_funcs.SequentialTest().update_stats(control=(5, 1.0, 0.0), treatment=(5, 1.0, 0.0))
+    significant, ci_l, ci_u, e = test.peek()
+    assert significant == 0
+    assert np.isnan(ci_l) and np.isnan(ci_u)
+
+def test_msprt_peek_without_data_is_not_significant():
+    significant, ci_l, ci_u, e = st_funcs.SequentialTest().peek()
+    assert significant == 0
+    assert np.isnan(ci_l) and np.isnan(ci_u)
+
+def test_check_zero_in_interval():
+    assert st_funcs.check_zero_in_interval(0.1, 0.3) == 1
+    assert st_funcs.check_zero_in_interval(-0.3, -0.1) == 1
+    assert st_funcs.check_zero_in_interval(-0.1, 0.1) == 0
+    assert st_funcs.check_zero_in_interval(np.nan, np.nan) == 0
+
+def test_group_sequential_boundaries_five_looks():
+    # published Lan-DeMets boundaries for K = 5 equally spaced looks, alpha = 0.05 two-sided
+    obf = st_funcs.group_sequential_boundaries(5, 0.05, 'obrien-fleming')
+    pocock = st_funcs.group_sequential_boundaries(5, 0.05, 'pocock')
+    np.testing.assert_allclose(obf, [4.877, 3.357, 2.680, 2.290, 2.031], atol=2e-3)
+    np.testing.assert_allclose(pocock, [2.438, 2.427, 2.410, 2.397, 2.386], atol=2e-3)
+
+def test_look_days_caps_looks_at_days():
+    np.testing.assert_array_equal(st_funcs.look_days(10, 5), [2, 4, 6, 8, 10])
+    np.testing.assert_array_equal(st_funcs.look_days(3, 5), [1, 2, 3])
+
+def test_per_user_tests_match_sufficient_stats():
+    import pandas as pd
+    import helperfunctions.metrics as metrics
+    rng = np.random.default_rng(3)
+    n = 4000
+    data = pd.DataFrame({'userid': rng.integers(0, 600, n),
+                         'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 14, n), 'D'),
+                         'action_count': rng.poisson(2, n)})
+    data['variant'] = np.where(data['userid'] % 2, 'treatment', 'control')
+    data.loc[data['variant'] == 'treatment', 'action_count'] += rng.poisson(0.3, (data['variant'] == 'treatment').sum())
+    control, treatment = data[data['variant'] == 'control'], data[data['variant'] == 'treatment']
+    stats = metrics.SufficientStats(data, pd.Timestamp('2024-01-01'))
+    np.testing.assert_allclose(st_funcs.user_msprt_ci(control, treatment), metrics.msprt_ci(stats, 'action_count'))
+    np.testing.assert_allclose(st_funcs.user_group_sequential_ci(control, treatment),
+                               metrics.group_sequential_ci(stats, 'action_count'))
+
+def test_batch_tests_missing_segments_only_count_in_all():
+    rng = np.random.default_rng(5)
+    values = rng.poisson(2, (2000, 2))
+    variant = rng.integers(0, 2, 2000)
+    segments = rng.choice(np.array(['web', 'app', None], dtype=object), 2000)
+    segments[:50] = np.nan
+    results = st_funcs.batch_tests(values, variant, segments).set_index(['segment', 'metric'])
+    overall = results.loc['All']
+    assert ((overall['n_c'] + overall['n_t']) == 2000).all()
+    segmented = results.drop(index='All', level='segment').xs(0, level='metric')
+    assert (segmented['n_c'] + segmented['n_t']).sum() == sum(label in ('web', 'app') for label in segments)